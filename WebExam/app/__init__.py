@@ -1,20 +1,39 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from flask import Flask
-from .extensions import db, migrate, login_manager
-from .models import Role, User
+from .extensions import cache, db, migrate, login_manager
+from . import jobs, search, seed, storage, tasks
+from .delivery import init_delivery
+from .fragment_cache import init_fragment_cache
+from .instrumentation import init_instrumentation
+from .metrics import init_metrics
+from .profiler import init_profiler
+from .images import ImageDecodeError, make_variants
+from .models import RATING_VALUES, Recipe, RecipeImage, RecipeImageVariant, Review, Role, User
+from .util import RENDERER_VERSION, render_markdown_many
 import click
 
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object("config.Config")
+    if test_config:
+        app.config.from_mapping(test_config)
 
     # Ensure upload folder exists
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    # First, so the profile also covers the other before_request/teardown hooks
+    init_profiler(app)
+    init_instrumentation(app)
+    init_metrics(app)
+    migrate.init_app(app, db, include_name=search.include_name)
     login_manager.init_app(app)
+    cache.init_app(app)
+    init_fragment_cache(app)
+    init_delivery(app)
+    storage.init_storage(app)
 
     login_manager.login_view = "auth.login"
     login_manager.login_message = "Для выполнения данного действия необходимо пройти процедуру аутентификации"
@@ -69,4 +88,173 @@ def create_app():
             db.session.commit()
             print(f"User '{username}' created with role '{role}'")
 
+    @app.cli.command("render-markdown")
+    @click.option("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    @click.option("--batch-size", type=int, default=500)
+    @click.option("--force", is_flag=True, help="Re-render every row, not only stale ones")
+    def render_markdown(workers, batch_size, force):
+        """Re-render stored Markdown HTML after ALLOWED_TAGS/extensions change."""
+        with app.app_context(), ProcessPoolExecutor(max_workers=workers) as pool:
+            for model in (Recipe, Review):
+                md_columns = [getattr(model, f"{name}_md") for name in model.markdown_fields]
+                query = db.select(model.id, *md_columns).order_by(model.id).limit(batch_size)
+                if not force:
+                    query = query.where(model.stale_html_filter())
+                last_id, total = 0, 0
+                while True:
+                    rows = db.session.execute(query.where(model.id > last_id)).all()
+                    if not rows:
+                        break
+                    rendered = pool.map(render_markdown_many, [row[1:] for row in rows], chunksize=16)
+                    db.session.execute(
+                        db.update(model),
+                        [
+                            {
+                                "id": row.id,
+                                "html_version": RENDERER_VERSION,
+                                **{f"{name}_html": html for name, html in zip(model.markdown_fields, htmls)},
+                            }
+                            for row, htmls in zip(rows, rendered)
+                        ],
+                    )
+                    db.session.commit()
+                    last_id = rows[-1].id
+                    total += len(rows)
+                print(f"{model.__tablename__}: {total} rows rendered (version {RENDERER_VERSION})")
+
+    @app.cli.command("reconcile-reviews")
+    def reconcile_reviews():
+        """Rebuild recipe review aggregates (count, sum, histogram) from the reviews table."""
+        with app.app_context():
+            totals = (
+                db.select(
+                    Review.recipe_id,
+                    db.func.count(Review.id).label("reviews_count"),
+                    db.func.sum(Review.rating).label("rating_sum"),
+                    *(
+                        db.func.sum(db.case((Review.rating == stars, 1), else_=0)).label(f"rating_count_{stars}")
+                        for stars in RATING_VALUES
+                    ),
+                )
+                .group_by(Review.recipe_id)
+                .subquery()
+            )
+            aggregate_columns = ["reviews_count", "rating_sum"] + [f"rating_count_{s}" for s in RATING_VALUES]
+            updated = db.session.execute(
+                db.update(Recipe)
+                .where(Recipe.id == totals.c.recipe_id)
+                .values({name: totals.c[name] for name in aggregate_columns})
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            has_reviews = db.select(Review.id).where(Review.recipe_id == Recipe.id).exists()
+            reset = db.session.execute(
+                db.update(Recipe)
+                .where(~has_reviews, Recipe.reviews_count != 0)
+                .values({name: 0 for name in aggregate_columns})
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            print(f"Review aggregates rebuilt for {updated + reset} recipes")
+
+    @app.cli.command("reindex-recipes")
+    def reindex_recipes():
+        """Rebuild the recipe full-text search index from the recipes table."""
+        with app.app_context():
+            with db.engine.begin() as connection:
+                search.rebuild(connection)
+            print("Recipe search index rebuilt")
+
+    @app.cli.command("make-thumbnails")
+    @click.option("--force", is_flag=True, help="Regenerate variants that already exist")
+    def make_thumbnails(force):
+        """Create the srcset variants for uploads that predate them (or after IMAGE_VARIANT_WIDTHS changes)."""
+        with app.app_context():
+            query = db.select(RecipeImage).order_by(RecipeImage.id)
+            if not force:
+                query = query.where(~RecipeImage.variants.any())
+            recipe_ids, released, failed, legacy = set(), [], 0, 0
+            for image in db.session.scalars(query).all():
+                if not storage.BLOB_KEY_RE.match(image.filename):
+                    legacy += 1
+                    continue
+                old_keys = [v.filename for v in image.variants if storage.BLOB_KEY_RE.match(v.filename)]
+                try:
+                    with storage.get_storage().open(image.filename) as source:
+                        image.variants = make_variants(source, app.config["IMAGE_VARIANT_WIDTHS"])
+                except ImageDecodeError:
+                    failed += 1
+                    continue
+                storage.release(old_keys)
+                released += old_keys
+                recipe_ids.add(image.recipe_id)
+            tasks.touch_recipes(recipe_ids)
+            storage.delete_unreferenced(released)
+            print(f"Variants created for images of {len(recipe_ids)} recipes ({failed} could not be decoded)")
+            if legacy:
+                print(f"{legacy} images use the old flat layout; run 'flask migrate-uploads' first")
+
+    @app.cli.command("migrate-uploads")
+    def migrate_uploads():
+        """Move uploads stored under their old flat names into content-addressed storage."""
+        with app.app_context():
+            rows = db.session.scalars(db.select(RecipeImage)).all()
+            rows += db.session.scalars(db.select(RecipeImageVariant)).all()
+            recipe_ids, moved = set(), []
+            for row in rows:
+                path = os.path.join(app.config["UPLOAD_FOLDER"], row.filename)
+                if storage.BLOB_KEY_RE.match(row.filename) or not os.path.isfile(path):
+                    continue
+                with open(path, "rb") as f:
+                    row.filename = storage.store(f, os.path.splitext(row.filename)[1].lower())
+                moved.append(path)
+                recipe_ids.add(row.recipe_id if isinstance(row, RecipeImage) else row.image.recipe_id)
+            tasks.touch_recipes(recipe_ids)
+            for path in moved:
+                os.remove(path)
+            print(f"{len(moved)} files moved into storage")
+
+    @app.cli.command("worker")
+    @click.option("--threads", type=int, default=2, help="Jobs run at once in each process")
+    @click.option("--processes", type=int, default=1, help="Worker processes (for CPU-bound tasks)")
+    @click.option("--once", is_flag=True, help="Exit when no job is due instead of waiting for more")
+    @click.option("--retry-failed", is_flag=True, help="Queue failed jobs again before starting")
+    def worker(threads, processes, once, retry_failed):
+        """Run background jobs (image variants, file cleanup) until interrupted."""
+        if retry_failed:
+            with app.app_context():
+                print(f"{jobs.retry_failed()} failed jobs queued again")
+        jobs.work_processes(app, processes, threads, once)
+
+    @app.cli.command("clear-cache")
+    def clear_cache():
+        """Drop every cached entry in all workers (L1 and the shared L2)."""
+        with app.app_context():
+            cache.clear()
+            print("Cache cleared")
+
+    @app.cli.command("seed")
+    @click.option("--users", type=click.IntRange(min=0), default=100_000)
+    @click.option("--recipes", type=click.IntRange(min=0), default=50_000)
+    @click.option("--reviews", type=click.IntRange(min=0), default=5_000_000, help="Approximate total")
+    @click.option("--images", type=click.IntRange(min=0), default=20_000)
+    @click.option("--seed", "random_seed", type=int, default=0, help="Same seed, same data")
+    @click.option("--batch-size", type=click.IntRange(min=1), default=10_000, help="Rows per INSERT and commit")
+    @click.option("--password", default="password", help="Password of every generated user")
+    def seed_command(users, recipes, reviews, images, random_seed, batch_size, password):
+        """Fill the database with generated users, recipes, reviews and images for load testing."""
+        if recipes and not users:
+            raise click.UsageError("Recipes need authors: pass --users greater than 0")
+        with app.app_context():
+            seed.seed(
+                users=users,
+                recipes=recipes,
+                reviews=reviews,
+                images=images,
+                seed=random_seed,
+                batch_size=batch_size,
+                password=password,
+            )
+            cache.clear()
+            print("Done")
+
     return app
@@ -0,0 +1,379 @@
+"""Two-level cache shared by all workers.
+
+L1 is an in-process LRU with TTL; L2 is an SQLite file every gunicorn worker
+opens. Tag versions live in L2 as well, so invalidating a tag in one worker is
+seen by the L1 of every other worker on its next lookup.
+"""
+import functools
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from blinker import Namespace
+from flask import Flask, current_app, has_app_context
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+# Implicit tag on every entry; bumping it drops the whole cache in all workers
+ALL_TAG = "*"
+
+# Miss marker; None is a valid cached value
+MISSING = object()
+
+# Sent by TieredCache on every lookup with result="l1", "l2" or "miss" (see app/metrics.py)
+cache_lookup = Namespace().signal("cache-lookup")
+
+# (tag versions, expires at, value)
+Entry = Tuple[Tuple[int, ...], Optional[float], Any]
+
+
+class NullBackend:
+    """Stores nothing: caching disabled."""
+
+    def get(self, key: str) -> Optional[Entry]:
+        return None
+
+    def set(self, key: str, entry: Entry, expires: Optional[float]) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def tag_versions(self, tags: Sequence[str]) -> Tuple[int, ...]:
+        return tuple(0 for _ in tags)
+
+    def bump_tags(self, tags: Sequence[str]) -> None:
+        pass
+
+
+class MemoryBackend:
+    """L1: per-process LRU with TTL, bounded by entry count and optionally by total size."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        self._tags: Dict[str, int] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(entry: Entry) -> int:
+        # Only str/bytes values (HTML fragments, compressed pages) count towards max_bytes
+        value = entry[2]
+        return len(value) if isinstance(value, (str, bytes)) else 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= self._sizeof(entry)
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Entry, expires: Optional[float]) -> None:
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = entry
+            self._size += self._sizeof(entry)
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._size > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def tag_versions(self, tags: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._tags.get(tag, 0) for tag in tags)
+
+    def bump_tags(self, tags: Sequence[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """L2: entries and tag versions in an SQLite file shared by all workers."""
+
+    # Purge expired rows every N writes
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection inherited through fork (gunicorn --preload) must not be reused
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get(self, key: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key: str, entry: Entry, expires: Optional[float]) -> None:
+        value = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)", (key, value, expires)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute("DELETE FROM cache_entries WHERE expires <= ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM cache_entries")
+
+    def tag_versions(self, tags: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT tag, version FROM cache_tags WHERE tag IN ({', '.join('?' * len(tags))})", tuple(tags)
+            ).fetchall()
+        versions = dict(rows)
+        return tuple(versions.get(tag, 0) for tag in tags)
+
+    def bump_tags(self, tags: Sequence[str]) -> None:
+        with self._lock:
+            self._connect().executemany(
+                "INSERT INTO cache_tags (tag, version) VALUES (?, 1) ON CONFLICT (tag) DO UPDATE SET version = version + 1",
+                [(tag,) for tag in tags],
+            )
+
+
+class TieredCache:
+    """L1 in front of an optional shared L2, with hit/miss counters.
+
+    Tag versions are read before computing a value, so an invalidation that
+    lands while the value is being computed leaves the stored entry stale.
+    """
+
+    def __init__(self, l1, l2=None, default_ttl: int = 300, name: str = "data"):
+        self.l1 = l1
+        self.l2 = l2
+        self.default_ttl = default_ttl
+        self.name = name
+        self._counters = dict.fromkeys(("l1_hits", "l2_hits", "misses", "invalidations"), 0)
+        self._counters_lock = threading.Lock()
+
+    @property
+    def _tag_store(self):
+        return self.l2 if self.l2 is not None else self.l1
+
+    def _count(self, name: str) -> None:
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def lookup(self, key: str, tags: Iterable[str] = ()) -> Tuple[Any, Tuple[int, ...]]:
+        """Returns (value or MISSING, tag versions); pass the versions to store() on a miss."""
+        tags = (ALL_TAG, *sorted(set(tags)))
+        versions = self._tag_store.tag_versions(tags)
+
+        entry = self.l1.get(key)
+        if entry is not None and entry[0] == versions:
+            self._count("l1_hits")
+            cache_lookup.send(self, result="l1")
+            return entry[2], versions
+
+        if self.l2 is not None:
+            entry = self.l2.get(key)
+            if entry is not None and entry[0] == versions:
+                self.l1.set(key, entry, entry[1])
+                self._count("l2_hits")
+                cache_lookup.send(self, result="l2")
+                return entry[2], versions
+
+        self._count("misses")
+        cache_lookup.send(self, result="miss")
+        return MISSING, versions
+
+    def store(self, key: str, value: Any, versions: Tuple[int, ...], ttl: Optional[int] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        entry = (versions, time.time() + ttl if ttl else None, value)
+        self.l1.set(key, entry, entry[1])
+        if self.l2 is not None:
+            self.l2.set(key, entry, entry[1])
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: Optional[int] = None, tags: Iterable[str] = ()) -> Any:
+        value, versions = self.lookup(key, tags)
+        if value is MISSING:
+            value = compute()
+            self.store(key, value, versions, ttl)
+        return value
+
+    def delete(self, key: str) -> None:
+        self.l1.delete(key)
+        if self.l2 is not None:
+            self.l2.delete(key)
+
+    def invalidate(self, *tags: str) -> None:
+        if tags:
+            self._tag_store.bump_tags(sorted(set(tags)))
+            self._count("invalidations")
+
+    def clear(self) -> None:
+        self.invalidate(ALL_TAG)
+        self.l1.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+
+
+def create_backend(config) -> TieredCache:
+    """CACHE_TYPE: "null", "simple" (L1 only), "sqlite" (L1 + L2) or an import path to a factory(config)."""
+    cache_type = config.get("CACHE_TYPE", "simple")
+    default_ttl = config.get("CACHE_DEFAULT_TTL", 300)
+    if cache_type == "null":
+        return TieredCache(NullBackend(), default_ttl=default_ttl)
+    l1 = MemoryBackend(config.get("CACHE_L1_MAX_ENTRIES", 1024))
+    if cache_type == "simple":
+        return TieredCache(l1, default_ttl=default_ttl)
+    if cache_type == "sqlite":
+        return TieredCache(l1, SQLiteBackend(config["CACHE_SQLITE_PATH"]), default_ttl=default_ttl)
+    return import_string(cache_type)(config)
+
+
+def _current_backend() -> Optional[TieredCache]:
+    return current_app.extensions.get("cache") if has_app_context() else None
+
+
+class Cache:
+    """Flask extension giving access to the current app's cache."""
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["cache"] = create_backend(app.config)
+
+    @property
+    def backend(self) -> Optional[TieredCache]:
+        return _current_backend()
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: Optional[int] = None, tags: Iterable[str] = ()) -> Any:
+        backend = _current_backend()
+        if backend is None:
+            return compute()
+        return backend.get_or_set(key, compute, ttl=ttl, tags=tags)
+
+    def invalidate(self, *tags: str) -> None:
+        backend = _current_backend()
+        if backend is not None:
+            backend.invalidate(*tags)
+
+    def clear(self) -> None:
+        backend = _current_backend()
+        if backend is not None:
+            backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        backend = _current_backend()
+        return backend.stats() if backend is not None else {}
+
+    def cached(self, ttl: Optional[int] = None, tags: Sequence[str] = ()):
+        """Decorator for functions and methods; self/cls are left out of the key.
+
+        Tags may reference arguments: tags=("recipe:{recipe_id}",).
+        """
+
+        def decorator(func):
+            signature = inspect.signature(func)
+            skip = {name for name in list(signature.parameters)[:1] if name in ("self", "cls")}
+            prefix = f"{func.__module__}.{func.__qualname__}"
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = {name: value for name, value in bound.arguments.items() if name not in skip}
+                return self.get_or_set(
+                    f"{prefix}:{arguments!r}",
+                    lambda: func(*args, **kwargs),
+                    ttl=ttl,
+                    tags=[tag.format(**arguments) for tag in tags],
+                )
+
+            wrapper.uncached = func
+            return wrapper
+
+        return decorator
+
+
+def _table_tags(mappers) -> set:
+    return {mapper.local_table.name for mapper in mappers if mapper.local_table is not None}
+
+
+# Writes invalidate the tag named after each changed table. Tags are collected
+# on flush and on bulk UPDATE/DELETE, and only bumped once the commit succeeds.
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tags(session, flush_context) -> None:
+    changed = chain(session.new, session.deleted, (obj for obj in session.dirty if session.is_modified(obj)))
+    session.info.setdefault("cache_tags", set()).update(_table_tags(sa_inspect(obj).mapper for obj in changed))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_tags(orm_execute_state) -> None:
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        orm_execute_state.session.info.setdefault("cache_tags", set()).update(
+            _table_tags([orm_execute_state.bind_mapper])
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_tags(session) -> None:
+    tags = session.info.pop("cache_tags", None)
+    backend = _current_backend()
+    if tags and backend is not None:
+        backend.invalidate(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tags(session) -> None:
+    session.info.pop("cache_tags", None)
@@ -0,0 +1,71 @@
+"""Conditional GET: answer 304 before the view runs and the template renders."""
+import functools
+import hashlib
+from datetime import datetime
+from typing import Callable, Optional, Sequence
+
+from flask import current_app, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+def _release(app) -> str:
+    """The deployed version for the ETag: RELEASE, or else a fingerprint of the template sources.
+
+    Without it, browsers would get 304 for the old page after a deploy that changes templates.
+    """
+    release = app.config.get("RELEASE")
+    if release:
+        return release
+    version = app.extensions.get("templates_version")
+    if version is None:
+        digest = hashlib.sha1()
+        for name in sorted(app.jinja_env.list_templates()):
+            source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            digest.update(f"{name}\0{source}\0".encode())
+        version = app.extensions["templates_version"] = digest.hexdigest()[:12]
+    return version
+
+
+def conditional(validators: Callable[..., Optional[Sequence[Optional[datetime]]]]):
+    """`validators(**view_args)` returns the row versions (UTC datetimes) a page is built from.
+
+    None means the view decides (e.g. 404). The weak ETag includes the deployed
+    version and the user, since logged-in visitors see a different page;
+    Last-Modified cannot tell users apart, so it is only sent to anonymous visitors.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return view(**view_args)
+            versions = validators(**view_args)
+            if versions is None:
+                return view(**view_args)
+
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            etag = hashlib.sha1(repr((_release(current_app), user_id, *versions)).encode()).hexdigest()[:20]
+            last_modified = None
+            if user_id is None:
+                last_modified = max(v for v in versions if v is not None).replace(microsecond=0)
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # The page can change at any time: browsers revalidate on every view
+            response.cache_control.no_cache = True
+            if user_id is not None:
+                response.cache_control.private = True
+            response.vary.add("Cookie")
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,42 @@
+"""Who sends file bytes: the app or the proxy in front of it.
+
+FILE_DELIVERY = "direct" streams from the worker (sendfile via wsgi.file_wrapper,
+with Range support); "x-accel" answers with an X-Accel-Redirect header for nginx
+(see deploy/nginx.conf); "x-sendfile" with X-Sendfile for Apache/lighttpd. With
+either header the worker is free as soon as the headers are sent.
+"""
+import mimetypes
+import os
+from typing import Optional
+
+from flask import Response, abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+
+DELIVERY_MODES = ("direct", "x-accel", "x-sendfile")
+
+
+def init_delivery(app) -> None:
+    mode = app.config.setdefault("FILE_DELIVERY", "direct")
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f"FILE_DELIVERY must be one of {DELIVERY_MODES}, not {mode!r}")
+    if mode == "x-sendfile":
+        # Flask adds X-Sendfile in every send_file/send_from_directory itself
+        app.config["USE_X_SENDFILE"] = True
+
+
+def send_stored_file(
+    location: str, directory: str, filename: str, mimetype: Optional[str] = None, max_age: Optional[int] = None
+) -> Response:
+    """Send `filename` from `directory`; `location` names its internal nginx prefix in X_ACCEL_LOCATIONS."""
+    if current_app.config["FILE_DELIVERY"] != "x-accel":
+        return send_from_directory(directory, filename, mimetype=mimetype, max_age=max_age)
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = current_app.response_class(
+        mimetype=mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    response.headers["X-Accel-Redirect"] = current_app.config["X_ACCEL_LOCATIONS"][location] + filename
+    if max_age is not None:
+        response.cache_control.max_age = max_age
+    return response
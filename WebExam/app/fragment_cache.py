@@ -0,0 +1,75 @@
+"""`{% cache key[, ttl] %}...{% endcache %}` for HTML fragments shared by all users.
+
+Keys built from ORM objects include a fingerprint of the row's column values,
+so an edited row simply maps to a new key and never needs an explicit purge.
+"""
+import hashlib
+from typing import Any, Optional
+
+from flask import Flask, current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import InstanceState
+
+from .cache import MISSING, MemoryBackend, TieredCache
+
+
+def row_version(obj: Any) -> str:
+    """Table, primary key and a hash of the row's loaded column values."""
+    state = sa_inspect(obj)
+    columns = state.mapper.column_attrs.keys()
+    expired = state.expired_attributes.intersection(columns)
+    if expired:
+        # Expired after a commit: one attribute access reloads the row
+        getattr(obj, next(iter(expired)))
+    values = sorted((name, value) for name, value in state.dict.items() if name in columns)
+    digest = hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+    return f"{state.mapper.local_table.name}:{state.identity}:{digest}"
+
+
+def fragment_key(key: Any) -> str:
+    """Key from a string, an ORM object or a list/tuple of them."""
+    if isinstance(key, (list, tuple)):
+        return "|".join(fragment_key(part) for part in key)
+    if isinstance(sa_inspect(key, raiseerr=False), InstanceState):
+        return row_version(key)
+    return str(key)
+
+
+class FragmentCacheExtension(Extension):
+    """Caches the rendered block under e.g. ("review-card", rv, rv.user) for `ttl` seconds."""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if("comma") else nodes.Const(None)
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        # Template name and line keep equal keys from different blocks apart
+        location = nodes.Const(f"{parser.name}:{lineno}")
+        return nodes.CallBlock(self.call_method("_render", [location, key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, location: str, key: Any, ttl: Optional[int], caller) -> str:
+        store = current_app.extensions.get("fragment_cache")
+        if store is None:
+            return caller()
+        cache_key = f"fragment:{location}:{fragment_key(key)}"
+        html, versions = store.lookup(cache_key)
+        if html is MISSING:
+            html = caller()
+            store.store(cache_key, html, versions, ttl)
+        return html
+
+
+def init_fragment_cache(app: Flask) -> None:
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    # Row versions are part of the key, so a size-bounded L1 without tags is enough
+    max_bytes = app.config.get("FRAGMENT_CACHE_MAX_BYTES", 8 * 1024 * 1024)
+    if max_bytes:
+        app.extensions["fragment_cache"] = TieredCache(
+            MemoryBackend(max_entries=100_000, max_bytes=max_bytes),
+            default_ttl=app.config.get("FRAGMENT_CACHE_TTL", 3600),
+            name="fragments",
+        )
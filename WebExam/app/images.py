@@ -0,0 +1,76 @@
+"""Responsive variants of recipe uploads.
+
+An upload is decoded once and written out in a few fixed widths as WebP and
+JPEG. Pillow only keeps EXIF when it is passed to save(), so the variants
+carry no camera or GPS metadata; the orientation tag is applied to the pixels
+first so portrait photos do not end up sideways.
+"""
+import io
+from typing import BinaryIO, Iterable, List
+
+from PIL import ExifTags, Image, ImageOps
+
+from . import storage
+from .models import RecipeImageVariant
+
+# (mime type, extension, save options); browsers without WebP get the JPEG
+VARIANT_FORMATS = (
+    ("image/webp", "webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    ("image/jpeg", "jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+)
+# EXIF orientations that swap width and height
+_ROTATED = {5, 6, 7, 8}
+
+
+class ImageDecodeError(Exception):
+    """The upload is not an image Pillow can decode."""
+
+
+def _decode(source: BinaryIO, max_width: int) -> Image.Image:
+    with Image.open(source) as image:
+        rotated = image.getexif().get(ExifTags.Base.Orientation) in _ROTATED
+        width = image.height if rotated else image.width
+        if width > max_width:
+            # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            scale = max_width / width
+            image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+        upright = ImageOps.exif_transpose(image)
+        has_alpha = upright.mode in ("RGBA", "LA") or (upright.mode == "P" and "transparency" in upright.info)
+        return upright.convert("RGBA" if has_alpha else "RGB")
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    if image.mode != "RGBA":
+        return image
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def make_variants(source: BinaryIO, widths: Iterable[int]) -> List[RecipeImageVariant]:
+    """Store the variants of the image in `source` and return them (not yet added to the session).
+
+    Widths above the original's are capped to it, so a small upload yields a
+    single variant at its own size. Each variant is a blob of its own, with
+    a reference taken in the current transaction.
+    """
+    widths = sorted(set(widths), reverse=True)
+    try:
+        image = _decode(source, widths[0])
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ImageDecodeError() from exc
+
+    variants: List[RecipeImageVariant] = []
+    resized = image
+    for width in sorted({min(w, image.width) for w in widths}, reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        # Each step downscales the previous (larger) result rather than the full image
+        if resized.size != (width, height):
+            resized = resized.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        for mime_type, extension, options in VARIANT_FORMATS:
+            output = io.BytesIO()
+            (resized if options["format"] == "WEBP" else _flatten(resized)).save(output, **options)
+            output.seek(0)
+            key = storage.store(output, f".{extension}")
+            variants.append(RecipeImageVariant(filename=key, mime_type=mime_type, width=width, height=height))
+    return variants
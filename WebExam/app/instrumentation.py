@@ -0,0 +1,157 @@
+"""Per-request measurements: SQL query count and time, template and Markdown time.
+
+They are sent back in a Server-Timing header (shown by the browser's network
+panel) instead of echoing every statement to stdout; statements slower than
+SLOW_QUERY_MS are logged, sampled by SLOW_QUERY_SAMPLE_RATE, with their
+parameters and query plan.
+"""
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response, before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+from .extensions import db
+
+# Server-Timing metrics in output order: name -> description (header values must be ASCII)
+METRICS = {
+    "db": "SQL",
+    "tpl": "Templates",
+    "md": "Markdown and bleach",
+}
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations: Dict[str, float] = defaultdict(float)
+        # (statement, parameters, seconds) of the sampled slow statements
+        self.slow_queries: List[Tuple[str, object, float]] = []
+        self._templates: List[float] = []
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.durations["db"] * 1000:.1f};desc="SQL ({self.queries} queries)"']
+        parts += [
+            f'{name};dur={self.durations[name] * 1000:.1f};desc="{desc}"'
+            for name, desc in METRICS.items()
+            if name != "db" and name in self.durations
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return g.get("request_stats") if has_request_context() else None
+
+
+@contextmanager
+def timed(metric: str):
+    """Add the time spent in the block (or decorated function) to a metric of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.durations[metric] += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.durations["db"] += elapsed
+    config = current_app.config
+    if (
+        not executemany
+        and elapsed * 1000 >= config["SLOW_QUERY_MS"]
+        and random.random() < config["SLOW_QUERY_SAMPLE_RATE"]
+    ):
+        stats.slow_queries.append((statement, parameters, elapsed))
+
+
+def _handle_error(exception_context) -> None:
+    # after_cursor_execute is not called for a failed statement
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def _template_started(app, template, context) -> None:
+    stats = current_stats()
+    if stats is not None:
+        stats._templates.append(time.perf_counter())
+
+
+def _template_rendered(app, template, context) -> None:
+    stats = current_stats()
+    if stats is not None and stats._templates:
+        stats.durations["tpl"] += time.perf_counter() - stats._templates.pop()
+
+
+def query_plan(statement: str, parameters) -> Optional[str]:
+    """EXPLAIN the statement on a separate connection; None for non-queries or if it fails."""
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    explain = "EXPLAIN QUERY PLAN" if db.engine.dialect.name == "sqlite" else "EXPLAIN"
+    try:
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(f"{explain} {statement}", parameters).all()
+    except SQLAlchemyError:
+        return None
+    return "\n".join(" | ".join(str(value) for value in row) for row in rows)
+
+
+def _start_request() -> None:
+    g.request_stats = RequestStats()
+
+
+def _add_server_timing(response: Response) -> Response:
+    stats = current_stats()
+    if stats is not None and current_app.config["SERVER_TIMING"]:
+        response.headers["Server-Timing"] = stats.server_timing()
+    return response
+
+
+def _log_slow_queries(exc) -> None:
+    # Detach the stats first so the EXPLAIN statements are not counted into them
+    stats = g.pop("request_stats", None)
+    if stats is None:
+        return
+    for statement, parameters, elapsed in stats.slow_queries:
+        current_app.logger.warning(
+            "Slow query (%.1f ms) in %s %s:\n%s\nParameters: %r\nPlan:\n%s",
+            elapsed * 1000,
+            request.method,
+            request.path,
+            statement,
+            parameters,
+            query_plan(statement, parameters) or "unavailable",
+        )
+
+
+def init_instrumentation(app: Flask) -> None:
+    app.config.setdefault("SERVER_TIMING", True)
+    app.config.setdefault("SLOW_QUERY_MS", 100)
+    app.config.setdefault("SLOW_QUERY_SAMPLE_RATE", 1.0)
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
+    app.before_request(_start_request)
+    app.after_request(_add_server_timing)
+    app.teardown_request(_log_slow_queries)
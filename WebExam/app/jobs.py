@@ -0,0 +1,191 @@
+"""Durable background jobs.
+
+A route enqueues a job into the `jobs` table of the app database in the same
+transaction as the rows it concerns, so the job exists exactly when that
+commit does and survives restarts. `flask worker` claims due jobs under a
+lease, runs them in a pool of threads (and optionally processes) and deletes
+each one once it succeeds; a failure is retried with exponential backoff up
+to the task's max_attempts, after which the job stays as "failed".
+
+A job whose worker dies is claimed again when its lease runs out, so it may
+run more than once: tasks must be idempotent.
+"""
+import multiprocessing
+import random
+import signal
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from flask import Flask, current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .extensions import db
+from .models import Job
+
+TASKS: Dict[str, Callable] = {}
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING, used for idempotency keys
+_INSERT_IGNORING_CONFLICTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+MAX_RETRY_DELAY = 60 * 60
+
+
+def task(func: Optional[Callable] = None, *, max_attempts: int = 5):
+    """Register a function as a background task under its name."""
+
+    def register(f: Callable) -> Callable:
+        f.max_attempts = max_attempts
+        TASKS[f.__name__] = f
+        return f
+
+    return register(func) if func is not None else register
+
+
+def enqueue(func: Callable, *args, key: Optional[str] = None, delay: float = 0) -> None:
+    """Queue func(*args) as part of the caller's transaction; args must be JSON-serialisable.
+
+    With `key`, nothing is queued while a job with the same key is pending or failed.
+    """
+    if TASKS.get(func.__name__) is not func:
+        raise ValueError(f"{func.__name__} is not a registered task")
+    now = datetime.utcnow()
+    values = dict(
+        name=func.__name__,
+        args=list(args),
+        key=key,
+        state="queued",
+        attempts=0,
+        max_attempts=func.max_attempts,
+        run_at=now + timedelta(seconds=delay),
+        created_at=now,
+    )
+    insert = _INSERT_IGNORING_CONFLICTS.get(db.session.get_bind().dialect.name)
+    if key is not None and insert is not None:
+        db.session.execute(insert(Job).values(values).on_conflict_do_nothing(index_elements=["key"]))
+    else:
+        db.session.execute(db.insert(Job).values(values))
+
+
+def _due(now: datetime):
+    return Job.state == "queued", Job.run_at <= now, db.or_(Job.locked_until.is_(None), Job.locked_until <= now)
+
+
+def claim():
+    """Lease the next due job and commit; returns (id, name, args, attempts, max_attempts) or None."""
+    now = datetime.utcnow()
+    next_id = db.select(Job.id).where(*_due(now)).order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+    # One UPDATE both picks and leases the job, so two workers never get the same one
+    job = db.session.execute(
+        db.update(Job)
+        .where(Job.id == next_id, *_due(now))
+        .values(
+            locked_until=now + timedelta(seconds=current_app.config["JOB_LEASE_SECONDS"]),
+            attempts=Job.attempts + 1,
+        )
+        .returning(Job.id, Job.name, Job.args, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).first()
+    db.session.commit()
+    return job
+
+
+def retry_delay(attempts: int) -> timedelta:
+    # Jitter spreads out the retries of jobs that failed together (e.g. while storage was down)
+    delay = min(current_app.config["JOB_RETRY_DELAY"] * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def run_next() -> bool:
+    """Run one due job; False if there was none."""
+    job = claim()
+    if job is None:
+        return False
+    try:
+        func = TASKS.get(job.name)
+        if func is None:
+            raise LookupError(f"unknown task {job.name!r}")
+        func(*job.args)
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            current_app.logger.error("Job %s (%s) failed for good:\n%s", job.id, job.name, error)
+            values = dict(state="failed", locked_until=None, last_error=error)
+        else:
+            current_app.logger.warning("Job %s (%s) failed, will retry:\n%s", job.id, job.name, error)
+            values = dict(run_at=datetime.utcnow() + retry_delay(job.attempts), locked_until=None, last_error=error)
+        db.session.execute(db.update(Job).where(Job.id == job.id).values(values))
+    else:
+        db.session.execute(db.delete(Job).where(Job.id == job.id))
+    db.session.commit()
+    return True
+
+
+def retry_failed() -> int:
+    """Queue the failed jobs again with a fresh attempt budget; returns their number."""
+    count = db.session.execute(
+        db.update(Job)
+        .where(Job.state == "failed")
+        .values(state="queued", attempts=0, run_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def work(app: Flask, threads: int = 2, once: bool = False) -> None:
+    """Run jobs in `threads` threads until SIGINT/SIGTERM, or with `once` until none is due.
+
+    On a signal the threads finish the job they are running and stop.
+    """
+    stop = threading.Event()
+    poll_interval = app.config["JOB_POLL_INTERVAL"]
+
+    def loop() -> None:
+        while not stop.is_set():
+            with app.app_context():
+                try:
+                    ran = run_next()
+                except Exception:
+                    # Typically "database is locked" under write contention; try again later
+                    app.logger.exception("Could not take a job from the queue")
+                    ran = False
+            if not ran:
+                if once:
+                    return
+                stop.wait(poll_interval)
+
+    previous = {sig: signal.signal(sig, lambda *_: stop.set()) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        pool = [threading.Thread(target=loop, name=f"worker-{i}") for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+
+def _work_in_child(threads: int, once: bool) -> None:
+    from . import create_app
+
+    work(create_app(), threads, once)
+
+
+def work_processes(app: Flask, processes: int, threads: int, once: bool = False) -> None:
+    """work() in this process and in processes - 1 spawned ones, for CPU-bound tasks such as resizing."""
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=_work_in_child, args=(threads, once)) for _ in range(processes - 1)]
+    for child in children:
+        child.start()
+    try:
+        work(app, threads, once)
+    finally:
+        for child in children:
+            if not once:
+                # SIGTERM: the child finishes its current jobs, like this process did
+                child.terminate()
+        for child in children:
+            child.join()
@@ -1,9 +1,12 @@
 from datetime import datetime
+from flask import g, has_request_context
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import CheckConstraint, UniqueConstraint
-from sqlalchemy.orm import validates
-from .extensions import db, login_manager
+from sqlalchemy import DDL, CheckConstraint, UniqueConstraint, event, inspect
+from sqlalchemy.orm import column_property, validates
+from .extensions import cache, db, login_manager
+from . import search
+from .util import RENDERER_VERSION, render_markdown_to_html
 
 
 class Role(db.Model):
@@ -16,6 +19,22 @@ class Role(db.Model):
         return f"<Role {self.name}>"
 
 
+@cache.cached(tags=("roles",))
+def role_names() -> dict:
+    """{role id: role name}; lets permission checks skip loading user.role on every request."""
+    return dict(db.session.execute(db.select(Role.id, Role.name)).all())
+
+
+def request_role_names() -> dict:
+    """role_names() once per request: templates check is_admin on every recipe card, and each
+    cache lookup checks tag versions (a cache.db read with CACHE_TYPE="sqlite")."""
+    if not has_request_context():
+        return role_names()
+    if "role_names" not in g:
+        g.role_names = role_names()
+    return g.role_names
+
+
 class User(UserMixin, db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
@@ -39,28 +58,66 @@ class User(UserMixin, db.Model):
 
     @property
     def is_admin(self) -> bool:
-        return self.role and self.role.name == "admin"
+        return request_role_names().get(self.role_id) == "admin"
 
     def full_name(self) -> str:
         parts = [self.last_name, self.first_name, self.middle_name or ""]
         return " ".join([p for p in parts if p]).strip()
 
 
+class RenderedMarkdownMixin:
+    """Keeps a pre-rendered `<name>_html` column next to every `<name>_md` one."""
+
+    markdown_fields: tuple = ()
+
+    html_version = db.Column(db.String(16))
+
+    def render_html(self) -> None:
+        for name in self.markdown_fields:
+            setattr(self, f"{name}_html", render_markdown_to_html(getattr(self, f"{name}_md")))
+        self.html_version = RENDERER_VERSION
+
+    @classmethod
+    def stale_html_filter(cls):
+        return db.or_(cls.html_version.is_(None), cls.html_version != RENDERER_VERSION)
+
+
 @login_manager.user_loader
 def load_user(user_id: str):
     return User.query.get(int(user_id))
 
 
-class Recipe(db.Model):
+RATING_VALUES = range(0, 6)
+
+
+class Recipe(RenderedMarkdownMixin, db.Model):
     __tablename__ = "recipes"
+    __table_args__ = (db.Index("ix_recipes_created_at_id", "created_at", "id"),)
+    markdown_fields = ("description", "ingredients", "steps")
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     description_md = db.Column(db.Text, nullable=False)
     ingredients_md = db.Column(db.Text, nullable=False)
     steps_md = db.Column(db.Text, nullable=False)
+    description_html = db.Column(db.Text)
+    ingredients_html = db.Column(db.Text)
+    steps_html = db.Column(db.Text)
     cook_time_min = db.Column(db.Integer, nullable=False)
     servings = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Also bumped by the review aggregate UPDATEs, so it versions the whole recipe page
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Review aggregates, maintained by the Review insert/delete hooks below
+    reviews_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_0 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_1 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_2 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_3 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_4 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_count_5 = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     author_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     author = db.relationship("User", back_populates="recipes")
@@ -85,12 +142,58 @@ class Recipe(db.Model):
         assert value is not None and int(value) >= 0
         return int(value)
 
+    @property
+    def avg_rating(self) -> float:
+        return self.rating_sum / self.reviews_count if self.reviews_count else 0.0
+
+    @property
+    def rating_histogram(self) -> dict:
+        return {stars: getattr(self, f"rating_count_{stars}") for stars in RATING_VALUES}
+
+    @classmethod
+    def avg_rating_expr(cls):
+        return db.func.coalesce(cls.rating_sum * 1.0 / db.func.nullif(cls.reviews_count, 0), 0.0)
+
+
+class Blob(db.Model):
+    """A stored upload (see app/storage.py) and the number of rows pointing at it."""
+
+    __tablename__ = "blobs"
+
+    key = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """A queued call of a background task (see app/jobs.py); deleted once it succeeds."""
+
+    __tablename__ = "jobs"
+    __table_args__ = (db.Index("ix_jobs_state_run_at", "state", "run_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.JSON, nullable=False)
+    # Idempotency key: a job is not enqueued again while one with the same key exists
+    key = db.Column(db.String(255), unique=True)
+    # "queued" (including running ones, which hold a lease in locked_until) or "failed"
+    state = db.Column(db.String(16), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 
 class RecipeImage(db.Model):
     __tablename__ = "recipe_images"
+    __table_args__ = (db.Index("ix_recipe_images_recipe_id", "recipe_id"),)
+
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     mime_type = db.Column(db.String(127), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     recipe_id = db.Column(
         db.Integer,
@@ -98,21 +201,123 @@ class RecipeImage(db.Model):
         nullable=False,
     )
     recipe = db.relationship("Recipe", back_populates="images")
+    # Resized copies for srcset, loaded together with the images
+    variants = db.relationship(
+        "RecipeImageVariant",
+        back_populates="image",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="selectin",
+        order_by="RecipeImageVariant.width",
+    )
+
+    def variants_of(self, mime_type: str) -> list:
+        return [v for v in self.variants if v.mime_type == mime_type]
+
+
+class RecipeImageVariant(db.Model):
+    """A downscaled, EXIF-free copy of an upload in one width and format (see app/images.py)."""
+
+    __tablename__ = "recipe_image_variants"
+    __table_args__ = (db.Index("ix_recipe_image_variants_image_id", "image_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(127), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+
+    image_id = db.Column(
+        db.Integer,
+        db.ForeignKey("recipe_images.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    image = db.relationship("RecipeImage", back_populates="variants")
 
 
-class Review(db.Model):
+class Review(RenderedMarkdownMixin, db.Model):
     __tablename__ = "reviews"
     __table_args__ = (
         UniqueConstraint("recipe_id", "user_id", name="uq_review_recipe_user"),
         CheckConstraint("rating >= 0 AND rating <= 5", name="ck_rating_range"),
+        db.Index("ix_reviews_recipe_id_created_at", "recipe_id", "created_at", "id"),
     )
+    markdown_fields = ("text",)
 
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False)
+    # active_history: the old values are loaded before a change, so after_update can move the aggregates
+    recipe_id = column_property(
+        db.Column(db.Integer, db.ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False), active_history=True
+    )
     user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    rating = db.Column(db.Integer, nullable=False, default=5)
+    rating = column_property(db.Column(db.Integer, nullable=False, default=5), active_history=True)
     text_md = db.Column(db.Text, nullable=False)
+    text_html = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     recipe = db.relationship("Recipe", back_populates="reviews")
     user = db.relationship("User", back_populates="reviews")
+
+
+def _review_aggregate_delta(rating: int, sign: int) -> dict:
+    histogram_column = Recipe.__table__.c[f"rating_count_{rating}"]
+    return {
+        Recipe.__table__.c.reviews_count: Recipe.__table__.c.reviews_count + sign,
+        Recipe.__table__.c.rating_sum: Recipe.__table__.c.rating_sum + sign * rating,
+        histogram_column: histogram_column + sign,
+    }
+
+
+@event.listens_for(Review, "after_insert")
+def _review_inserted(mapper, connection, review: Review) -> None:
+    # Runs inside the flush, so the counters commit (or roll back) with the review
+    connection.execute(
+        db.update(Recipe.__table__)
+        .where(Recipe.__table__.c.id == review.recipe_id)
+        .values(_review_aggregate_delta(review.rating, 1))
+    )
+
+
+@event.listens_for(Review, "after_update")
+def _review_updated(mapper, connection, review: Review) -> None:
+    # An edited rating (or a review moved to another recipe) leaves one bucket and enters another
+    state = inspect(review)
+    rating, recipe_id = state.attrs.rating.history, state.attrs.recipe_id.history
+    if not rating.deleted and not recipe_id.deleted:
+        return
+    old_rating = rating.deleted[0] if rating.deleted else review.rating
+    old_recipe_id = recipe_id.deleted[0] if recipe_id.deleted else review.recipe_id
+    connection.execute(
+        db.update(Recipe.__table__)
+        .where(Recipe.__table__.c.id == old_recipe_id)
+        .values(_review_aggregate_delta(old_rating, -1))
+    )
+    _review_inserted(mapper, connection, review)
+
+
+@event.listens_for(Review, "after_delete")
+def _review_deleted(mapper, connection, review: Review) -> None:
+    connection.execute(
+        db.update(Recipe.__table__)
+        .where(Recipe.__table__.c.id == review.recipe_id)
+        .values(_review_aggregate_delta(review.rating, -1))
+    )
+
+
+event.listen(Recipe.__table__, "after_create", DDL(search.CREATE_TABLE).execute_if(dialect="sqlite"))
+event.listen(Recipe.__table__, "before_drop", DDL(search.DROP_TABLE).execute_if(dialect="sqlite"))
+
+
+@event.listens_for(Recipe, "after_insert")
+@event.listens_for(Recipe, "after_update")
+def _recipe_saved(mapper, connection, recipe: Recipe) -> None:
+    # Keep the search index in the same transaction as the recipe row
+    if connection.dialect.name == "sqlite":
+        search.index_recipe(connection, recipe.id, recipe.title, recipe.description_md, recipe.ingredients_md)
+
+
+@event.listens_for(Recipe, "after_delete")
+def _recipe_deleted(mapper, connection, recipe: Recipe) -> None:
+    if connection.dialect.name == "sqlite":
+        search.remove_recipe(connection, recipe.id)
@@ -0,0 +1,85 @@
+"""Full-page cache for anonymous GET requests.
+
+Pages are stored gzip-compressed under surrogate keys (cache tags such as
+"recipe:7"); routes that change a recipe purge them with cache.invalidate().
+"""
+import functools
+import gzip
+from typing import Iterable, Optional, Tuple
+from urllib.parse import urlencode
+
+from flask import Response, current_app, make_response, request, session
+from flask_login import current_user
+
+from .cache import MISSING
+from .extensions import cache
+
+
+def _cacheable_request() -> bool:
+    # Every logged-out visitor without pending flash messages gets the same HTML
+    return (
+        current_app.config.get("PAGE_CACHE", False)
+        and request.method in ("GET", "HEAD")
+        and not current_user.is_authenticated
+        and not session.get("_flashes")
+    )
+
+
+def page_key() -> str:
+    """Endpoint, view args and the query string with blank params dropped and the rest sorted."""
+    args = sorted((name, value) for name, value in request.args.items(multi=True) if value)
+    return f"page:{request.endpoint}:{sorted(request.view_args.items())!r}:{urlencode(args)}"
+
+
+# Stored with the page so cache hits can still answer conditional requests
+STORED_HEADERS = ("ETag", "Last-Modified", "Cache-Control")
+
+
+def _page_response(page: Tuple[str, bytes, list]) -> Response:
+    content_type, body, headers = page
+    response = current_app.response_class(content_type=content_type, headers=headers)
+    if request.accept_encodings["gzip"]:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response.set_data(gzip.decompress(body))
+    response.headers["X-Cache"] = "HIT"
+    # If-None-Match/If-Modified-Since against the stored validators: 304 without touching the database
+    return response.make_conditional(request)
+
+
+def cache_page(tags: Iterable[str] = (), ttl: Optional[int] = None):
+    """Serve the view from the page cache for anonymous visitors.
+
+    `tags` are the page's surrogate keys and may reference view args: ("recipe:{recipe_id}",).
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            backend = cache.backend
+            if backend is None or not _cacheable_request():
+                return view(**view_args)
+
+            key = page_key()
+            page, versions = backend.lookup(key, [tag.format(**view_args) for tag in tags])
+            if page is not MISSING:
+                response = _page_response(page)
+            else:
+                response = make_response(view(**view_args))
+                # Responses that touch the session or set cookies are per-visitor
+                if response.status_code == 200 and not session.modified and "Set-Cookie" not in response.headers:
+                    headers = [(name, response.headers[name]) for name in STORED_HEADERS if name in response.headers]
+                    page = (
+                        response.content_type,
+                        gzip.compress(response.get_data(), compresslevel=6, mtime=0),
+                        headers,
+                    )
+                    backend.store(key, page, versions, ttl or current_app.config.get("PAGE_CACHE_TTL"))
+                response.headers["X-Cache"] = "MISS"
+            response.vary.update(("Cookie", "Accept-Encoding"))
+            return response
+
+        return wrapper
+
+    return decorator
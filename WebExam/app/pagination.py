@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, and_, or_
+
+from .extensions import db
+
+INT64_MIN, INT64_MAX = -(2**63), 2**63 - 1
+
+# (column, descending) pairs; the last column must be unique (usually the id)
+KeysetOrder = Sequence[Tuple[Any, bool]]
+
+
+class KeysetPage:
+    """A page fetched by cursor instead of OFFSET, with no COUNT(*) query."""
+
+    def __init__(self, items: list, per_page: int, next_cursor: Optional[str] = None, prev_cursor: Optional[str] = None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _cursor_value(column: Any, value: Any) -> Any:
+    """The cursor value for `column`; ValueError if its type does not fit."""
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    # JSON scalars only (bool is an int, but never in a cursor we issued), of the column's type
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(value)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if python_type in (str, int, float) and not isinstance(value, python_type):
+        raise ValueError(value)
+    # Integers past 64 bits are refused by the driver (OverflowError on SQLite)
+    if isinstance(value, int) and not INT64_MIN <= value <= INT64_MAX:
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(token: str, columns: Sequence[Any]) -> Optional[List[Any]]:
+    """Returns None for a malformed or foreign cursor so callers fall back to the first page."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_cursor_value(c, v) for c, v in zip(columns, values)]
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def _seek(order: KeysetOrder, values: Sequence[Any]):
+    # Expanded row-value comparison, so mixed ASC/DESC orders work on every backend
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        clauses.append(and_(*equal, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+
+def _order_by(order: KeysetOrder) -> list:
+    return [c.desc() if descending else c.asc() for c, descending in order]
+
+
+def keyset_paginate(query, order: KeysetOrder, per_page: int, after: Optional[str] = None, before: Optional[str] = None) -> KeysetPage:
+    columns = [c for c, _ in order]
+    after_values = decode_cursor(after, columns) if after else None
+    before_values = decode_cursor(before, columns) if before else None
+
+    if before_values is not None:
+        # Walk backwards with the order inverted, then flip the page back
+        reverse = [(c, not descending) for c, descending in order]
+        query = query.where(_seek(reverse, before_values)).order_by(*_order_by(reverse))
+        items = db.session.execute(query.limit(per_page + 1)).scalars().all()
+        has_prev, has_next = len(items) > per_page, True
+        items = items[:per_page][::-1]
+    else:
+        if after_values is not None:
+            query = query.where(_seek(order, after_values))
+        items = db.session.execute(query.order_by(*_order_by(order)).limit(per_page + 1)).scalars().all()
+        has_prev, has_next = after_values is not None, len(items) > per_page
+        items = items[:per_page]
+
+    def cursor_for(item) -> str:
+        return encode_cursor([getattr(item, c.key) for c in columns])
+
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=cursor_for(items[-1]) if items and has_next else None,
+        prev_cursor=cursor_for(items[0]) if items and has_prev else None,
+    )
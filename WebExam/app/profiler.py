@@ -0,0 +1,273 @@
+"""On-demand cProfile captures of single requests.
+
+A request is profiled when PROFILER_ENABLED is set and it either carries
+"X-Profile: <PROFILER_TOKEN>" or its endpoint is sampled through
+PROFILE_SAMPLE_RATES ({"recipes.index": 0.01}). Each capture is written to
+PROFILE_DIR as <id>.json (metadata) and <id>.pstats; only the newest
+PROFILE_MAX_CAPTURES are kept. `flask profiles list` and `flask profiles diff`
+compare captures between releases; `flask profiles folded <id>` writes the
+collapsed stacks for flamegraph.pl or speedscope.
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import click
+from flask import Flask, current_app, g, request
+
+# Collapsed stacks stop growing below this depth
+MAX_STACK_DEPTH = 128
+# Branches shorter than this share of the profile, and any past MAX_STACK_NODES, are not
+# expanded but added to their caller: the number of paths in a call graph grows exponentially
+MIN_STACK_SHARE = 0.001
+MAX_STACK_NODES = 20_000
+CAPTURE_SUFFIXES = (".json", ".pstats", ".folded")
+
+Func = Tuple[str, int, str]
+
+
+def frame_name(func: Func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name.replace(";", ",")
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, int]:
+    """Collapsed stacks ("a;b;c microseconds") built from the pstats call graph.
+
+    cProfile only keeps caller -> callee pairs, so a function's time is split
+    between stacks in proportion to the time spent under each caller. The
+    picture is approximate, but per-function totals match pstats (up to the
+    folded short branches).
+    """
+    callees = defaultdict(dict)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, caller_stats in callers.items():
+            callees[caller][func] = caller_stats[3]
+    min_seconds = MIN_STACK_SHARE * sum(tt for _, _, tt, _, _ in stats.stats.values())
+    stacks = Counter()
+    nodes = 0
+
+    def walk(func, path, cumulative):
+        nonlocal nodes
+        nodes += 1
+        _, _, tottime, total, _ = stats.stats[func]
+        share = cumulative / total if total else 0
+        path = path + (frame_name(func),)
+        stack = ";".join(path)
+        stacks[stack] += tottime * share
+        for callee, callee_time in callees[func].items():
+            if frame_name(callee) in path:
+                continue
+            seconds = callee_time * share
+            if seconds >= min_seconds and nodes < MAX_STACK_NODES and len(path) < MAX_STACK_DEPTH:
+                walk(callee, path, seconds)
+            else:
+                stacks[stack] += seconds
+
+    for root in roots:
+        walk(root, (), stats.stats[root][3])
+    return {stack: round(seconds * 1_000_000) for stack, seconds in stacks.items() if seconds >= 0.5e-6}
+
+
+class ProfileStore:
+    """Captures in a directory, newest max_captures kept.
+
+    Collapsed stacks are built on demand (folded), not in save: save runs in
+    the request teardown and has to stay cheap.
+    """
+
+    def __init__(self, directory: str, max_captures: int = 50):
+        self.directory = directory
+        self.max_captures = max_captures
+
+    def path(self, capture_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, capture_id + suffix)
+
+    @staticmethod
+    def new_id(endpoint: str) -> str:
+        # Timestamp first, down to microseconds, so sorting by file name sorts by time
+        endpoint = (endpoint or "unmatched").replace(".", "-")
+        return f"{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{endpoint}-{uuid.uuid4().hex[:6]}"
+
+    def save(self, capture_id: str, profile: cProfile.Profile, meta: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        stats = pstats.Stats(profile)
+        stats.dump_stats(self.path(capture_id, ".pstats"))
+        # Metadata goes last: a capture without it is not listed
+        with open(self.path(capture_id, ".json"), "w", encoding="utf-8") as f:
+            json.dump({"id": capture_id, **meta}, f, ensure_ascii=False)
+        self.prune()
+
+    def captures(self) -> List[dict]:
+        """Capture metadata, oldest first."""
+        result = []
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else ():
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        result.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return result
+
+    def find(self, prefix: str) -> dict:
+        """The capture whose id starts with prefix; LookupError unless exactly one matches."""
+        matches = [c for c in self.captures() if c["id"].startswith(prefix)]
+        if len(matches) != 1:
+            raise LookupError(f"{len(matches)} captures match {prefix}*")
+        return matches[0]
+
+    def stats(self, capture_id: str) -> pstats.Stats:
+        return pstats.Stats(self.path(capture_id, ".pstats"))
+
+    def folded(self, capture_id: str) -> str:
+        """Path of the capture's collapsed stacks, built from its .pstats on first use."""
+        path = self.path(capture_id, ".folded")
+        if not os.path.exists(path):
+            stacks = collapsed_stacks(self.stats(capture_id))
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {value}\n" for stack, value in sorted(stacks.items()) if value)
+            os.replace(path + ".tmp", path)
+        return path
+
+    def prune(self) -> None:
+        for capture in self.captures()[: -self.max_captures or None]:
+            for suffix in CAPTURE_SUFFIXES:
+                try:
+                    os.remove(self.path(capture["id"], suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def diff_stats(old: pstats.Stats, new: pstats.Stats) -> List[Tuple[str, float, float, float, float]]:
+    """(function, own time before, after, cumulative before, after), largest cumulative change first."""
+    rows = []
+    for func in set(old.stats) | set(new.stats):
+        old_tt, old_ct = old.stats[func][2:4] if func in old.stats else (0, 0)
+        new_tt, new_ct = new.stats[func][2:4] if func in new.stats else (0, 0)
+        rows.append((frame_name(func), old_tt, new_tt, old_ct, new_ct))
+    rows.sort(key=lambda row: abs(row[4] - row[3]), reverse=True)
+    return rows
+
+
+def _requested() -> bool:
+    token = current_app.config["PROFILER_TOKEN"]
+    header = request.headers.get("X-Profile")
+    if header is not None and token and hmac.compare_digest(header.encode(), token.encode()):
+        return True
+    rate = current_app.config["PROFILE_SAMPLE_RATES"].get(request.endpoint, 0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile() -> None:
+    if not _requested():
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Since Python 3.12 there is one profiler per process: a concurrent request holds it
+        return
+    g.profile = profile
+    g.profile_started = time.perf_counter()
+    g.profile_id = ProfileStore.new_id(request.endpoint)
+
+
+def _mark_capture(response):
+    if g.get("profile") is not None:
+        g.profile_status = response.status_code
+        response.headers["X-Profile-Capture"] = g.profile_id
+    return response
+
+
+def _save_profile(exc) -> None:
+    profile = g.pop("profile", None)
+    if profile is None:
+        return
+    profile.disable()
+    current_app.extensions["profiler"].save(
+        g.profile_id,
+        profile,
+        {
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": g.get("profile_status", 500),
+            "duration_ms": round((time.perf_counter() - g.profile_started) * 1000, 1),
+            "release": current_app.config["RELEASE"],
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        },
+    )
+
+
+@click.group("profiles")
+def profiles():
+    """Request profile captures (see PROFILER_ENABLED)."""
+
+
+@profiles.command("list")
+@click.option("--endpoint", help="Only captures of this endpoint")
+def list_profiles(endpoint):
+    """List stored captures, oldest first."""
+    for capture in current_app.extensions["profiler"].captures():
+        if endpoint and capture["endpoint"] != endpoint:
+            continue
+        print(
+            f"{capture['id']}  {capture['method']} {capture['path']}  {capture['status']}  "
+            f"{capture['duration_ms']} ms  {capture['release'] or '-'}"
+        )
+
+
+@profiles.command("folded")
+@click.argument("capture")
+def folded_profile(capture):
+    """Write the capture's collapsed stacks for flamegraph.pl or speedscope and print the file path."""
+    store = current_app.extensions["profiler"]
+    try:
+        capture = store.find(capture)
+    except LookupError as err:
+        raise click.ClickException(str(err))
+    print(store.folded(capture["id"]))
+
+
+@profiles.command("diff")
+@click.argument("old")
+@click.argument("new")
+@click.option("--limit", default=20, show_default=True, help="Functions to show")
+def diff_profiles(old, new, limit):
+    """Compare two captures (id or its prefix) by the functions whose cumulative time changed most."""
+    store = current_app.extensions["profiler"]
+    try:
+        old, new = store.find(old), store.find(new)
+    except LookupError as err:
+        raise click.ClickException(str(err))
+    print(
+        f"{old['id']} ({old['release'] or '-'}, {old['duration_ms']} ms) -> "
+        f"{new['id']} ({new['release'] or '-'}, {new['duration_ms']} ms)"
+    )
+    print(f"{'cumulative, ms':>22}  {'own, ms':>22}  function")
+    for name, old_tt, new_tt, old_ct, new_ct in diff_stats(store.stats(old["id"]), store.stats(new["id"]))[:limit]:
+        print(f"{old_ct * 1000:9.2f} -> {new_ct * 1000:9.2f}  {old_tt * 1000:9.2f} -> {new_tt * 1000:9.2f}  {name}")
+
+
+def init_profiler(app: Flask) -> None:
+    """Profile from the first before_request to teardown: hooks, the view and template rendering."""
+    app.extensions["profiler"] = ProfileStore(app.config["PROFILE_DIR"], app.config["PROFILE_MAX_CAPTURES"])
+    app.cli.add_command(profiles)
+    if app.config["PROFILER_ENABLED"]:
+        app.before_request(_start_profile)
+        app.after_request(_mark_capture)
+        app.teardown_request(_save_profile)
@@ -1,10 +1,16 @@
 import os
-from typing import List
-from flask import render_template, request, redirect, url_for, flash, current_app, abort, send_from_directory
+from flask import render_template, request, redirect, url_for, flash, current_app, abort
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
-from ..extensions import db
+from .. import jobs, storage, tasks
+from ..conditional import conditional
+from ..delivery import send_stored_file
+from ..extensions import cache, db
 from ..models import Recipe, RecipeImage, Review
+from ..page_cache import cache_page
+from ..pagination import keyset_paginate
+from ..search import build_match_query, search_recipe_ids
 from ..util import sanitize_markdown_text, render_markdown_to_html
 from . import bp
 
@@ -14,54 +20,110 @@ def markdown_filter(text: str) -> str:
     return render_markdown_to_html(text)
 
 
+@bp.app_template_filter("srcset")
+def srcset_filter(variants) -> str:
+    return ", ".join(f"{url_for('recipes.uploaded_file', filename=v.filename)} {v.width}w" for v in variants)
+
+
+# Cursor order for the "newest" listing, backed by the (created_at, id) index
+RECIPE_KEYSET_ORDER = [(Recipe.created_at, True), (Recipe.id, True)]
+
+# Reviews on the recipe page, newest first; backed by the (recipe_id, created_at, id) index
+REVIEW_KEYSET_ORDER = [(Review.created_at, True), (Review.id, True)]
+
+RECIPE_SORTS = {
+    "newest": (Recipe.created_at.desc(), Recipe.id.desc()),
+    "rating": (Recipe.avg_rating_expr().desc(), Recipe.reviews_count.desc(), Recipe.id.desc()),
+}
+
+
 @bp.route("/")
+@cache_page(tags=("recipes",))
 def index():
     page = request.args.get("page", 1, type=int)
-    pagination = Recipe.query.order_by(Recipe.created_at.desc()).paginate(
-        page=page, per_page=current_app.config["RECIPES_PER_PAGE"], error_out=False
-    )
+    sort = request.args.get("sort", "newest")
+    if sort not in RECIPE_SORTS:
+        sort = "newest"
+    per_page = current_app.config["RECIPES_PER_PAGE"]
+    # Review aggregates live on the recipe row, so no per-page GROUP BY over reviews
+    if sort == "newest" and current_app.config["KEYSET_PAGINATION"] and "page" not in request.args:
+        pagination = keyset_paginate(
+            db.select(Recipe),
+            RECIPE_KEYSET_ORDER,
+            per_page,
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+        )
+    else:
+        pagination = Recipe.query.order_by(*RECIPE_SORTS[sort]).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
     recipes = pagination.items
 
-    # Preload aggregates: avg rating and count reviews
-    recipe_ids = [r.id for r in recipes]
-    reviews_by_recipe = {
-        rid: {"count": 0, "sum": 0} for rid in recipe_ids
-    }
-    if recipe_ids:
-        rows = (
-            db.session.query(Review.recipe_id, db.func.count(Review.id), db.func.coalesce(db.func.sum(Review.rating), 0))
-            .filter(Review.recipe_id.in_(recipe_ids))
-            .group_by(Review.recipe_id)
-            .all()
-        )
-        for rid, cnt, total in rows:
-            reviews_by_recipe[rid] = {"count": int(cnt), "sum": int(total)}
+    return render_template("recipes/index.html", pagination=pagination, recipes=recipes, sort=sort)
+
+
+@bp.route("/search")
+@cache_page(tags=("recipes",))
+def search():
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = current_app.config["RECIPES_PER_PAGE"]
+    ingredients = [i for i in request.args.get("ingredients", "").split(",") if i.strip()]
+    match_query = build_match_query(request.args.get("q", ""), ingredients)
 
-    return render_template("recipes/index.html", pagination=pagination, recipes=recipes, reviews_agg=reviews_by_recipe)
+    recipes, has_next = [], False
+    if match_query:
+        # FTS5 ranks by BM25; fetch one extra id to know whether a next page exists
+        ids = search_recipe_ids(match_query, limit=per_page + 1, offset=(page - 1) * per_page)
+        has_next = len(ids) > per_page
+        ids = ids[:per_page]
+        by_id = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(ids))} if ids else {}
+        recipes = [by_id[i] for i in ids if i in by_id]
+
+    return render_template(
+        "recipes/search.html", recipes=recipes, page=page, has_next=has_next, searched=match_query is not None
+    )
+
+
+# A blob key always names the same bytes (see app/storage.py)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
 
 
 @bp.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename)
+    if not storage.BLOB_KEY_RE.match(filename):
+        # Uploads from before content-addressed storage (flask migrate-uploads moves them); let the browser revalidate
+        return send_stored_file("uploads", current_app.config["UPLOAD_FOLDER"], filename)
+    response = storage.get_storage().send(filename, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 def _can_modify(recipe: Recipe) -> bool:
     return current_user.is_authenticated and (current_user.is_admin or recipe.author_id == current_user.id)
 
 
+def _reviews_page(recipe_id: int, after=None):
+    # Bounded, ordered page with authors joined in, instead of loading recipe.reviews
+    query = db.select(Review).options(joinedload(Review.user)).where(Review.recipe_id == recipe_id)
+    return keyset_paginate(query, REVIEW_KEYSET_ORDER, current_app.config["REVIEWS_PER_PAGE"], after=after)
+
+
+def _recipe_versions(recipe_id: int):
+    # Edits and review aggregates bump recipes.updated_at; the latest review covers review edits
+    last_review_at = (
+        db.select(db.func.max(Review.updated_at)).where(Review.recipe_id == Recipe.id).scalar_subquery()
+    )
+    return db.session.execute(db.select(Recipe.updated_at, last_review_at).where(Recipe.id == recipe_id)).first()
+
+
 @bp.route("/recipes/<int:recipe_id>")
+@cache_page(tags=("recipe:{recipe_id}",))
+@conditional(_recipe_versions)
 def view(recipe_id: int):
     recipe = Recipe.query.get_or_404(recipe_id)
 
-    # Compute average rating and count
-    stats = (
-        db.session.query(db.func.count(Review.id), db.func.coalesce(db.func.avg(Review.rating), 0.0))
-        .filter(Review.recipe_id == recipe.id)
-        .first()
-    )
-    reviews_count = int(stats[0]) if stats else 0
-    avg_rating = float(stats[1]) if stats else 0.0
-
     existing_user_review = None
     if current_user.is_authenticated:
         existing_user_review = Review.query.filter_by(recipe_id=recipe.id, user_id=current_user.id).first()
@@ -69,17 +131,30 @@ def view(recipe_id: int):
     return render_template(
         "recipes/view.html",
         recipe=recipe,
+        reviews=_reviews_page(recipe.id),
         can_modify=_can_modify(recipe),
-        reviews_count=reviews_count,
-        avg_rating=avg_rating,
         existing_user_review=existing_user_review,
     )
 
 
+@bp.route("/recipes/<int:recipe_id>/reviews")
+@cache_page(tags=("recipe:{recipe_id}",))
+@conditional(_recipe_versions)
+def reviews_fragment(recipe_id: int):
+    """Next page of review cards as an HTML fragment for the "show more" button."""
+    recipe = db.get_or_404(Recipe, recipe_id)
+    return render_template(
+        "recipes/_reviews.html",
+        recipe=recipe,
+        reviews=_reviews_page(recipe.id, after=request.args.get("after")),
+    )
+
+
 @bp.route("/recipes/create", methods=["GET", "POST"])
 @login_required
 def create():
     if request.method == "POST":
+        stored = []
         try:
             title = request.form.get("title", "").strip()
             description_md = sanitize_markdown_text(request.form.get("description_md", ""))
@@ -97,6 +172,7 @@ def create():
                 servings=servings,
                 author_id=current_user.id,
             )
+            recipe.render_html()
             db.session.add(recipe)
             db.session.flush()  # Get recipe.id before committing
 
@@ -105,18 +181,22 @@ def create():
             for f in files:
                 if not f or not f.filename:
                     continue
-                filename = secure_filename(f.filename)
-                stored_name = f"{recipe.id}_{filename}"
-                save_path = os.path.join(current_app.config["UPLOAD_FOLDER"], stored_name)
-                f.save(save_path)
-                db.session.add(
-                    RecipeImage(filename=stored_name, mime_type=f.mimetype, recipe_id=recipe.id)
-                )
+                extension = os.path.splitext(secure_filename(f.filename))[1].lower()
+                key = storage.store(f.stream, extension)
+                stored.append(key)
+                image = RecipeImage(filename=key, mime_type=f.mimetype, recipe_id=recipe.id)
+                db.session.add(image)
+                db.session.flush()
+                # Resizing happens in `flask worker`; the page shows the original until then
+                jobs.enqueue(tasks.make_image_variants, image.id, key=f"image-variants:{image.id}")
 
             db.session.commit()
+            cache.invalidate("recipes")
             return redirect(url_for("recipes.view", recipe_id=recipe.id))
         except Exception:
             db.session.rollback()
+            # The files were written before the commit; only their blob rows went with the rollback
+            storage.discard(stored)
             flash("При сохранении данных возникла ошибка. Проверьте корректность введённых данных.", "danger")
     return render_template("recipes/form.html", mode="create", recipe=None)
 
@@ -136,7 +216,9 @@ def edit(recipe_id: int):
             recipe.steps_md = sanitize_markdown_text(request.form.get("steps_md", ""))
             recipe.cook_time_min = int(request.form.get("cook_time_min", 0))
             recipe.servings = int(request.form.get("servings", 0))
+            recipe.render_html()
             db.session.commit()
+            cache.invalidate(f"recipe:{recipe.id}", "recipes")
             return redirect(url_for("recipes.view", recipe_id=recipe.id))
         except Exception:
             db.session.rollback()
@@ -153,19 +235,14 @@ def delete(recipe_id: int):
         return redirect(url_for("recipes.index"))
 
     try:
-        # Collect image files to delete after commit
-        image_paths: List[str] = [
-            os.path.join(current_app.config["UPLOAD_FOLDER"], img.filename) for img in recipe.images
-        ]
+        names = [name for img in recipe.images for name in [img.filename] + [v.filename for v in img.variants]]
+        blob_keys = [name for name in names if storage.BLOB_KEY_RE.match(name)]
         db.session.delete(recipe)
+        storage.release(blob_keys)
+        # Blobs shared with other recipes stay; legacy files belong to this recipe alone
+        jobs.enqueue(tasks.delete_uploads, blob_keys, sorted(set(names) - set(blob_keys)))
         db.session.commit()
-        # Remove files from filesystem
-        for p in image_paths:
-            try:
-                if os.path.exists(p):
-                    os.remove(p)
-            except Exception:
-                pass
+        cache.invalidate(f"recipe:{recipe_id}", "recipes")
         flash("Рецепт успешно удалён", "success")
     except Exception:
         db.session.rollback()
@@ -1,6 +1,6 @@
 from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from ..extensions import db
+from ..extensions import cache, db
 from ..models import Recipe, Review
 from ..util import sanitize_markdown_text
 from . import bp
@@ -21,8 +21,11 @@ def create(recipe_id: int):
             rating = int(request.form.get("rating", 5))
             text_md = sanitize_markdown_text(request.form.get("text_md", ""))
             review = Review(recipe_id=recipe.id, user_id=current_user.id, rating=rating, text_md=text_md)
+            review.render_html()
             db.session.add(review)
             db.session.commit()
+            # The recipe page lists the review; listings show the rating
+            cache.invalidate(f"recipe:{recipe.id}", "recipes")
             return redirect(url_for("recipes.view", recipe_id=recipe.id))
         except Exception:
             db.session.rollback()
@@ -0,0 +1,93 @@
+"""Full-text recipe search backed by an SQLite FTS5 table.
+
+`recipes_fts` keeps its own normalized copy of title, description and
+ingredients (rowid = recipe id). The unicode61 tokenizer folds Cyrillic case
+but not ё, so both the indexed text and the queries go through `normalize`.
+"""
+import re
+from typing import List, Optional, Sequence
+
+from sqlalchemy import text
+
+from .extensions import db
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts "
+    "USING fts5(title, description, ingredients, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_TABLE = "DROP TABLE IF EXISTS recipes_fts"
+# bm25 weights per column: title, description, ingredients
+BM25 = "bm25(recipes_fts, 10.0, 2.0, 5.0)"
+
+# Letters and digits only: unicode61 splits on "_", so a token of underscores would be an empty phrase
+# and make the whole AND query match nothing
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize(value: Optional[str]) -> str:
+    return (value or "").replace("ё", "е").replace("Ё", "Е")
+
+
+def _sql_normalize(column: str) -> str:
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Alembic autogenerate filter: the FTS5 shadow tables are not part of the models."""
+    return not (type_ == "table" and name.startswith("recipes_fts"))
+
+
+def index_recipe(connection, recipe_id: int, title: str, description: str, ingredients: str) -> None:
+    connection.execute(text("DELETE FROM recipes_fts WHERE rowid = :id"), {"id": recipe_id})
+    connection.execute(
+        text(
+            "INSERT INTO recipes_fts (rowid, title, description, ingredients) "
+            "VALUES (:id, :title, :description, :ingredients)"
+        ),
+        {
+            "id": recipe_id,
+            "title": normalize(title),
+            "description": normalize(description),
+            "ingredients": normalize(ingredients),
+        },
+    )
+
+
+def remove_recipe(connection, recipe_id: int) -> None:
+    connection.execute(text("DELETE FROM recipes_fts WHERE rowid = :id"), {"id": recipe_id})
+
+
+def rebuild(connection) -> None:
+    connection.execute(text(CREATE_TABLE))
+    connection.execute(text("DELETE FROM recipes_fts"))
+    connection.execute(
+        text(
+            "INSERT INTO recipes_fts (rowid, title, description, ingredients) "
+            f"SELECT id, {_sql_normalize('title')}, {_sql_normalize('description_md')}, "
+            f"{_sql_normalize('ingredients_md')} FROM recipes"
+        )
+    )
+
+
+def _prefix_phrase(words: Sequence[str]) -> str:
+    # Words are alphanumeric tokens, so quoting is enough to keep FTS5 operators out
+    return '"' + " ".join(words) + '"*'
+
+
+def build_match_query(query: str = "", ingredients: Sequence[str] = ()) -> Optional[str]:
+    """Every word of `query` in any column AND every ingredient phrase in the ingredients column."""
+    terms = [_prefix_phrase([word]) for word in _WORD_RE.findall(normalize(query))]
+    for ingredient in ingredients:
+        words = _WORD_RE.findall(normalize(ingredient))
+        if words:
+            terms.append(f"ingredients : {_prefix_phrase(words)}")
+    return " AND ".join(terms) or None
+
+
+def search_recipe_ids(match_query: str, limit: int, offset: int = 0) -> List[int]:
+    """Recipe ids ranked by BM25, best match first."""
+    rows = db.session.execute(
+        text(f"SELECT rowid FROM recipes_fts WHERE recipes_fts MATCH :q ORDER BY {BM25} LIMIT :limit OFFSET :offset"),
+        {"q": match_query, "limit": limit, "offset": offset},
+    )
+    return [row[0] for row in rows]
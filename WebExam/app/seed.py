@@ -0,0 +1,267 @@
+"""A large, reproducible dataset for load testing (`flask seed`).
+
+Rows are written in batches through table-level INSERTs (executemany),
+bypassing the ORM and its per-row hooks, so 100k users and millions of reviews
+take minutes. Every value comes from random.Random(seed) and dates are counted
+from a fixed epoch, so the same seed on the same starting database gives the
+same data. What the hooks would maintain is done here instead:
+- review aggregates are computed while generating reviews and written with the recipes;
+- blob refcounts are computed from the image rows;
+- the search index is rebuilt at the end.
+Markdown is rendered once per distinct text: texts are drawn from small pools.
+"""
+import io
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+from PIL import Image as PILImage
+from werkzeug.security import generate_password_hash
+
+from . import search, storage
+from .extensions import db
+from .models import RATING_VALUES, Blob, Recipe, RecipeImage, Review, Role, User
+from .util import RENDERER_VERSION, render_markdown_to_html
+
+# Dates are spread over the year after this moment, not relative to the day of seeding
+EPOCH = datetime(2024, 1, 1)
+PERIOD_SECONDS = 365 * 24 * 60 * 60
+# Distinct Markdown texts per field; each is rendered once
+TEXT_POOL_SIZE = 200
+# Distinct picture files behind the image rows
+PICTURE_POOL_SIZE = 100
+
+FIRST_NAMES = ("Иван", "Мария", "Алексей", "Анна", "Дмитрий", "Елена", "Сергей", "Ольга", "Павел", "Наталья")
+LAST_NAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков")
+DISHES = ("Суп", "Пирог", "Салат", "Рагу", "Запеканка", "Каша", "Блины", "Котлеты", "Паста", "Плов", "Омлет")
+INGREDIENTS = (
+    "мука", "молоко", "яйца", "сахар", "соль", "масло сливочное", "масло растительное", "картофель", "морковь",
+    "лук репчатый", "чеснок", "курица", "говядина", "рис", "гречка", "сметана", "творог", "сыр", "помидоры",
+    "огурцы", "капуста", "грибы", "зелень", "перец чёрный", "лимон", "яблоки", "мёд", "орехи",
+)
+WORDS = ("вкусно", "быстро", "просто", "сытно", "ароматно", "нежно", "очень", "блюдо", "рецепт", "семья",
+         "получилось", "добавить", "готовить", "минут", "советую", "праздник", "ужин", "завтрак")
+# Ratings 0-5 lean high, as real reviews do (cumulative weights for random.choices)
+RATING_CUM_WEIGHTS = (2, 5, 10, 25, 60, 100)
+
+
+def _next_id(connection, model) -> int:
+    return (connection.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+
+def _batches(rows: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    """Generates the dataset step by step; each step returns the ids it created."""
+
+    def __init__(self, connection, seed: int = 0, batch_size: int = 10_000, echo: Callable[[str], None] = print):
+        self.connection = connection
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.echo = echo
+
+    def moment(self) -> datetime:
+        return EPOCH + timedelta(seconds=self.rng.randrange(PERIOD_SECONDS))
+
+    def sentence(self, words: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=words)).capitalize() + "."
+
+    def text_pool(self, make: Callable[[], str]) -> List[tuple]:
+        """(markdown, html) pairs, rendered once each."""
+        return [(text, render_markdown_to_html(text)) for text in (make() for _ in range(TEXT_POOL_SIZE))]
+
+    def insert(self, model, rows: Iterable[dict]) -> int:
+        total = 0
+        for batch in _batches(rows, self.batch_size):
+            self.connection.execute(model.__table__.insert(), batch)
+            self.connection.commit()
+            total += len(batch)
+        return total
+
+    def users(self, count: int, password: str) -> range:
+        rng, first_id = self.rng, _next_id(self.connection, User)
+        role_id = self.connection.execute(db.select(Role.id).where(Role.name == "user")).scalar()
+        if role_id is None:
+            role_id = _next_id(self.connection, Role)
+            self.insert(Role, [{"id": role_id, "name": "user", "description": "Пользователь"}])
+        # One hash for everyone: scrypt per user would take hours
+        password_hash = generate_password_hash(password)
+        self.insert(
+            User,
+            (
+                {
+                    "id": user_id,
+                    "username": f"seed{user_id}",
+                    "password_hash": password_hash,
+                    "last_name": rng.choice(LAST_NAMES),
+                    "first_name": rng.choice(FIRST_NAMES),
+                    "middle_name": None,
+                    "role_id": role_id,
+                }
+                for user_id in range(first_id, first_id + count)
+            ),
+        )
+        self.echo(f"Users: {count} (usernames seed{first_id}..seed{first_id + count - 1})")
+        return range(first_id, first_id + count)
+
+    def recipes(self, count: int, reviews: int, user_ids: Sequence[int]) -> range:
+        """Recipes with their reviews; reviews per recipe follow a Pareto distribution, so a few recipes get most."""
+        rng, first_id = self.rng, _next_id(self.connection, Recipe)
+        descriptions = self.text_pool(
+            lambda: "\n\n".join(self.sentence(rng.randint(8, 30)) for _ in range(rng.randint(1, 3)))
+        )
+        ingredients = self.text_pool(
+            lambda: "\n".join(f"- {name}" for name in rng.sample(INGREDIENTS, rng.randint(3, 8)))
+        )
+        steps = self.text_pool(
+            lambda: "\n".join(f"{i}. {self.sentence(rng.randint(4, 12))}" for i in range(1, rng.randint(3, 8)))
+        )
+        review_texts = self.text_pool(lambda: self.sentence(rng.randint(5, 40)))
+        weights = [rng.paretovariate(1.2) for _ in range(count)]
+        scale = reviews / sum(weights) if weights else 0
+        review_id = _next_id(self.connection, Review)
+        recipe_rows, review_rows, total = [], [], 0
+        for recipe_id, weight in zip(range(first_id, first_id + count), weights):
+            created_at = self.moment()
+            reviewers = rng.sample(user_ids, min(len(user_ids), round(weight * scale)))
+            ratings = rng.choices(RATING_VALUES, cum_weights=RATING_CUM_WEIGHTS, k=len(reviewers))
+            for user_id, rating in zip(reviewers, ratings):
+                text_md, text_html = rng.choice(review_texts)
+                moment = self.moment()
+                review_rows.append(
+                    {
+                        "id": review_id,
+                        "recipe_id": recipe_id,
+                        "user_id": user_id,
+                        "rating": rating,
+                        "text_md": text_md,
+                        "text_html": text_html,
+                        "html_version": RENDERER_VERSION,
+                        "created_at": moment,
+                        "updated_at": moment,
+                    }
+                )
+                review_id += 1
+            (description_md, description_html), (ingredients_md, ingredients_html), (steps_md, steps_html) = (
+                rng.choice(descriptions),
+                rng.choice(ingredients),
+                rng.choice(steps),
+            )
+            recipe_rows.append(
+                {
+                    "id": recipe_id,
+                    "title": f"{rng.choice(DISHES)} №{recipe_id}",
+                    "description_md": description_md,
+                    "ingredients_md": ingredients_md,
+                    "steps_md": steps_md,
+                    "description_html": description_html,
+                    "ingredients_html": ingredients_html,
+                    "steps_html": steps_html,
+                    "html_version": RENDERER_VERSION,
+                    "cook_time_min": rng.randrange(5, 181, 5),
+                    "servings": rng.randint(1, 8),
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                    "reviews_count": len(ratings),
+                    "rating_sum": sum(ratings),
+                    **{f"rating_count_{stars}": ratings.count(stars) for stars in RATING_VALUES},
+                    "author_id": rng.choice(user_ids),
+                }
+            )
+            # Recipes go in before their reviews (foreign key)
+            if len(recipe_rows) >= self.batch_size or len(review_rows) >= self.batch_size:
+                total += self._flush_recipes(recipe_rows, review_rows)
+                recipe_rows, review_rows = [], []
+        total += self._flush_recipes(recipe_rows, review_rows)
+        self.echo(f"Recipes: {count}, reviews: {total}")
+        return range(first_id, first_id + count)
+
+    def _flush_recipes(self, recipe_rows: List[dict], review_rows: List[dict]) -> int:
+        self.insert(Recipe, recipe_rows)
+        return self.insert(Review, review_rows)
+
+    def images(self, count: int, recipe_ids: Sequence[int]) -> int:
+        """Image rows on random recipes, sharing a pool of stored pictures; blob refcounts match the rows."""
+        rng, first_id = self.rng, _next_id(self.connection, RecipeImage)
+        colors = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(min(count, PICTURE_POOL_SIZE))]
+        picks = [(rng.randrange(len(colors)), rng.choice(recipe_ids)) for _ in range(count)]
+        # Only the pictures some row uses are stored: a file without a blob row would never be deleted
+        pictures = {}
+        for i in sorted({picture for picture, _ in picks}):
+            picture = PILImage.new("RGB", (1600, 1200), colors[i])
+            # The index in the corner keeps pictures distinct even when colours repeat
+            picture.putpixel((0, 0), (i & 255, (i >> 8) & 255, 0))
+            data = io.BytesIO()
+            picture.save(data, "JPEG")
+            data.seek(0)
+            pictures[i] = storage.get_storage().save(data, ".jpg")
+        rows = []
+        references: Dict[str, int] = {}
+        for image_id, (picture, recipe_id) in zip(range(first_id, first_id + count), picks):
+            key, _ = pictures[picture]
+            references[key] = references.get(key, 0) + 1
+            rows.append(
+                {
+                    "id": image_id,
+                    "filename": key,
+                    "mime_type": "image/jpeg",
+                    "recipe_id": recipe_id,
+                    "updated_at": EPOCH,
+                }
+            )
+        sizes = dict(pictures.values())
+        existing = set()
+        if references:
+            query = db.select(Blob.key).where(Blob.key.in_(list(references)))
+            existing = set(self.connection.execute(query).scalars())
+        for key in existing:
+            self.connection.execute(
+                db.update(Blob).where(Blob.key == key).values(refcount=Blob.refcount + references[key])
+            )
+        self.insert(
+            Blob,
+            ({"key": key, "size": sizes[key], "refcount": n} for key, n in references.items() if key not in existing),
+        )
+        self.insert(RecipeImage, rows)
+        self.echo(f"Images: {count} ({len(pictures)} files); run 'flask make-thumbnails' for their srcset variants")
+        return count
+
+
+def seed(
+    users: int = 100_000,
+    recipes: int = 50_000,
+    reviews: int = 5_000_000,
+    images: int = 20_000,
+    seed: int = 0,
+    batch_size: int = 10_000,
+    password: str = "password",
+    echo: Callable[[str], None] = print,
+) -> None:
+    """Generate the dataset in the current database."""
+    with db.engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # The data can be generated again, so write speed matters more than durability
+            connection.exec_driver_sql("PRAGMA synchronous = OFF")
+        seeder = Seeder(connection, seed=seed, batch_size=batch_size, echo=echo)
+        user_ids = seeder.users(users, password)
+        recipe_ids = seeder.recipes(recipes, reviews, user_ids)
+        if images and recipe_ids:
+            seeder.images(images, recipe_ids)
+        # Table-level inserts skip the ORM hooks that keep the search index in sync
+        search.rebuild(connection)
+        connection.commit()
+        echo("Search index rebuilt")
+        if sqlite:
+            connection.exec_driver_sql("PRAGMA synchronous = FULL")
+            connection.exec_driver_sql("ANALYZE")
+            connection.commit()
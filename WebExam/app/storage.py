@@ -0,0 +1,231 @@
+"""Content-addressed file storage for uploads.
+
+A file's key is the hash of its bytes plus its extension, and it is stored
+under a two-level shard ("ab/cd/abcd….jpg"), so identical photos take the
+space of one and no directory grows past 256 entries. The same key never
+changes content, which is what lets /uploads serve blobs as immutable.
+
+Several rows may point at one blob; the `blobs` table counts them, and a
+blob is deleted only when its last reference goes away.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import tempfile
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+from flask import Response, current_app
+from werkzeug.utils import import_string
+
+from .delivery import send_stored_file
+from .extensions import db
+from .models import Blob
+
+CHUNK_SIZE = 64 * 1024
+# S3 uploads are buffered in memory up to this size, then in a temp file
+S3_SPOOL_SIZE = 8 * 1024 * 1024
+BLOB_KEY_RE = re.compile(r"^[0-9a-f]{32}(\.[a-z0-9]+)?$")
+
+
+def content_hash():
+    # blake2b is faster than sha256/md5 in hashlib and 128 bits is plenty for deduplication
+    return hashlib.blake2b(digest_size=16)
+
+
+def shard(key: str) -> str:
+    return f"{key[:2]}/{key[2:4]}/{key}"
+
+
+def _copy_hashing(stream: BinaryIO, target: BinaryIO) -> Tuple[str, int]:
+    digest = content_hash()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *shard(key).split("/"))
+
+    def save(self, stream: BinaryIO, suffix: str = "") -> Tuple[str, int]:
+        """Store the stream in one pass (hash while writing a temp file, then rename) and return (key, size)."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                file_hash, size = _copy_hashing(stream, tmp)
+            key = file_hash + suffix
+            path = self.path(key)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return key, size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def send(self, key: str, max_age: Optional[int] = None) -> Response:
+        return send_stored_file("uploads", self.root, shard(key), max_age=max_age)
+
+
+class S3Storage:
+    """The same layout in a bucket of any S3-compatible service (AWS, MinIO, ...).
+
+    `client` is a boto3 S3 client, or anything with its head_object,
+    put_object, get_object and delete_object methods.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = ""):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + shard(key)
+
+    def save(self, stream: BinaryIO, suffix: str = "") -> Tuple[str, int]:
+        with tempfile.SpooledTemporaryFile(max_size=S3_SPOOL_SIZE) as spool:
+            file_hash, size = _copy_hashing(stream, spool)
+            key = file_hash + suffix
+            if not self.exists(key):
+                spool.seek(0)
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.object_key(key),
+                    Body=spool,
+                    ContentType=mimetypes.guess_type(key)[0] or "application/octet-stream",
+                )
+        return key, size
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self.client.exceptions.ClientError as err:
+            if err.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def open(self, key: str) -> BinaryIO:
+        # Pillow needs a seekable file; S3 response bodies are not
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+        return io.BytesIO(body.read())
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def send(self, key: str, max_age: Optional[int] = None) -> Response:
+        obj = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        response = Response(
+            iter(lambda: obj["Body"].read(CHUNK_SIZE), b""),
+            mimetype=obj.get("ContentType") or "application/octet-stream",
+            direct_passthrough=True,
+        )
+        response.content_length = obj["ContentLength"]
+        if max_age is not None:
+            response.cache_control.max_age = max_age
+        return response
+
+
+def create_storage(config):
+    """STORAGE_TYPE: "local" (UPLOAD_FOLDER), "s3" (needs boto3) or an import path to a factory(config)."""
+    storage_type = config.get("STORAGE_TYPE", "local")
+    if storage_type == "local":
+        return LocalStorage(config["UPLOAD_FOLDER"])
+    if storage_type == "s3":
+        import boto3
+
+        client = boto3.client("s3", endpoint_url=config.get("S3_ENDPOINT_URL"))
+        return S3Storage(client, config["S3_BUCKET"], config.get("S3_PREFIX", ""))
+    return import_string(storage_type)(config)
+
+
+def init_storage(app) -> None:
+    app.extensions["storage"] = create_storage(app.config)
+
+
+def get_storage():
+    return current_app.extensions["storage"]
+
+
+def add_reference(key: str, size: int) -> bool:
+    """Count one more row pointing at `key` (part of the caller's transaction); True if the blob is new."""
+    updated = db.session.execute(
+        db.update(Blob).where(Blob.key == key).values(refcount=Blob.refcount + 1)
+    ).rowcount
+    if updated:
+        return False
+    db.session.add(Blob(key=key, size=size, refcount=1))
+    db.session.flush()
+    return True
+
+
+def store(stream: BinaryIO, suffix: str = "") -> str:
+    """Save a seekable stream and take a reference to it; returns the key."""
+    storage = get_storage()
+    key, size = storage.save(stream, suffix)
+    if add_reference(key, size) and not storage.exists(key):
+        # delete_unreferenced() removed the file between save() and our row insert: write it again
+        stream.seek(0)
+        storage.save(stream, suffix)
+    return key
+
+
+def release(keys: Iterable[str]) -> None:
+    """Drop one reference per key (a key may repeat); part of the caller's transaction."""
+    for key in keys:
+        db.session.execute(db.update(Blob).where(Blob.key == key).values(refcount=Blob.refcount - 1))
+
+
+def delete_unreferenced(keys: Iterable[str]) -> List[str]:
+    """After commit: delete the blobs among `keys` that nothing points at any more.
+
+    Each row is deleted (if still unreferenced) and its file removed before
+    that transaction commits, so store() of the same bytes either finds the
+    row alive or inserts a new one after the file is gone and rewrites it.
+    """
+    storage = get_storage()
+    deleted = []
+    for key in set(keys):
+        removed = db.session.execute(db.delete(Blob).where(Blob.key == key, Blob.refcount <= 0)).rowcount
+        if removed:
+            storage.delete(key)
+            deleted.append(key)
+        db.session.commit()
+    return deleted
+
+
+def discard(keys: Iterable[str]) -> List[str]:
+    """After a rollback: delete the blobs among `keys` that store() wrote but no committed row points at.
+
+    The rollback took the blob rows of new files with it, so those keys get an
+    unreferenced row back (the size does not matter, it is deleted at once) and
+    go through delete_unreferenced(); blobs other rows use keep their counts.
+    """
+    keys = set(keys)
+    if not keys:
+        return []
+    known = set(db.session.scalars(db.select(Blob.key).where(Blob.key.in_(keys))))
+    db.session.add_all(Blob(key=key, size=0, refcount=0) for key in keys - known)
+    db.session.commit()
+    return delete_unreferenced(keys)
@@ -0,0 +1,51 @@
+"""Background tasks run by `flask worker` (see app/jobs.py); each can safely run twice."""
+import os
+from datetime import datetime
+from typing import Iterable, List
+
+from flask import current_app
+
+from . import storage
+from .extensions import cache, db
+from .images import ImageDecodeError, make_variants
+from .jobs import task
+from .models import Recipe, RecipeImage
+
+
+def touch_recipes(recipe_ids: Iterable[int]) -> None:
+    """Commit, moving the ETags of these recipes' pages and dropping them from the page cache."""
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        db.session.execute(db.update(Recipe).where(Recipe.id.in_(recipe_ids)).values(updated_at=datetime.utcnow()))
+    db.session.commit()
+    cache.invalidate(*(f"recipe:{recipe_id}" for recipe_id in recipe_ids))
+
+
+@task
+def make_image_variants(image_id: int) -> None:
+    """Create the srcset variants of an upload, replacing the ones it has."""
+    image = db.session.get(RecipeImage, image_id)
+    if image is None:
+        # The recipe was deleted before the job ran
+        return
+    old_keys = [v.filename for v in image.variants if storage.BLOB_KEY_RE.match(v.filename)]
+    try:
+        with storage.get_storage().open(image.filename) as source:
+            image.variants = make_variants(source, current_app.config["IMAGE_VARIANT_WIDTHS"])
+    except ImageDecodeError:
+        current_app.logger.warning("Upload %s is not a decodable image; serving the original", image.filename)
+        return
+    storage.release(old_keys)
+    touch_recipes([image.recipe_id])
+    storage.delete_unreferenced(old_keys)
+
+
+@task
+def delete_uploads(blob_keys: List[str], legacy_names: List[str]) -> None:
+    """Remove the files of a deleted recipe: blobs nothing references any more and its old flat-layout files."""
+    storage.delete_unreferenced(blob_keys)
+    for name in legacy_names:
+        try:
+            os.remove(os.path.join(current_app.config["UPLOAD_FOLDER"], name))
+        except FileNotFoundError:
+            pass
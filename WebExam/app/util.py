@@ -1,6 +1,11 @@
+import hashlib
+from typing import Iterable, List
+
 import bleach
 import markdown as md
 
+from .instrumentation import timed
+
 ALLOWED_TAGS = list(bleach.sanitizer.ALLOWED_TAGS) + [
     "p",
     "pre",
@@ -29,8 +34,28 @@ ALLOWED_ATTRS = {
     "a": ["href", "title", "name", "target", "rel"],
     "img": ["src", "alt", "title"],
 }
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists", "tables", "fenced_code"]
+
+
+def _renderer_version() -> str:
+    # Anything that changes the produced HTML must be part of the fingerprint,
+    # so stored HTML goes stale automatically when the whitelist is edited.
+    fingerprint = repr(
+        (
+            md.__version__,
+            bleach.__version__,
+            MARKDOWN_EXTENSIONS,
+            sorted(ALLOWED_TAGS),
+            sorted((tag, sorted(attrs)) for tag, attrs in ALLOWED_ATTRS.items()),
+        )
+    )
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
 
 
+RENDERER_VERSION = _renderer_version()
+
+
+@timed("md")
 def sanitize_markdown_text(text: str) -> str:
     if not text:
         return ""
@@ -38,13 +63,19 @@ def sanitize_markdown_text(text: str) -> str:
     return bleach.clean(text, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
 
 
+@timed("md")
 def render_markdown_to_html(markdown_text: str) -> str:
     if not markdown_text:
         return ""
     html = md.markdown(
         markdown_text,
-        extensions=["extra", "sane_lists", "tables", "fenced_code"],
+        extensions=MARKDOWN_EXTENSIONS,
         output_format="html5",
     )
     # Double-sanitize in case the markdown produced unexpected HTML
     return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS, strip=True)
+
+
+def render_markdown_many(texts: Iterable[str]) -> List[str]:
+    # Top-level so it can be shipped to ProcessPoolExecutor workers
+    return [render_markdown_to_html(t) for t in texts]
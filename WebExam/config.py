@@ -9,15 +9,67 @@ class Config:
     # Force SQLite for local run
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'app.db')}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Debug only: print every statement to stdout. Normally the query count and DB time are in
+    # the Server-Timing header, and statements slower than SLOW_QUERY_MS are logged with their plan
+    SQLALCHEMY_ECHO = os.environ.get("SQLALCHEMY_ECHO") == "1"
+    SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+    SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS", 100))
+    SLOW_QUERY_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_SAMPLE_RATE", 1.0))
 
     UPLOAD_FOLDER = os.environ.get(
         "UPLOAD_FOLDER",
         os.path.join(BASE_DIR, "uploads"),
     )
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
+    # Who sends upload bytes: "direct" (the app, sendfile + Range), "x-accel" (nginx via
+    # X-Accel-Redirect, see deploy/nginx.conf) or "x-sendfile" (Apache/lighttpd)
+    FILE_DELIVERY = os.environ.get("FILE_DELIVERY", "direct")
+    X_ACCEL_LOCATIONS = {"uploads": "/_protected/uploads/"}
+    # Uploads are stored by content hash: "local" shards them under UPLOAD_FOLDER,
+    # "s3" puts them in an S3-compatible bucket (needs boto3; MinIO works as a local stand-in)
+    STORAGE_TYPE = os.environ.get("STORAGE_TYPE", "local")
+    S3_BUCKET = os.environ.get("S3_BUCKET")
+    S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+    S3_PREFIX = os.environ.get("S3_PREFIX", "uploads/")
+    # Widths (px) of the WebP/JPEG copies made from each upload for srcset
+    IMAGE_VARIANT_WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(","))
+
+    # Background jobs (`flask worker`): a running job is re-claimed after the lease if its worker died;
+    # failures are retried after JOB_RETRY_DELAY seconds, doubling each attempt
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 300))
+    JOB_RETRY_DELAY = int(os.environ.get("JOB_RETRY_DELAY", 10))
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
 
     # Pagination
     RECIPES_PER_PAGE = int(os.environ.get("RECIPES_PER_PAGE", 10))
+    REVIEWS_PER_PAGE = int(os.environ.get("REVIEWS_PER_PAGE", 20))
+    # Prev/next by cursor (no OFFSET, no COUNT); ?page=N still serves numbered pages
+    KEYSET_PAGINATION = os.environ.get("KEYSET_PAGINATION", "1") == "1"
+
+    # Cache: "null" (off), "simple" (per-process L1 only) or "sqlite" (L1 + an L2 file shared by all workers)
+    CACHE_TYPE = os.environ.get("CACHE_TYPE", "sqlite")
+    CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", os.path.join(BASE_DIR, "cache.db"))
+    CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", 300))
+    CACHE_L1_MAX_ENTRIES = int(os.environ.get("CACHE_L1_MAX_ENTRIES", 1024))
+    # Prometheus metrics at /metrics: each worker writes its values to a file in METRICS_DIR
+    # every METRICS_FLUSH_INTERVAL seconds and /metrics sums the files of all workers
+    METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(BASE_DIR, "metrics"))
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1.0))
+    # cProfile captures of requests sent with "X-Profile: <PROFILER_TOKEN>" or sampled per endpoint
+    # ({"recipes.index": 0.01}); see app/profiler.py and `flask profiles list|diff|folded`
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "1"
+    PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+    PROFILE_SAMPLE_RATES = {}
+    PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+    PROFILE_MAX_CAPTURES = int(os.environ.get("PROFILE_MAX_CAPTURES", 50))
+    # Deployed version (e.g. the commit hash), recorded in profile captures
+    RELEASE = os.environ.get("RELEASE", "")
+    # Whole-page cache for logged-out visitors, purged by surrogate keys on writes; opt-in (PAGE_CACHE=1)
+    PAGE_CACHE = os.environ.get("PAGE_CACHE") == "1"
+    PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 60))
+    # In-process cache for {% cache %} template fragments; 0 disables it
+    FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get("FRAGMENT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+    FRAGMENT_CACHE_TTL = int(os.environ.get("FRAGMENT_CACHE_TTL", 3600))
 
 
 config = Config()
@@ -0,0 +1,37 @@
+"""recipe image variants
+
+Revision ID: 3b6f9d2e4a71
+Revises: 5e7a3c9d1b48
+Create Date: 2026-10-17 19:02:13.518307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b6f9d2e4a71'
+down_revision = '5e7a3c9d1b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recipe_image_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('mime_type', sa.String(length=127), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['image_id'], ['recipe_images.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('recipe_image_variants', schema=None) as batch_op:
+        batch_op.create_index('ix_recipe_image_variants_image_id', ['image_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipe_image_variants', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_image_variants_image_id')
+    op.drop_table('recipe_image_variants')
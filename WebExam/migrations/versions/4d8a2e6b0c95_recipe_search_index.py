@@ -0,0 +1,37 @@
+"""recipe search index
+
+Revision ID: 4d8a2e6b0c95
+Revises: 9f61b2d4e8a0
+Create Date: 2026-10-17 14:58:10.402167
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8a2e6b0c95'
+down_revision = '9f61b2d4e8a0'
+branch_labels = None
+depends_on = None
+
+
+def _normalize(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def upgrade():
+    # SQLite FTS5 table kept in sync by the Recipe mapper hooks (see app/search.py)
+    op.execute(
+        "CREATE VIRTUAL TABLE recipes_fts "
+        "USING fts5(title, description, ingredients, tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "INSERT INTO recipes_fts (rowid, title, description, ingredients) "
+        f"SELECT id, {_normalize('title')}, {_normalize('description_md')}, {_normalize('ingredients_md')} "
+        "FROM recipes"
+    )
+
+
+def downgrade():
+    op.execute("DROP TABLE recipes_fts")
@@ -0,0 +1,41 @@
+"""updated_at
+
+Revision ID: 5e7a3c9d1b48
+Revises: c81f3d5a9e42
+Create Date: 2026-10-17 18:20:41.602114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a3c9d1b48'
+down_revision = 'c81f3d5a9e42'
+branch_labels = None
+depends_on = None
+
+# Existing rows have not changed since they were created
+BACKFILL = {
+    'recipes': "UPDATE recipes SET updated_at = created_at",
+    'reviews': "UPDATE reviews SET updated_at = created_at",
+    'recipe_images': (
+        "UPDATE recipe_images SET updated_at = "
+        "(SELECT created_at FROM recipes WHERE recipes.id = recipe_images.recipe_id)"
+    ),
+}
+
+
+def upgrade():
+    for table, backfill in BACKFILL.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(backfill)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    for table in reversed(list(BACKFILL)):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,29 @@
+"""blobs
+
+Revision ID: 6c2e8a4f1d93
+Revises: 3b6f9d2e4a71
+Create Date: 2026-10-17 20:11:37.240519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2e8a4f1d93'
+down_revision = '3b6f9d2e4a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('blobs')
@@ -0,0 +1,41 @@
+"""rendered markdown html
+
+Revision ID: 7c3e91a0d2b4
+Revises: 41248d8f491f
+Create Date: 2026-10-17 10:12:44.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e91a0d2b4'
+down_revision = '41248d8f491f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Columns start out NULL; fill them with `flask render-markdown`.
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('description_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('ingredients_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('steps_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('html_version', sa.String(length=16), nullable=True))
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_html', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('html_version', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_column('html_version')
+        batch_op.drop_column('text_html')
+
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.drop_column('html_version')
+        batch_op.drop_column('steps_html')
+        batch_op.drop_column('ingredients_html')
+        batch_op.drop_column('description_html')
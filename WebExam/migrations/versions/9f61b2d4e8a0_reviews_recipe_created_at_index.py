@@ -0,0 +1,26 @@
+"""reviews recipe_id created_at index
+
+Revision ID: 9f61b2d4e8a0
+Revises: e2a4c7f19b53
+Create Date: 2026-10-17 13:41:52.330871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f61b2d4e8a0'
+down_revision = 'e2a4c7f19b53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_recipe_id_created_at', ['recipe_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_recipe_id_created_at')
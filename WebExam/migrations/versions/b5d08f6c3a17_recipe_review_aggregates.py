@@ -0,0 +1,42 @@
+"""recipe review aggregates
+
+Revision ID: b5d08f6c3a17
+Revises: 7c3e91a0d2b4
+Create Date: 2026-10-17 11:03:27.904615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5d08f6c3a17'
+down_revision = '7c3e91a0d2b4'
+branch_labels = None
+depends_on = None
+
+AGGREGATE_COLUMNS = ['reviews_count', 'rating_sum'] + [f'rating_count_{stars}' for stars in range(0, 6)]
+
+
+def upgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        for name in AGGREGATE_COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from existing reviews; afterwards `flask reconcile-reviews` repairs drift
+    op.execute(
+        "UPDATE recipes SET "
+        "reviews_count = (SELECT COUNT(*) FROM reviews WHERE reviews.recipe_id = recipes.id), "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.recipe_id = recipes.id), "
+        + ", ".join(
+            f"rating_count_{stars} = (SELECT COUNT(*) FROM reviews "
+            f"WHERE reviews.recipe_id = recipes.id AND reviews.rating = {stars})"
+            for stars in range(0, 6)
+        )
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        for name in reversed(AGGREGATE_COLUMNS):
+            batch_op.drop_column(name)
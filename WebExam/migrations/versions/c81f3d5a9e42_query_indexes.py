@@ -0,0 +1,28 @@
+"""query indexes
+
+Revision ID: c81f3d5a9e42
+Revises: 4d8a2e6b0c95
+Create Date: 2026-10-17 15:47:18.093561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3d5a9e42'
+down_revision = '4d8a2e6b0c95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # recipes(created_at, id) and reviews(recipe_id, created_at, id) come with
+    # the pagination revisions; recipe.images was still a full scan per view
+    with op.batch_alter_table('recipe_images', schema=None) as batch_op:
+        batch_op.create_index('ix_recipe_images_recipe_id', ['recipe_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipe_images', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipe_images_recipe_id')
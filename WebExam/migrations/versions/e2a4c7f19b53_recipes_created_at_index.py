@@ -0,0 +1,26 @@
+"""recipes created_at index
+
+Revision ID: e2a4c7f19b53
+Revises: b5d08f6c3a17
+Create Date: 2026-10-17 12:20:05.117934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a4c7f19b53'
+down_revision = 'b5d08f6c3a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.create_index('ix_recipes_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recipes', schema=None) as batch_op:
+        batch_op.drop_index('ix_recipes_created_at_id')
@@ -0,0 +1,83 @@
+import io
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app, storage
+from app.extensions import db
+from app.models import Recipe, RecipeImage, Role, User
+
+# Route budget plugin (tests/query_budget.py): the --update-budgets option and the query_budget
+# and query_plans fixtures
+from query_budget import pytest_addoption, query_budget, query_plans  # noqa: F401
+
+
+@pytest.fixture
+def app(tmp_path):
+    # The data cache works as in production (warmed by the first request); page and fragment
+    # caches are off, otherwise the route's queries and rendering would not run at all
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SQLALCHEMY_ECHO": False,
+            "CACHE_TYPE": "simple",
+            "PAGE_CACHE": False,
+            "FRAGMENT_CACHE_MAX_BYTES": 0,
+            "SLOW_QUERY_MS": 10**6,
+            "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+            "METRICS_DIR": str(tmp_path / "metrics"),
+            "PROFILE_DIR": str(tmp_path / "profiles"),
+            "SECRET_KEY": "test-secret-key",
+        }
+    )
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def author(app):
+    """A regular user with the password "password" (a cheap hash, so logging in is fast)."""
+    user = User(
+        username="author",
+        password_hash=generate_password_hash("password", method="pbkdf2:sha256:1000"),
+        last_name="Автор",
+        first_name="Рецептов",
+        role=Role(name="user", description="Пользователь"),
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def make_recipe(author):
+    """make_recipe(*uploads): a committed recipe by `author` with one image per upload (bytes, extension)."""
+
+    def make(*uploads):
+        recipe = Recipe(
+            title="Рецепт",
+            description_md="Описание",
+            ingredients_md="- мука",
+            steps_md="1. Испечь",
+            cook_time_min=30,
+            servings=4,
+            author_id=author.id,
+        )
+        recipe.render_html()
+        for data, extension in uploads:
+            key = storage.store(io.BytesIO(data), extension)
+            recipe.images.append(RecipeImage(filename=key, mime_type="image/jpeg"))
+        db.session.add(recipe)
+        db.session.commit()
+        return recipe
+
+    return make
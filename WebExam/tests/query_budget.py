@@ -0,0 +1,192 @@
+"""Per-route budgets: SQL query count, rows fetched and response time.
+
+Budgets live in budgets.json next to the tests. After a deliberate change to a
+route, re-measure them and commit the file together with the change:
+
+    pytest tests/test_budgets.py --update-budgets
+
+The query_plans fixture records statements instead and checks with EXPLAIN
+QUERY PLAN that none of them reads a whole table.
+"""
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "budgets.json")
+# Headroom written by --update-budgets: query counts are exact, rows grow with the fixture
+# data, and time depends on the machine, so it only catches gross regressions
+ROWS_HEADROOM = 1.1
+MS_HEADROOM = 3
+MS_MIN = 200
+
+
+class RouteMeasurement:
+    """Statements run by one request and its response time."""
+
+    def __init__(self):
+        # (statement, parameters, rows fetched or None for writes)
+        self.statements: List[Tuple[str, object, Optional[int]]] = []
+        self.ms = 0.0
+
+    @property
+    def queries(self) -> int:
+        return len(self.statements)
+
+    @property
+    def rows(self) -> int:
+        return sum(rows or 0 for _, _, rows in self.statements)
+
+    def as_budget(self) -> Dict[str, int]:
+        return {
+            "queries": self.queries,
+            "rows": math.ceil(self.rows * ROWS_HEADROOM),
+            "ms": max(MS_MIN, math.ceil(self.ms * MS_HEADROOM)),
+        }
+
+    def report(self) -> str:
+        return "\n\n".join(
+            f"[{i}] {'-' if rows is None else rows} rows\n{statement}\nParameters: {parameters!r}"
+            for i, (statement, parameters, rows) in enumerate(self.statements, 1)
+        )
+
+
+class QueryBudget:
+    """Measures test-client requests and checks them against budgets.json."""
+
+    def __init__(self, budgets: Dict[str, Dict[str, int]], update: bool = False):
+        self.budgets = budgets
+        self.update = update
+        self.measured: Dict[str, Dict[str, int]] = {}
+        self._current: Optional[RouteMeasurement] = None
+        self._overhead = 0.0
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current is None or statement.startswith("EXPLAIN"):
+            return
+        rows = None
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            # A raw DBAPI cursor: the count is neither measured nor in Server-Timing,
+            # and it sees the same data as the statement (same transaction)
+            started = time.perf_counter()
+            counter = conn.connection.dbapi_connection.cursor()
+            try:
+                counter.execute(f"SELECT count(*) FROM ({statement}) AS budget_rows", parameters)
+                rows = counter.fetchone()[0]
+            finally:
+                counter.close()
+            self._overhead += time.perf_counter() - started
+        self._current.statements.append((statement, parameters, rows))
+
+    def measure(self, client, method: str, url: str, **kwargs):
+        """Run a request through the test client; returns (response, RouteMeasurement)."""
+        self._current, self._overhead = RouteMeasurement(), 0.0
+        event.listen(db.engine, "after_cursor_execute", self._after_cursor_execute)
+        try:
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(db.engine, "after_cursor_execute", self._after_cursor_execute)
+        measurement, self._current = self._current, None
+        measurement.ms = (elapsed - self._overhead) * 1000
+        return response, measurement
+
+    def check(self, name: str, measurement: RouteMeasurement) -> None:
+        """Fail with the statement list when the route is over budget."""
+        if self.update:
+            self.measured[name] = measurement.as_budget()
+            return
+        budget = self.budgets.get(name)
+        if budget is None:
+            pytest.fail(
+                f"No budget for {name} in {os.path.basename(BUDGETS_PATH)}: run the tests with --update-budgets",
+                pytrace=False,
+            )
+        actual = {"queries": measurement.queries, "rows": measurement.rows, "ms": round(measurement.ms, 1)}
+        exceeded = [f"  {key}: {actual[key]} over budget {limit}" for key, limit in budget.items() if actual[key] > limit]
+        if exceeded:
+            pytest.fail("\n".join([f"{name}: over budget", *exceeded, "", measurement.report()]), pytrace=False)
+
+
+class QueryPlanRecorder:
+    """Records executed statements and checks their plans with EXPLAIN QUERY PLAN (SQLite)."""
+
+    FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+    # The table a plan reads first, and the step that sorts instead of reading an index in order
+    FIRST_TABLE = re.compile(r"^(?:SCAN|SEARCH) (\w+)")
+    TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[Tuple[str, object]] = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.startswith("EXPLAIN"):
+            self.statements.append((statement, parameters))
+
+    def full_scans(self, allowed_tables=(), ordered_tables=()) -> List[Tuple[str, List[str]]]:
+        """Statements with a WHERE clause whose plan reads a whole table, or sorts rows of ordered_tables."""
+        tables = set(db.metadata.tables) - set(allowed_tables)
+        offenders = []
+        with self.engine.connect() as connection:
+            for statement, parameters in self.statements:
+                # A select without conditions (the listing, a count of everything) scans on purpose
+                if not re.search(r"\bWHERE\b", statement):
+                    continue
+                plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+                scanned = [m.group(1) for row in plan if (m := self.FULL_SCAN.match(row[-1]))]
+                first = self.FIRST_TABLE.match(plan[0][-1]) if plan else None
+                sorted_ = first and first.group(1) in ordered_tables and any(row[-1] == self.TEMP_SORT for row in plan)
+                if sorted_ or any(table in tables for table in scanned):
+                    offenders.append((statement, [row[-1] for row in plan]))
+        return offenders
+
+    def assert_no_full_scans(self, allowed_tables=(), ordered_tables=()) -> None:
+        offenders = self.full_scans(allowed_tables, ordered_tables)
+        assert not offenders, "Full table scan:\n" + "\n\n".join(
+            f"{statement}\n  -> " + "\n  -> ".join(plan) for statement, plan in offenders
+        )
+
+
+def load_budgets() -> Dict[str, Dict[str, int]]:
+    try:
+        with open(BUDGETS_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_budgets(budgets: Dict[str, Dict[str, int]]) -> None:
+    with open(BUDGETS_PATH, "w", encoding="utf-8") as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-budgets", action="store_true", help="Write route measurements to tests/budgets.json instead of checking"
+    )
+
+
+@pytest.fixture(scope="session")
+def query_budget(request):
+    budget = QueryBudget(load_budgets(), update=request.config.getoption("--update-budgets"))
+    yield budget
+    if budget.update and budget.measured:
+        save_budgets({**budget.budgets, **budget.measured})
+
+
+@pytest.fixture
+def query_plans(app):
+    recorder = QueryPlanRecorder(db.engine)
+    event.listen(db.engine, "before_cursor_execute", recorder.before_cursor_execute)
+    yield recorder
+    event.remove(db.engine, "before_cursor_execute", recorder.before_cursor_execute)
@@ -0,0 +1,192 @@
+import io
+import re
+from collections import namedtuple
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import storage
+from app.extensions import db
+from app.models import Recipe, RecipeImage, RecipeImageVariant, Review, Role, User
+from query_budget import QueryBudget
+
+USERS = 40
+RECIPES = 30
+# More than one page of reviews (REVIEWS_PER_PAGE is 20)
+RECIPE_REVIEWS = 30
+
+
+@pytest.fixture
+def dataset(app):
+    """Dozens of users and recipes; the first recipe has images with variants and several pages of reviews."""
+    roles = [Role(name="user", description="Пользователь"), Role(name="admin", description="Администратор")]
+    # A cheap hash, so logging in does not spend the budget on scrypt
+    password_hash = generate_password_hash("password", method="pbkdf2:sha256:1000")
+    users = [
+        User(username=f"user{i}", password_hash=password_hash, last_name=f"Фамилия{i}", first_name=f"Имя{i}", role=roles[0])
+        for i in range(USERS)
+    ]
+    db.session.add_all(roles + users)
+    db.session.flush()
+    recipes = []
+    for i in range(RECIPES):
+        recipe = Recipe(
+            title=f"Рецепт {i}",
+            description_md=f"Описание рецепта **{i}**",
+            ingredients_md="- мука\n- молоко\n- яйца",
+            steps_md="1. Смешать\n2. Испечь",
+            cook_time_min=30,
+            servings=4,
+            author_id=users[i % 10].id,
+        )
+        recipe.render_html()
+        recipes.append(recipe)
+    db.session.add_all(recipes)
+    db.session.flush()
+    for i in range(2):
+        image = RecipeImage(filename=storage.store(io.BytesIO(b"jpeg %d" % i), ".jpg"), mime_type="image/jpeg")
+        image.variants = [
+            RecipeImageVariant(
+                filename=storage.store(io.BytesIO(b"%s %d" % (ext.encode(), i)), ext),
+                mime_type=mime_type,
+                width=320,
+                height=240,
+            )
+            for ext, mime_type in ((".jpg", "image/jpeg"), (".webp", "image/webp"))
+        ]
+        recipes[0].images.append(image)
+    # user0 has no reviews, so a new one is written on their behalf
+    reviews = [
+        Review(recipe_id=recipes[0].id, user_id=users[i].id, rating=i % 6, text_md=f"Отзыв {i}")
+        for i in range(1, RECIPE_REVIEWS + 1)
+    ]
+    reviews += [
+        Review(recipe_id=recipe.id, user_id=user.id, rating=4, text_md="Отзыв") for recipe in recipes[1:] for user in users[1:3]
+    ]
+    for review in reviews:
+        review.render_html()
+    db.session.add_all(reviews)
+    db.session.commit()
+    data = {
+        "recipe_id": recipes[0].id,
+        # Also by user0, but without images
+        "other_recipe_id": recipes[10].id,
+        "upload": recipes[0].images[0].filename,
+    }
+    db.session.expunge_all()
+    return data
+
+
+# login: sign in as user0 before measuring; warm_up: run the request once unmeasured first
+# (compiles templates, fills the data cache), only for requests without side effects
+Route = namedtuple("Route", "method url login data warm_up", defaults=(False, None, True))
+
+RECIPE_FORM = {
+    "title": "Новый рецепт",
+    "description_md": "Описание",
+    "ingredients_md": "- мука",
+    "steps_md": "1. Испечь",
+    "cook_time_min": "20",
+    "servings": "2",
+}
+
+# Keys match budgets.json: "<method> <URL rule>", with the variant in parentheses
+ROUTES = {
+    "GET /": Route("GET", "/"),
+    "GET / (login)": Route("GET", "/", login=True),
+    "GET /search": Route("GET", "/search?q=мука"),
+    "GET /uploads/<path:filename>": Route("GET", "/uploads/{upload}"),
+    "GET /recipes/<int:recipe_id>": Route("GET", "/recipes/{recipe_id}"),
+    "GET /recipes/<int:recipe_id> (login)": Route("GET", "/recipes/{recipe_id}", login=True),
+    "GET /recipes/<int:recipe_id>/reviews": Route("GET", "/recipes/{recipe_id}/reviews"),
+    "GET /recipes/create": Route("GET", "/recipes/create", login=True),
+    "POST /recipes/create": Route("POST", "/recipes/create", login=True, data=RECIPE_FORM, warm_up=False),
+    "GET /recipes/<int:recipe_id>/edit": Route("GET", "/recipes/{recipe_id}/edit", login=True),
+    "POST /recipes/<int:recipe_id>/edit": Route(
+        "POST", "/recipes/{recipe_id}/edit", login=True, data=RECIPE_FORM, warm_up=False
+    ),
+    "POST /recipes/<int:recipe_id>/delete": Route("POST", "/recipes/{other_recipe_id}/delete", login=True, warm_up=False),
+    "GET /reviews/create/<int:recipe_id>": Route("GET", "/reviews/create/{recipe_id}", login=True),
+    "POST /reviews/create/<int:recipe_id>": Route(
+        "POST", "/reviews/create/{recipe_id}", login=True, data={"rating": "5", "text_md": "Отлично"}, warm_up=False
+    ),
+    "GET /auth/login": Route("GET", "/auth/login"),
+    "POST /auth/login": Route("POST", "/auth/login", data={"username": "user0", "password": "password"}, warm_up=False),
+    "GET /auth/logout": Route("GET", "/auth/logout", login=True, warm_up=False),
+    "GET /auth/register": Route("GET", "/auth/register"),
+    "POST /auth/register": Route(
+        "POST",
+        "/auth/register",
+        data={"username": "newuser", "password": "password", "last_name": "Новый", "first_name": "Пользователь"},
+        warm_up=False,
+    ),
+    "GET /metrics": Route("GET", "/metrics"),
+}
+
+
+class TestRouteBudgets:
+    @pytest.mark.parametrize("name", ROUTES)
+    def test_within_budget(self, client, dataset, query_budget, name):
+        route = ROUTES[name]
+        url = route.url.format(**dataset)
+        if route.login:
+            # Following the redirect to the recipe list also warms the data cache (role names)
+            client.post("/auth/login", data={"username": "user0", "password": "password"}, follow_redirects=True)
+        if route.warm_up:
+            client.open(url, method=route.method, data=route.data)
+
+        response, measurement = query_budget.measure(client, route.method, url, data=route.data)
+
+        assert response.status_code < 400
+        query_budget.check(name, measurement)
+
+    def test_every_route_has_a_budget(self, app):
+        covered = {name.split(" (")[0] for name in ROUTES}
+        rules = {
+            f"{method} {rule.rule}"
+            for rule in app.url_map.iter_rules()
+            if rule.endpoint != "static"
+            for method in rule.methods - {"HEAD", "OPTIONS"}
+        }
+
+        assert rules - covered == set()
+
+    def test_reports_offending_queries(self, client, dataset):
+        budget = QueryBudget({"GET /": {"queries": 0, "rows": 1000}})
+
+        _, measurement = budget.measure(client, "GET", "/")
+        with pytest.raises(pytest.fail.Exception) as excinfo:
+            budget.check("GET /", measurement)
+
+        message = str(excinfo.value)
+        assert "queries: 1 over budget 0" in message
+        assert "rows:" not in message
+        assert "FROM recipes" in message
+
+
+class TestQueryPlans:
+    def test_hot_paths_use_indexes(self, client, dataset, query_plans):
+        recipe_id = dataset["recipe_id"]
+
+        index = client.get("/").get_data(as_text=True)
+        # The next page of the listing goes by a keyset cursor over (created_at, id)
+        after = re.search(r"[?&]after=([\w=-]+)", index).group(1)
+        client.get(f"/?after={after}")
+        client.get("/?sort=rating")
+        client.get(f"/recipes/{recipe_id}")
+        reviews = client.get(f"/recipes/{recipe_id}/reviews").get_data(as_text=True)
+        after = re.search(r"[?&]after=([\w=-]+)", reviews).group(1)
+        client.get(f"/recipes/{recipe_id}/reviews?after={after}")
+        client.get("/search?q=мука")
+        client.get("/search?q=Рецепт&ingredients=молоко&page=2")
+
+        assert len(query_plans.statements) > 10
+        # Keyset pages must come straight off the (created_at, id) and (recipe_id, created_at, id) indexes
+        query_plans.assert_no_full_scans(ordered_tables=("recipes", "reviews"))
+
+    def test_detects_full_scan(self, app, query_plans):
+        db.session.execute(db.select(Review).filter(Review.text_md == "x")).all()
+
+        assert [statement for statement, _ in query_plans.full_scans()] == [
+            statement for statement, _ in query_plans.statements
+        ]
@@ -0,0 +1,25 @@
+from flask import g
+
+from app import models
+
+
+class TestRoleNames:
+    def test_resolved_once_per_request(self, app, client, make_recipe, monkeypatch):
+        for _ in range(5):
+            make_recipe()
+        client.post("/auth/login", data={"username": "author", "password": "password"})
+        calls = []
+        role_names = models.role_names
+        monkeypatch.setattr(models, "role_names", lambda: calls.append(1) or role_names())
+        # The test's app context outlives requests, so g would carry the value over from the login
+        g.pop("role_names", None)
+
+        response = client.get("/")
+
+        assert response.status_code == 200
+        # Every card asks is_admin (edit/delete buttons), but the cache is consulted once
+        assert response.get_data(as_text=True).count("/edit") >= 5
+        assert len(calls) == 1
+
+    def test_outside_a_request(self, app, author):
+        assert author.is_admin is False
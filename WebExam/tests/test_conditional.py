@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def recipe_url(make_recipe):
+    return f"/recipes/{make_recipe().id}"
+
+
+class TestConditionalGet:
+    def test_not_modified(self, client, recipe_url):
+        etag = client.get(recipe_url).headers["ETag"]
+
+        response = client.get(recipe_url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert etag.startswith("W/")
+
+    def test_release_changes_etag(self, app, client, recipe_url):
+        etag = client.get(recipe_url).headers["ETag"]
+        app.config["RELEASE"] = "v2"
+
+        response = client.get(recipe_url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_template_change_changes_etag(self, app, client, recipe_url, monkeypatch):
+        etag = client.get(recipe_url).headers["ETag"]
+        loader = app.jinja_env.loader
+        get_source = loader.get_source
+
+        def edited(environment, name):
+            source, *rest = get_source(environment, name)
+            return (source + "<!-- edited -->", *rest)
+
+        monkeypatch.setattr(loader, "get_source", edited)
+        # A new process after the deploy fingerprints the templates again
+        app.extensions.pop("templates_version")
+
+        response = client.get(recipe_url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
@@ -0,0 +1,98 @@
+import io
+import os
+import re
+
+import pytest
+
+import config
+from app import storage
+from app.delivery import init_delivery
+from app.extensions import db
+from app.storage import shard
+
+PROJECT_ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+NGINX_CONF = os.path.join(PROJECT_ROOT, "deploy", "nginx.conf")
+
+
+@pytest.fixture
+def upload(app):
+    key = storage.store(io.BytesIO(b"\xff\xd8\xff photo"), ".jpg")
+    db.session.commit()
+    return key
+
+
+def nginx_locations():
+    """location blocks of the sample config: prefix -> block body."""
+    with open(NGINX_CONF, encoding="utf-8") as f:
+        conf = f.read()
+    return dict(re.findall(r"location\s+(?:=\s*)?(\S+)\s*\{([^}]*)\}", conf))
+
+
+class TestDirect:
+    def test_range_request(self, client, upload):
+        response = client.get(f"/uploads/{upload}", headers={"Range": "bytes=0-2"})
+
+        assert response.status_code == 206
+        assert response.data == b"\xff\xd8\xff"
+
+
+class TestXAccel:
+    @pytest.fixture(autouse=True)
+    def x_accel(self, app):
+        app.config["FILE_DELIVERY"] = "x-accel"
+
+    def test_upload_is_handed_to_nginx(self, client, upload):
+        response = client.get(f"/uploads/{upload}")
+
+        assert response.status_code == 200
+        assert response.headers["X-Accel-Redirect"] == "/_protected/uploads/" + shard(upload)
+        assert response.data == b""
+        assert response.mimetype == "image/jpeg"
+        assert response.cache_control.immutable
+        assert response.cache_control.public
+
+    def test_legacy_upload_is_handed_to_nginx(self, app, client):
+        with open(os.path.join(app.config["UPLOAD_FOLDER"], "old-photo.jpg"), "wb") as f:
+            f.write(b"legacy")
+
+        response = client.get("/uploads/old-photo.jpg")
+
+        assert response.headers["X-Accel-Redirect"] == "/_protected/uploads/old-photo.jpg"
+        assert not response.cache_control.immutable
+
+    def test_missing_file(self, client, upload):
+        storage.get_storage().delete(upload)
+
+        assert client.get(f"/uploads/{upload}").status_code == 404
+
+    def test_path_outside_the_folder(self, client):
+        assert client.get("/uploads/../config.py").status_code == 404
+
+
+class TestXSendfile:
+    def test_header_points_at_the_file(self, app, client, upload):
+        app.config["FILE_DELIVERY"] = "x-sendfile"
+        init_delivery(app)
+
+        response = client.get(f"/uploads/{upload}")
+
+        assert os.path.samefile(response.headers["X-Sendfile"], storage.get_storage().path(upload))
+
+
+class TestNginxConfig:
+    def test_internal_locations_match_config(self, app):
+        locations = nginx_locations()
+        folders = {"uploads": config.Config.UPLOAD_FOLDER}
+
+        for name, prefix in app.config["X_ACCEL_LOCATIONS"].items():
+            body = locations[prefix]
+            assert re.search(r"^\s*internal;", body, re.M), prefix
+            alias = re.search(r"alias\s+(\S+);", body).group(1)
+            # Both end with "/", so nginx appends the rest of the URI to the folder
+            assert prefix.endswith("/") and alias.endswith("/"), (prefix, alias)
+            # The alias folder is the one in config.py (relative to the project root)
+            expected = os.path.relpath(os.path.normpath(folders[name]), PROJECT_ROOT)
+            assert alias.rstrip("/").endswith("/" + expected.replace(os.sep, "/")), (alias, expected)
+
+    def test_app_is_proxied(self):
+        assert "proxy_pass" in nginx_locations()["/"]
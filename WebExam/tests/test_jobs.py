@@ -0,0 +1,198 @@
+import io
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+from app import jobs, storage, tasks
+from app.extensions import db
+from app.models import Blob, Job, Recipe, RecipeImage, RecipeImageVariant
+
+CALLS = []
+
+
+@jobs.task
+def record_call(value):
+    CALLS.append(value)
+
+
+@jobs.task(max_attempts=2)
+def always_fails():
+    raise RuntimeError("storage is down")
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    CALLS.clear()
+
+
+def queued():
+    return db.session.scalars(db.select(Job).order_by(Job.id)).all()
+
+
+def make_due(job_id):
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(run_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def jpeg(color="red", size=(200, 150)):
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, "JPEG")
+    return output.getvalue()
+
+
+def assert_refcounts_match_rows():
+    """Every blob counts exactly the rows pointing at it, and its file exists."""
+    names = db.session.scalars(db.select(RecipeImage.filename)).all()
+    names += db.session.scalars(db.select(RecipeImageVariant.filename)).all()
+    blobs = {blob.key: blob.refcount for blob in db.session.scalars(db.select(Blob))}
+    assert blobs == dict(Counter(names))
+    for key in blobs:
+        assert storage.get_storage().exists(key)
+
+
+class TestQueue:
+    def test_enqueued_job_runs_once(self, app):
+        jobs.enqueue(record_call, "a")
+        db.session.commit()
+
+        assert jobs.run_next() is True
+        assert jobs.run_next() is False
+        assert CALLS == ["a"]
+        assert queued() == []
+
+    def test_enqueue_is_part_of_the_transaction(self, app):
+        jobs.enqueue(record_call, "a")
+        db.session.rollback()
+
+        assert queued() == []
+
+    def test_unregistered_function_is_rejected(self, app):
+        with pytest.raises(ValueError):
+            jobs.enqueue(print, "a")
+
+    def test_lease_keeps_a_job_from_other_workers(self, app):
+        jobs.enqueue(record_call, "a")
+        db.session.commit()
+
+        first = jobs.claim()
+        assert jobs.claim() is None
+
+        # The worker died: once the lease runs out, the job is claimed again
+        db.session.execute(db.update(Job).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        second = jobs.claim()
+        assert (second.id, second.attempts) == (first.id, 2)
+
+    def test_failure_is_retried_with_backoff(self, app):
+        jobs.enqueue(always_fails)
+        db.session.commit()
+
+        assert jobs.run_next() is True
+
+        [job] = queued()
+        assert (job.state, job.attempts, job.locked_until) == ("queued", 1, None)
+        assert "storage is down" in job.last_error
+        # At least half of JOB_RETRY_DELAY (jitter), so it is not due yet
+        assert job.run_at > datetime.utcnow() + timedelta(seconds=app.config["JOB_RETRY_DELAY"] / 2 - 1)
+        assert jobs.run_next() is False
+
+    def test_job_fails_after_max_attempts(self, app):
+        jobs.enqueue(always_fails)
+        db.session.commit()
+        jobs.run_next()
+        make_due(queued()[0].id)
+
+        jobs.run_next()
+
+        [job] = queued()
+        assert (job.state, job.attempts) == ("failed", 2)
+        assert jobs.run_next() is False
+
+    def test_retry_failed(self, app):
+        jobs.enqueue(always_fails)
+        db.session.commit()
+        for _ in range(2):
+            make_due(queued()[0].id)
+            jobs.run_next()
+
+        assert jobs.retry_failed() == 1
+
+        db.session.expire_all()
+        [job] = queued()
+        assert (job.state, job.attempts) == ("queued", 0)
+        assert jobs.claim() is not None
+
+    def test_key_deduplicates_pending_jobs(self, app):
+        jobs.enqueue(record_call, "a", key="same")
+        jobs.enqueue(record_call, "b", key="same")
+        db.session.commit()
+
+        assert [job.args for job in queued()] == [["a"]]
+
+        jobs.run_next()
+        # Once the job is done, the key is free again
+        jobs.enqueue(record_call, "c", key="same")
+        db.session.commit()
+        assert [job.args for job in queued()] == [["c"]]
+
+    def test_key_blocks_while_failed(self, app):
+        jobs.enqueue(always_fails, key="same")
+        db.session.commit()
+        for _ in range(2):
+            make_due(queued()[0].id)
+            jobs.run_next()
+
+        jobs.enqueue(always_fails, key="same")
+        db.session.commit()
+
+        assert [job.state for job in queued()] == ["failed"]
+
+
+class TestTasks:
+    def test_make_image_variants_twice(self, app, make_recipe):
+        image_id = make_recipe((jpeg(), ".jpg")).images[0].id
+        for _ in range(2):
+            jobs.enqueue(tasks.make_image_variants, image_id)
+        db.session.commit()
+
+        while jobs.run_next():
+            pass
+
+        db.session.expire_all()
+        image = db.session.get(RecipeImage, image_id)
+        # A 200px upload is below every width, so one size in both formats
+        assert sorted((v.mime_type, v.width) for v in image.variants) == [("image/jpeg", 200), ("image/webp", 200)]
+        assert_refcounts_match_rows()
+        assert queued() == []
+
+    def test_make_image_variants_of_deleted_image(self, app):
+        jobs.enqueue(tasks.make_image_variants, 12345)
+        db.session.commit()
+
+        jobs.run_next()
+
+        assert queued() == []
+
+    def test_delete_uploads_twice(self, app, make_recipe):
+        recipe = make_recipe((jpeg(), ".jpg"))
+        key = recipe.images[0].filename
+        legacy = os.path.join(app.config["UPLOAD_FOLDER"], "old-photo.jpg")
+        with open(legacy, "wb") as f:
+            f.write(b"legacy")
+        db.session.delete(recipe)
+        storage.release([key])
+        for _ in range(2):
+            jobs.enqueue(tasks.delete_uploads, [key], ["old-photo.jpg"])
+        db.session.commit()
+
+        while jobs.run_next():
+            pass
+
+        assert queued() == []
+        assert not storage.get_storage().exists(key)
+        assert not os.path.exists(legacy)
+        assert db.session.scalars(db.select(Blob)).all() == []
+        assert db.session.scalars(db.select(Recipe)).all() == []
@@ -0,0 +1,146 @@
+import pytest
+
+from app.extensions import db
+from app.models import Recipe, Review
+from app.util import RENDERER_VERSION
+
+UNSAFE = '**Жирный** <script>alert(1)</script> [ссылка](javascript:alert(1)) <img src=x onerror="alert(1)">'
+
+RECIPE_FORM = {
+    "title": "Рецепт",
+    "description_md": UNSAFE,
+    "ingredients_md": "- мука",
+    "steps_md": "1. Испечь",
+    "cook_time_min": "30",
+    "servings": "4",
+}
+
+
+def assert_sanitized(html):
+    assert "<strong>Жирный</strong>" in html
+    assert "<script" not in html
+    assert "javascript:" not in html
+    assert "onerror" not in html
+
+
+@pytest.fixture
+def logged_in(client, author):
+    client.post("/auth/login", data={"username": "author", "password": "password"})
+    return client
+
+
+class TestStoredHtml:
+    def test_create(self, logged_in):
+        logged_in.post("/recipes/create", data=RECIPE_FORM)
+
+        recipe = db.session.scalars(db.select(Recipe)).one()
+        assert_sanitized(recipe.description_html)
+        assert recipe.ingredients_html == "<ul>\n<li>мука</li>\n</ul>"
+        assert recipe.html_version == RENDERER_VERSION
+
+    def test_edit(self, logged_in, make_recipe):
+        recipe = make_recipe()
+
+        logged_in.post(f"/recipes/{recipe.id}/edit", data={**RECIPE_FORM, "steps_md": "1. Смешать\n2. Испечь"})
+
+        db.session.refresh(recipe)
+        assert_sanitized(recipe.description_html)
+        assert "<li>Смешать</li>" in recipe.steps_html
+        assert recipe.html_version == RENDERER_VERSION
+
+    def test_review(self, client, make_recipe):
+        recipe = make_recipe()
+        client.post("/auth/login", data={"username": "author", "password": "password"})
+
+        client.post(f"/reviews/create/{recipe.id}", data={"rating": "5", "text_md": UNSAFE})
+
+        review = db.session.scalars(db.select(Review)).one()
+        assert_sanitized(review.text_html)
+        assert review.html_version == RENDERER_VERSION
+
+
+class TestRenderMarkdownCommand:
+    @pytest.fixture
+    def rows(self, make_recipe):
+        """A current recipe and review whose stored HTML is marked, and a stale recipe and review."""
+        current, stale = make_recipe(), make_recipe()
+        reviews = [
+            Review(recipe_id=recipe.id, user_id=recipe.author_id, rating=5, text_md="*Отзыв*") for recipe in (current, stale)
+        ]
+        for review in reviews:
+            review.render_html()
+        db.session.add_all(reviews)
+        db.session.commit()
+        # A marker in the current rows shows whether the command touched them
+        db.session.execute(
+            db.update(Recipe).where(Recipe.id == current.id).values(description_html="<p>не трогать</p>")
+        )
+        db.session.execute(db.update(Review).where(Review.id == reviews[0].id).values(text_html="<p>не трогать</p>"))
+        db.session.execute(
+            db.update(Recipe).where(Recipe.id == stale.id).values(description_html="<p>старое</p>", html_version="old")
+        )
+        db.session.execute(db.update(Review).where(Review.id == reviews[1].id).values(text_html=None, html_version=None))
+        db.session.commit()
+        return current, stale, reviews
+
+    def run(self, app, *args):
+        result = app.test_cli_runner().invoke(args=["render-markdown", "--workers", "1", *args])
+        assert result.exit_code == 0, result.output
+        db.session.expire_all()
+        return result.output
+
+    def test_renders_only_stale_rows(self, app, rows):
+        current, stale, (current_review, stale_review) = rows
+
+        output = self.run(app)
+
+        assert "recipes: 1 rows rendered" in output
+        assert "reviews: 1 rows rendered" in output
+        assert (current.description_html, current_review.text_html) == ("<p>не трогать</p>", "<p>не трогать</p>")
+        assert stale.description_html == "<p>Описание</p>"
+        assert stale_review.text_html == "<p><em>Отзыв</em></p>"
+        assert {stale.html_version, stale_review.html_version} == {RENDERER_VERSION}
+
+    def test_nothing_left_after_a_run(self, app, rows):
+        self.run(app)
+
+        assert "recipes: 0 rows rendered" in self.run(app)
+
+    def test_force(self, app, rows):
+        current, _, _ = rows
+
+        output = self.run(app, "--force")
+
+        assert "recipes: 2 rows rendered" in output
+        assert current.description_html == "<p>Описание</p>"
+
+
+class TestTemplates:
+    @pytest.fixture
+    def no_rendering(self, app, monkeypatch):
+        """Fails the test if a template renders Markdown instead of using the stored HTML."""
+        calls = []
+        monkeypatch.setitem(app.jinja_env.filters, "markdown", lambda text: calls.append(text) or "")
+        return calls
+
+    def test_pages_use_stored_html(self, client, make_recipe, no_rendering):
+        recipe = make_recipe()
+        review = Review(recipe_id=recipe.id, user_id=recipe.author_id, rating=5, text_md="Отзыв")
+        review.render_html()
+        db.session.add(review)
+        db.session.commit()
+        db.session.execute(
+            db.update(Recipe)
+            .where(Recipe.id == recipe.id)
+            .values(description_html="<p>сохранённое описание</p>", steps_html="<p>сохранённые шаги</p>")
+        )
+        db.session.execute(db.update(Review).values(text_html="<p>сохранённый отзыв</p>"))
+        db.session.commit()
+
+        page = client.get(f"/recipes/{recipe.id}").get_data(as_text=True)
+        fragment = client.get(f"/recipes/{recipe.id}/reviews").get_data(as_text=True)
+
+        assert "<p>сохранённое описание</p>" in page
+        assert "<p>сохранённые шаги</p>" in page
+        assert "<p>сохранённый отзыв</p>" in page + fragment
+        assert no_rendering == []
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models import Recipe
+from app.pagination import decode_cursor, encode_cursor
+
+COLUMNS = [Recipe.created_at, Recipe.id]
+
+# Right length, wrong types: none of these may reach SQL binding
+WRONG_TYPES = [
+    ["2024-01-01T00:00:00", {"a": 1}],
+    [["2024-01-01T00:00:00"], 1],
+    ["2024-01-01T00:00:00", "1"],
+    ["2024-01-01T00:00:00", True],
+    # Past 64 bits: SQLite cannot bind it (OverflowError)
+    ["2024-01-01T00:00:00", 10**30],
+    ["2024-01-01T00:00:00", -(10**30)],
+    [1, 1],
+]
+
+
+def token(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class TestCursor:
+    def test_round_trip(self):
+        values = [datetime(2024, 1, 1, 12, 30), 42]
+
+        assert decode_cursor(encode_cursor(values), COLUMNS) == values
+
+    @pytest.mark.parametrize("values", WRONG_TYPES)
+    def test_wrong_types(self, values):
+        assert decode_cursor(token(values), COLUMNS) is None
+
+    @pytest.mark.parametrize("values", WRONG_TYPES)
+    @pytest.mark.parametrize("path", ["/?after={}", "/?before={}", "/recipes/{recipe_id}?after={}"])
+    def test_routes_fall_back_to_the_first_page(self, client, make_recipe, values, path):
+        recipe_id = make_recipe().id
+
+        response = client.get(path.format(token(values), recipe_id=recipe_id))
+
+        assert response.status_code == 200
@@ -0,0 +1,96 @@
+import os
+import pstats
+import time
+
+import pytest
+
+from app import create_app
+from app.extensions import db
+from app.models import Recipe, Role, User
+from app.profiler import collapsed_stacks
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(
+        {
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "CACHE_TYPE": "simple",
+            "PAGE_CACHE": False,
+            "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+            "METRICS_DIR": str(tmp_path / "metrics"),
+            "PROFILE_DIR": str(tmp_path / "profiles"),
+            "PROFILER_ENABLED": True,
+            "PROFILER_TOKEN": "profile-token",
+            "SECRET_KEY": "test-secret-key",
+        }
+    )
+
+    with app.app_context():
+        db.create_all()
+        role = Role(name="user", description="Пользователь")
+        author = User(username="author", password_hash="x", last_name="Автор", first_name="Рецептов", role=role)
+        for i in range(10):
+            recipe = Recipe(
+                title=f"Рецепт {i}",
+                description_md="Описание",
+                ingredients_md="- мука",
+                steps_md="1. Испечь",
+                cook_time_min=10,
+                servings=2,
+                author=author,
+            )
+            recipe.render_html()
+            db.session.add(recipe)
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+
+def profile(client, path="/"):
+    return client.get(path, headers={"X-Profile": "profile-token"})
+
+
+class TestProfiler:
+    def test_real_route_profile_is_fast(self, app, client):
+        # The recipe list with templates and queries is a graph of hundreds of functions:
+        # walking every path through it never finishes
+        store = app.extensions["profiler"]
+        started = time.perf_counter()
+
+        capture_id = profile(client).headers["X-Profile-Capture"]
+        saved = time.perf_counter()
+        path = store.folded(capture_id)
+
+        assert saved - started < 2
+        assert time.perf_counter() - saved < 5
+        with open(path, encoding="utf-8") as f:
+            assert any("index (routes.py:" in line for line in f)
+
+    def test_save_does_not_build_stacks(self, app, client):
+        capture_id = profile(client).headers["X-Profile-Capture"]
+        store = app.extensions["profiler"]
+
+        assert os.path.exists(store.path(capture_id, ".pstats"))
+        assert not os.path.exists(store.path(capture_id, ".folded"))
+
+    def test_collapsed_stacks_fold_short_branches(self):
+        root, big, small = [("m.py", line, name) for line, name in ((1, "root"), (2, "big"), (3, "small"))]
+        stats = pstats.Stats.__new__(pstats.Stats)
+        stats.stats = {
+            root: (1, 1, 0.0, 1.0, {}),
+            big: (1, 1, 1.0, 1.0, {root: (1, 1, 1.0, 1.0)}),
+            small: (1, 1, 1e-6, 1e-6, {root: (1, 1, 1e-6, 1e-6)}),
+        }
+
+        # "small" is under MIN_STACK_SHARE of the profile, so its time goes to the caller
+        assert collapsed_stacks(stats) == {"root (m.py:1)": 1, "root (m.py:1);big (m.py:2)": 1_000_000}
+
+    def test_folded_command(self, app, client):
+        capture_id = profile(client).headers["X-Profile-Capture"]
+
+        result = app.test_cli_runner().invoke(args=["profiles", "folded", capture_id[:-2]])
+
+        assert result.exit_code == 0
+        assert result.output.strip() == app.extensions["profiler"].path(capture_id, ".folded")
@@ -0,0 +1,150 @@
+import re
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app.extensions import db
+from app.models import RATING_VALUES, Recipe, Review, User
+
+
+@pytest.fixture
+def reviewers(app, author):
+    """Users other than the author who can each leave one review per recipe."""
+    users = [
+        User(
+            username=f"reviewer{i}",
+            password_hash=generate_password_hash("password", method="pbkdf2:sha256:1000"),
+            last_name="Рецензент",
+            first_name=f"Номер{i}",
+            role=author.role,
+        )
+        for i in range(4)
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def review(recipe, user, rating):
+    review = Review(recipe_id=recipe.id, user_id=user.id, rating=rating, text_md="Отзыв")
+    review.render_html()
+    db.session.add(review)
+    db.session.commit()
+    return review
+
+
+def aggregates(recipe):
+    db.session.refresh(recipe)
+    return recipe.reviews_count, recipe.rating_sum, recipe.rating_histogram
+
+
+def expected(*ratings):
+    return len(ratings), sum(ratings), {stars: ratings.count(stars) for stars in RATING_VALUES}
+
+
+class TestAggregates:
+    def test_add(self, make_recipe, reviewers):
+        recipe = make_recipe()
+
+        review(recipe, reviewers[0], 5)
+        review(recipe, reviewers[1], 2)
+
+        assert aggregates(recipe) == expected(5, 2)
+        assert recipe.avg_rating == 3.5
+
+    def test_add_through_the_form(self, client, make_recipe, reviewers):
+        recipe = make_recipe()
+        client.post("/auth/login", data={"username": "reviewer0", "password": "password"})
+
+        client.post(f"/reviews/create/{recipe.id}", data={"rating": "4", "text_md": "Хорошо"})
+
+        assert aggregates(recipe) == expected(4)
+
+    def test_edit_rating(self, make_recipe, reviewers):
+        recipe = make_recipe()
+        edited = review(recipe, reviewers[0], 5)
+        review(recipe, reviewers[1], 3)
+
+        edited.rating = 1
+        db.session.commit()
+
+        assert aggregates(recipe) == expected(1, 3)
+
+    def test_edit_text_only(self, make_recipe, reviewers):
+        recipe = make_recipe()
+        edited = review(recipe, reviewers[0], 5)
+
+        edited.text_md = "Другой текст"
+        edited.render_html()
+        db.session.commit()
+
+        assert aggregates(recipe) == expected(5)
+
+    def test_move_to_another_recipe(self, make_recipe, reviewers):
+        source, target = make_recipe(), make_recipe()
+        moved = review(source, reviewers[0], 4)
+
+        moved.recipe_id = target.id
+        moved.rating = 2
+        db.session.commit()
+
+        assert aggregates(source) == expected()
+        assert aggregates(target) == expected(2)
+
+    def test_delete(self, make_recipe, reviewers):
+        recipe = make_recipe()
+        review(recipe, reviewers[0], 5)
+        deleted = review(recipe, reviewers[1], 0)
+
+        db.session.delete(deleted)
+        db.session.commit()
+
+        assert aggregates(recipe) == expected(5)
+
+    def test_rolled_back_with_the_review(self, make_recipe, reviewers):
+        recipe = make_recipe()
+        review(recipe, reviewers[0], 5)
+
+        db.session.add(Review(recipe_id=recipe.id, user_id=reviewers[1].id, rating=3, text_md="Отзыв"))
+        db.session.flush()
+        db.session.rollback()
+
+        assert aggregates(recipe) == expected(5)
+
+
+class TestReconcile:
+    def test_repairs_drifted_counters(self, app, make_recipe, reviewers):
+        reviewed, unreviewed = make_recipe(), make_recipe()
+        for user, rating in zip(reviewers, (5, 5, 3, 0)):
+            review(reviewed, user, rating)
+        # Counters written around the hooks (a bulk import, a manual fix) drift from the reviews
+        db.session.execute(
+            db.update(Recipe)
+            .values(reviews_count=7, rating_sum=1, rating_count_5=0, rating_count_2=3)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=["reconcile-reviews"])
+
+        assert result.exit_code == 0, result.output
+        assert aggregates(reviewed) == expected(5, 5, 3, 0)
+        assert aggregates(unreviewed) == expected()
+
+
+class TestRatingSort:
+    def test_orders_by_average_then_count(self, client, make_recipe, reviewers):
+        recipes = {name: make_recipe() for name in ("none", "low", "high", "high_more", "middle")}
+        ratings = {"low": (1,), "high": (5,), "high_more": (5, 5), "middle": (4, 3)}
+        for name, values in ratings.items():
+            recipes[name].title = name
+            for user, rating in zip(reviewers, values):
+                review(recipes[name], user, rating)
+        recipes["none"].title = "none"
+        db.session.commit()
+
+        page = client.get("/?sort=rating").get_data(as_text=True)
+
+        titles = [title for title in re.findall(r">\s*(none|low|high_more|high|middle)\s*<", page)]
+        # Equal averages: more reviews first; no reviews count as 0
+        assert list(dict.fromkeys(titles)) == ["high_more", "high", "middle", "low", "none"]
@@ -0,0 +1,162 @@
+import re
+
+import pytest
+
+from app.extensions import db
+from app.models import Recipe
+from app.search import build_match_query, search_recipe_ids
+
+
+@pytest.fixture
+def add_recipe(author):
+    """add_recipe(title, description, ingredients): a committed recipe with the given searchable text."""
+
+    def add(title, description="Описание", ingredients="- вода"):
+        recipe = Recipe(
+            title=title,
+            description_md=description,
+            ingredients_md=ingredients,
+            steps_md="1. Приготовить",
+            cook_time_min=30,
+            servings=4,
+            author_id=author.id,
+        )
+        recipe.render_html()
+        db.session.add(recipe)
+        db.session.commit()
+        return recipe
+
+    return add
+
+
+def found(query="", ingredients=()):
+    match_query = build_match_query(query, ingredients)
+    return search_recipe_ids(match_query, limit=100) if match_query else []
+
+
+def result_titles(response):
+    return re.findall(r"Рецепт \d+", response.get_data(as_text=True))
+
+
+class TestIndexSync:
+    def test_insert(self, add_recipe):
+        recipe = add_recipe("Борщ")
+
+        assert found("борщ") == [recipe.id]
+
+    def test_update(self, add_recipe):
+        recipe = add_recipe("Борщ")
+
+        recipe.title = "Щи"
+        db.session.commit()
+
+        assert found("борщ") == []
+        assert found("щи") == [recipe.id]
+
+    def test_delete(self, add_recipe):
+        recipe = add_recipe("Борщ")
+
+        db.session.delete(recipe)
+        db.session.commit()
+
+        assert found("борщ") == []
+
+    def test_rolled_back_with_the_recipe(self, add_recipe):
+        recipe = add_recipe("Борщ")
+
+        recipe.title = "Щи"
+        db.session.flush()
+        db.session.rollback()
+
+        assert found("щи") == []
+        assert found("борщ") == [recipe.id]
+
+
+class TestMatching:
+    @pytest.mark.parametrize("query", ["ёлка", "елка", "ЁЛКА", "Елка"])
+    def test_yo_folds_to_ye(self, add_recipe, query):
+        recipe = add_recipe("Салат «Ёлочка»", description="Украсить как ёлку")
+
+        assert found(query[:3]) == [recipe.id]
+
+    def test_prefix(self, add_recipe):
+        recipe = add_recipe("Картофельная запеканка")
+
+        assert found("карт запек") == [recipe.id]
+        assert found("запеканкой") == []
+
+    def test_every_word_must_match(self, add_recipe):
+        add_recipe("Картофельная запеканка")
+
+        assert found("картофельная суп") == []
+
+    def test_ingredient_filter(self, add_recipe):
+        with_milk = add_recipe("Блины", ingredients="- мука\n- молоко коровье")
+        # The word is there, but not in the ingredients column
+        without = add_recipe("Оладьи", description="Без молока", ingredients="- мука\n- кефир")
+
+        assert found(ingredients=["молоко"]) == [with_milk.id]
+        assert found(ingredients=["молоко коров"]) == [with_milk.id]
+        # An ingredient is a phrase: its words must follow each other
+        assert found(ingredients=["коровье молоко"]) == []
+        assert sorted(found(ingredients=["мука"])) == sorted([with_milk.id, without.id])
+
+    def test_bm25_prefers_title_and_frequency(self, add_recipe):
+        once = add_recipe("Суп", description="Тыквенный овощной")
+        in_title = add_recipe("Тыквенный суп", description="Овощной овощной")
+        twice = add_recipe("Суп", description="Тыквенный тыквенный")
+
+        # Title weighs more than description; within a column, more occurrences rank higher
+        assert found("тыквен") == [in_title.id, twice.id, once.id]
+
+
+class TestMatchQuery:
+    @pytest.mark.parametrize("query", ["", "   ", "!!!", "___", "_ - _", '"*()'])
+    def test_no_words(self, query):
+        assert build_match_query(query) is None
+        assert build_match_query("", [query]) is None
+
+    def test_operators_are_quoted(self):
+        assert build_match_query('борщ OR NOT "щи"*') == '"борщ"* AND "OR"* AND "NOT"* AND "щи"*'
+
+    def test_underscores_split_words(self, add_recipe):
+        recipe = add_recipe("Суп с фрикадельками")
+
+        # An underscore token would be an empty FTS5 phrase and make the AND match nothing
+        assert found("суп_с __ фрикад") == [recipe.id]
+
+
+class TestSearchRoute:
+    @pytest.fixture
+    def many(self, app, add_recipe):
+        app.config["RECIPES_PER_PAGE"] = 2
+        return [add_recipe(f"Рецепт {i}", description="Пирог с вишней") for i in range(5)]
+
+    def test_pages(self, client, many):
+        pages = [client.get(f"/search?q=вишн&page={page}") for page in (1, 2, 3)]
+
+        titles = [result_titles(response) for response in pages]
+        assert [len(t) for t in titles] == [2, 2, 1]
+        assert sorted(sum(titles, [])) == sorted(recipe.title for recipe in many)
+
+    @pytest.mark.parametrize("page, has_next", [(1, True), (2, True), (3, False)])
+    def test_next_link(self, client, many, page, has_next):
+        html = client.get(f"/search?q=вишн&page={page}").get_data(as_text=True)
+
+        item = re.search(r'<li class="page-item ?(\w*)">\s*<a class="page-link" href="[^"]*page=%d' % (page + 1), html)
+        assert item.group(1) == ("" if has_next else "disabled")
+
+    def test_only_punctuation(self, client, many):
+        response = client.get("/search?q=%21%3F_%20___")
+
+        assert response.status_code == 200
+        assert result_titles(response) == []
+        assert "Введите запрос или ингредиенты" in response.get_data(as_text=True)
+
+    def test_ingredients_parameter(self, client, add_recipe):
+        add_recipe("Рецепт 1", ingredients="- мука\n- молоко")
+        add_recipe("Рецепт 2", ingredients="- мука")
+
+        response = client.get("/search?ingredients=мука,молоко")
+
+        assert result_titles(response) == ["Рецепт 1"]
@@ -0,0 +1,74 @@
+import os
+from collections import Counter
+
+from app.extensions import db
+from app.models import RATING_VALUES, Blob, Recipe, RecipeImage, Review, User
+
+
+def run_seed(app, *args):
+    return app.test_cli_runner().invoke(
+        args=["seed", "--users", "100", "--recipes", "10", "--reviews", "100", "--images", "20", *args]
+    )
+
+
+def count(model):
+    return db.session.scalar(db.select(db.func.count()).select_from(model))
+
+
+def stored_files(folder):
+    return sorted(name for _, _, names in os.walk(folder) for name in names)
+
+
+class TestSeed:
+    def test_creates_requested_volumes(self, app):
+        result = run_seed(app)
+
+        assert result.exit_code == 0, result.output
+        assert (count(User), count(Recipe), count(RecipeImage)) == (100, 10, 20)
+        # Reviews are shared out between recipes with rounding (at most one per user and recipe)
+        assert abs(count(Review) - 100) <= 10
+
+    def test_blob_refcounts_match_image_rows(self, app):
+        # The second run draws the same pictures, so it adds to the counts of existing blobs
+        for _ in range(2):
+            run_seed(app, "--images", "50")
+
+        references = Counter(db.session.scalars(db.select(RecipeImage.filename)))
+        blobs = {blob.key: blob.refcount for blob in db.session.scalars(db.select(Blob))}
+        assert sum(references.values()) == 100
+        assert blobs == dict(references)
+        # Every stored file has a blob row, so it can be deleted once unreferenced
+        assert stored_files(app.config["UPLOAD_FOLDER"]) == sorted(blobs)
+
+    def test_recipe_aggregates_match_reviews(self, app):
+        run_seed(app)
+
+        for recipe in db.session.scalars(db.select(Recipe)):
+            ratings = [review.rating for review in recipe.reviews]
+            assert (recipe.reviews_count, recipe.rating_sum) == (len(ratings), sum(ratings))
+            assert [getattr(recipe, f"rating_count_{stars}") for stars in RATING_VALUES] == [
+                ratings.count(stars) for stars in RATING_VALUES
+            ]
+
+    def test_same_seed_same_data(self, app):
+        def snapshot():
+            return db.session.execute(
+                db.select(Review.recipe_id, Review.user_id, Review.rating, Review.text_md, Review.created_at).order_by(
+                    Review.id
+                )
+            ).all()
+
+        run_seed(app, "--seed", "7")
+        first = snapshot()
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        run_seed(app, "--seed", "7")
+
+        assert snapshot() == first
+
+    def test_recipes_need_users(self, app):
+        result = run_seed(app, "--users", "0")
+
+        assert result.exit_code != 0
+        assert count(Recipe) == 0
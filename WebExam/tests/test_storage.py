@@ -0,0 +1,184 @@
+import io
+import os
+
+import pytest
+
+from app import jobs, storage
+from app.extensions import db
+from app.models import Blob
+from app.storage import S3Storage, shard
+
+
+class FakeS3Client:
+    """An in-memory S3: objects in a dict, errors shaped like botocore's."""
+
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code):
+                self.response = {"Error": {"Code": code}}
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError("404")
+        return {"ContentLength": len(self.objects[Bucket, Key][0])}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Bucket, Key] = (Body.read(), ContentType)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError("NoSuchKey")
+        data, content_type = self.objects[Bucket, Key]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data), "ContentType": content_type}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def refcount(key):
+    return db.session.scalar(db.select(Blob.refcount).where(Blob.key == key))
+
+
+def delete_recipe(client, recipe_id):
+    response = client.post(f"/recipes/{recipe_id}/delete")
+    assert response.status_code == 302
+    # The files go in a background job
+    while jobs.run_next():
+        pass
+
+
+class TestRefcounts:
+    def test_shared_upload_outlives_one_recipe(self, app, client, make_recipe):
+        first, second = make_recipe((b"photo", ".jpg")), make_recipe((b"photo", ".jpg"))
+        key = first.images[0].filename
+        first_id, second_id = first.id, second.id
+        assert second.images[0].filename == key
+        assert refcount(key) == 2
+        client.post("/auth/login", data={"username": "author", "password": "password"})
+
+        delete_recipe(client, first_id)
+
+        assert refcount(key) == 1
+        assert storage.get_storage().exists(key)
+
+        delete_recipe(client, second_id)
+
+        assert refcount(key) is None
+        assert not storage.get_storage().exists(key)
+
+    def test_store_after_concurrent_delete(self, app, monkeypatch):
+        key = storage.store(io.BytesIO(b"photo"), ".jpg")
+        storage.release([key])
+        db.session.commit()
+        add_reference = storage.add_reference
+
+        def add_reference_after_cleanup(key, size):
+            # Another worker's cleanup commits between save() and our row insert
+            assert storage.delete_unreferenced([key]) == [key]
+            return add_reference(key, size)
+
+        monkeypatch.setattr(storage, "add_reference", add_reference_after_cleanup)
+
+        assert storage.store(io.BytesIO(b"photo"), ".jpg") == key
+        db.session.commit()
+
+        assert refcount(key) == 1
+        with storage.get_storage().open(key) as f:
+            assert f.read() == b"photo"
+
+    def test_referenced_blob_is_not_deleted(self, app):
+        key = storage.store(io.BytesIO(b"photo"), ".jpg")
+        db.session.commit()
+
+        assert storage.delete_unreferenced([key]) == []
+        assert storage.get_storage().exists(key)
+
+
+class TestFailedCreate:
+    def test_files_of_a_rolled_back_recipe_are_deleted(self, app, client, make_recipe, monkeypatch):
+        shared = make_recipe((b"shared photo", ".jpg")).images[0].filename
+        client.post("/auth/login", data={"username": "author", "password": "password"})
+        enqueue, calls = jobs.enqueue, []
+
+        def fail_on_second_image(func, *args, **kwargs):
+            calls.append(func)
+            if len(calls) == 2:
+                raise RuntimeError("database is locked")
+            enqueue(func, *args, **kwargs)
+
+        monkeypatch.setattr(jobs, "enqueue", fail_on_second_image)
+
+        response = client.post(
+            "/recipes/create",
+            data={
+                "title": "Рецепт",
+                "description_md": "Описание",
+                "ingredients_md": "- мука",
+                "steps_md": "1. Испечь",
+                "cook_time_min": "30",
+                "servings": "4",
+                "images": [(io.BytesIO(b"new photo"), "new.jpg"), (io.BytesIO(b"shared photo"), "shared.jpg")],
+            },
+        )
+
+        assert response.status_code == 200
+        assert len(calls) == 2
+        assert db.session.scalar(db.select(db.func.count()).select_from(Blob)) == 1
+        # The new file is gone; the one an existing recipe uses keeps its file and count
+        assert refcount(shared) == 1
+        assert storage.get_storage().exists(shared)
+        stored = [name for _, _, names in os.walk(app.config["UPLOAD_FOLDER"]) for name in names]
+        assert stored == [shared]
+
+
+class TestS3Storage:
+    @pytest.fixture
+    def s3(self):
+        return S3Storage(FakeS3Client(), "bucket", "uploads/")
+
+    def test_save_and_open(self, s3):
+        key, size = s3.save(io.BytesIO(b"photo"), ".jpg")
+
+        assert size == 5
+        assert list(s3.client.objects) == [("bucket", "uploads/" + shard(key))]
+        assert s3.client.objects["bucket", "uploads/" + shard(key)][1] == "image/jpeg"
+        assert s3.exists(key)
+        assert s3.open(key).read() == b"photo"
+
+    def test_same_content_uploaded_once(self, s3, monkeypatch):
+        key, _ = s3.save(io.BytesIO(b"photo"), ".jpg")
+        monkeypatch.setattr(s3.client, "put_object", pytest.fail)
+
+        assert s3.save(io.BytesIO(b"photo"), ".jpg")[0] == key
+
+    def test_delete(self, s3):
+        key, _ = s3.save(io.BytesIO(b"photo"), ".jpg")
+
+        s3.delete(key)
+
+        assert not s3.exists(key)
+
+    def test_other_errors_propagate(self, s3, monkeypatch):
+        def forbidden(**kwargs):
+            raise s3.client.exceptions.ClientError("403")
+
+        monkeypatch.setattr(s3.client, "head_object", forbidden)
+
+        with pytest.raises(FakeS3Client.exceptions.ClientError):
+            s3.exists("0" * 32)
+
+    def test_served_through_the_app(self, app, client, monkeypatch):
+        s3 = S3Storage(FakeS3Client(), "bucket")
+        monkeypatch.setitem(app.extensions, "storage", s3)
+        key = storage.store(io.BytesIO(b"photo"), ".jpg")
+        db.session.commit()
+
+        response = client.get(f"/uploads/{key}")
+
+        assert response.status_code == 200
+        assert response.data == b"photo"
+        assert response.mimetype == "image/jpeg"
+        assert "immutable" in response.headers["Cache-Control"]
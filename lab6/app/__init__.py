@@ -3,9 +3,19 @@ from flask_migrate import Migrate
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.models import db
+from app.cache import init_cache
+from app.fragment_cache import init_fragment_cache
+from app.instrumentation import init_instrumentation
+from app.metrics import init_metrics
+from app.profiler import init_profiler
+from app.delivery import init_delivery
+from app.storage import init_storage
+from app.thumbnails import init_thumbnails
 from app.auth import bp as auth_bp, init_login_manager
 from app.courses import bp as courses_bp
 from app.routes import bp as main_bp
+from app.commands import init_commands
+from app.repositories import course_search
 
 def handle_sqlalchemy_error(err):
     error_msg = ('Возникла ошибка при подключении к базе данных. '
@@ -20,9 +30,20 @@ def create_app(test_config=None):
         app.config.from_mapping(test_config)
 
     db.init_app(app)
-    migrate = Migrate(app, db)
+    course_search.init_sqlite_functions(app)
+    # Первым: профиль охватывает и остальные обработчики before_request/teardown
+    init_profiler(app)
+    init_instrumentation(app)
+    init_metrics(app)
+    init_cache(app)
+    init_fragment_cache(app)
+    init_delivery(app)
+    init_storage(app)
+    init_thumbnails(app)
+    migrate = Migrate(app, db, include_name=course_search.include_name)
 
     init_login_manager(app)
+    init_commands(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(courses_bp)
@@ -0,0 +1,383 @@
+import functools
+import inspect
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+# Служебный тег, который есть у каждой записи: его смена сбрасывает весь кэш во всех воркерах
+ALL_TAG = '*'
+
+# Признак промаха: None — допустимое закэшированное значение
+MISSING = object()
+
+# Отправляется на каждый поиск в TieredCache с result='l1', 'l2' или 'miss' (см. app/metrics.py)
+cache_lookup = Namespace().signal('cache-lookup')
+
+
+class NullBackend:
+    """Ничего не хранит: кэш выключен"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry, expires):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def tag_versions(self, tags):
+        return tuple(0 for _ in tags)
+
+    def bump_tags(self, tags):
+        pass
+
+
+class MemoryBackend:
+    """L1: LRU в памяти процесса с TTL; ограничен числом записей и, при max_bytes, их объёмом"""
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(entry):
+        # Учитываются строки и байты (HTML-фрагменты, сжатые страницы); прочее считается пустым
+        value = entry[2]
+        return len(value) if isinstance(value, (str, bytes)) else 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= self._sizeof(entry)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, expires):
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = entry
+            self._size += self._sizeof(entry)
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._size > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return tuple(self._tags.get(tag, 0) for tag in tags)
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """L2: общий для всех воркеров кэш в файле SQLite.
+
+    Здесь же хранятся версии тегов, поэтому инвалидация в одном воркере
+    сразу видна остальным.
+    """
+
+    # Как часто (в записях) удалять просроченные строки
+    PURGE_EVERY = 256
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._writes = 0
+
+    def _connect(self):
+        # После fork (gunicorn --preload) соединение родителя использовать нельзя
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_entries '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_tags '
+                               '(tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, entry, expires):
+        value = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            connection = self._connect()
+            connection.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+                               (key, value, expires))
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute('DELETE FROM cache_entries')
+
+    def tag_versions(self, tags):
+        with self._lock:
+            rows = self._connect().execute(
+                f'SELECT tag, version FROM cache_tags WHERE tag IN ({", ".join("?" * len(tags))})', tags
+            ).fetchall()
+        versions = dict(rows)
+        return tuple(versions.get(tag, 0) for tag in tags)
+
+    def bump_tags(self, tags):
+        with self._lock:
+            self._connect().executemany(
+                'INSERT INTO cache_tags (tag, version) VALUES (?, 1) '
+                'ON CONFLICT (tag) DO UPDATE SET version = version + 1',
+                [(tag,) for tag in tags]
+            )
+
+
+class TieredCache:
+    """L1 в памяти процесса поверх необязательного общего L2.
+
+    Запись хранится как (версии тегов, срок годности, значение). Версии тегов
+    читаются до вычисления значения, поэтому инвалидация, случившаяся во время
+    вычисления, не даст закэшировать устаревший результат.
+    """
+
+    def __init__(self, l1, l2=None, default_ttl=300, name='data'):
+        self.l1 = l1
+        self.l2 = l2
+        self.default_ttl = default_ttl
+        self.name = name
+        self._counters = dict.fromkeys(('l1_hits', 'l2_hits', 'misses', 'invalidations'), 0)
+        self._counters_lock = threading.Lock()
+
+    @property
+    def _tag_store(self):
+        return self.l2 if self.l2 is not None else self.l1
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def lookup(self, key, tags=()):
+        """Найти значение в L1, затем в L2.
+
+        Возвращает (значение или MISSING, версии тегов); версии нужно передать
+        в store() вместе с вычисленным при промахе значением.
+        """
+        tags = (ALL_TAG, *sorted(set(tags)))
+        versions = self._tag_store.tag_versions(tags)
+
+        entry = self.l1.get(key)
+        if entry is not None and entry[0] == versions:
+            self._count('l1_hits')
+            cache_lookup.send(self, result='l1')
+            return entry[2], versions
+
+        if self.l2 is not None:
+            entry = self.l2.get(key)
+            if entry is not None and entry[0] == versions:
+                self.l1.set(key, entry, entry[1])
+                self._count('l2_hits')
+                cache_lookup.send(self, result='l2')
+                return entry[2], versions
+
+        self._count('misses')
+        cache_lookup.send(self, result='miss')
+        return MISSING, versions
+
+    def store(self, key, value, versions, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        entry = (versions, time.time() + ttl if ttl else None, value)
+        self.l1.set(key, entry, entry[1])
+        if self.l2 is not None:
+            self.l2.set(key, entry, entry[1])
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        """Значение из кэша; при промахе — compute() с сохранением в оба уровня"""
+        value, versions = self.lookup(key, tags)
+        if value is MISSING:
+            value = compute()
+            self.store(key, value, versions, ttl)
+        return value
+
+    def delete(self, key):
+        self.l1.delete(key)
+        if self.l2 is not None:
+            self.l2.delete(key)
+
+    def invalidate(self, *tags):
+        """Сделать недействительными все записи с любым из тегов (во всех воркерах)"""
+        if tags:
+            self._tag_store.bump_tags(sorted(set(tags)))
+            self._count('invalidations')
+
+    def clear(self):
+        self.invalidate(ALL_TAG)
+        self.l1.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+
+
+def create_backend(config):
+    """Собрать кэш по CACHE_TYPE: 'null', 'simple' (только L1), 'sqlite' (L1 + L2)
+    или путь импорта фабрики, принимающей конфиг приложения"""
+    cache_type = config.get('CACHE_TYPE', 'simple')
+    default_ttl = config.get('CACHE_DEFAULT_TTL', 300)
+    if cache_type == 'null':
+        return TieredCache(NullBackend(), default_ttl=default_ttl)
+    l1 = MemoryBackend(config.get('CACHE_L1_MAX_ENTRIES', 1024))
+    if cache_type == 'simple':
+        return TieredCache(l1, default_ttl=default_ttl)
+    if cache_type == 'sqlite':
+        return TieredCache(l1, SQLiteBackend(config['CACHE_SQLITE_PATH']), default_ttl=default_ttl)
+    return import_string(cache_type)(config)
+
+
+class Cache:
+    """Точка доступа к кэшу текущего приложения (по аналогии с db)"""
+
+    def init_app(self, app):
+        app.extensions['cache'] = create_backend(app.config)
+
+    @property
+    def backend(self):
+        if has_app_context():
+            return current_app.extensions.get('cache')
+        return None
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        backend = self.backend
+        if backend is None:
+            return compute()
+        return backend.get_or_set(key, compute, ttl=ttl, tags=tags)
+
+    def invalidate(self, *tags):
+        backend = self.backend
+        if backend is not None:
+            backend.invalidate(*tags)
+
+    def clear(self):
+        backend = self.backend
+        if backend is not None:
+            backend.clear()
+
+    def stats(self):
+        backend = self.backend
+        return backend.stats() if backend is not None else {}
+
+    def cached(self, ttl=None, tags=()):
+        """Декоратор для функций и методов репозиториев.
+
+        Ключ строится из имени функции и аргументов (self/cls не учитываются).
+        Теги могут ссылаться на аргументы: tags=('course:{course_id}',).
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+            skip = {name for name in list(signature.parameters)[:1] if name in ('self', 'cls')}
+            prefix = f'{func.__module__}.{func.__qualname__}'
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = {name: value for name, value in bound.arguments.items() if name not in skip}
+                key = f'{prefix}:{arguments!r}'
+                return self.get_or_set(key, lambda: func(*args, **kwargs), ttl=ttl,
+                                       tags=[tag.format(**arguments) for tag in tags])
+
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+
+cache = Cache()
+
+
+def init_cache(app):
+    cache.init_app(app)
+
+
+def _table_tags(mappers):
+    return {mapper.local_table.name for mapper in mappers if mapper.local_table is not None}
+
+
+# Инвалидация по записи в БД: тег записи — имя изменённой таблицы.
+# Теги собираются при flush и массовых UPDATE/DELETE и сбрасываются только после commit.
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_tags(session, flush_context):
+    changed = chain(session.new, session.deleted, (obj for obj in session.dirty if session.is_modified(obj)))
+    session.info.setdefault('cache_tags', set()).update(
+        _table_tags(sa_inspect(obj).mapper for obj in changed)
+    )
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_tags(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        orm_execute_state.session.info.setdefault('cache_tags', set()).update(
+            _table_tags([orm_execute_state.bind_mapper])
+        )
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tags(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        cache.invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_tags(session):
+    session.info.pop('cache_tags', None)
@@ -0,0 +1,120 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.cache import cache
+from app.models import db
+from app.profiler import diff_stats
+from app.seed import seed as seed_database
+from app.repositories import CourseRepository, ImageRepository, ReviewRepository
+
+course_repository = CourseRepository(db)
+image_repository = ImageRepository(db)
+review_repository = ReviewRepository(db)
+
+def init_commands(app):
+    app.cli.add_command(reconcile_ratings)
+    app.cli.add_command(reindex_courses)
+    app.cli.add_command(clear_cache)
+    app.cli.add_command(migrate_image_storage)
+    app.cli.add_command(profiles)
+    app.cli.add_command(seed)
+
+@click.command('reconcile-ratings')
+@with_appcontext
+def reconcile_ratings():
+    """Пересчитать счётчики рейтинга курсов по таблице отзывов."""
+    updated = review_repository.reconcile_course_ratings()
+    click.echo(f'Счётчики рейтинга пересчитаны для {updated} курсов.')
+
+@click.command('reindex-courses')
+@with_appcontext
+def reindex_courses():
+    """Создать (при необходимости) и перестроить поисковый индекс названий курсов."""
+    course_repository.rebuild_search_index()
+    click.echo('Поисковый индекс курсов перестроен.')
+
+@click.command('clear-cache')
+@with_appcontext
+def clear_cache():
+    """Очистить кэш во всех воркерах (L1 и общий L2)."""
+    cache.clear()
+    click.echo('Кэш очищен.')
+
+@click.command('migrate-image-storage')
+@with_appcontext
+def migrate_image_storage():
+    """Перенести картинки из плоского каталога загрузок в хранилище с адресацией по содержимому."""
+    moved = image_repository.import_legacy_files()
+    click.echo(f'В хранилище перенесено {moved} картинок.')
+
+@click.group('profiles')
+def profiles():
+    """Снимки профиля запросов (см. PROFILER_ENABLED)."""
+
+@profiles.command('list')
+@click.option('--endpoint', help='Только снимки этого эндпоинта.')
+@with_appcontext
+def list_profiles(endpoint):
+    """Показать сохранённые снимки, от старых к новым."""
+    captures = current_app.extensions['profiler'].captures()
+    for capture in captures:
+        if endpoint and capture['endpoint'] != endpoint:
+            continue
+        click.echo(f"{capture['id']}  {capture['method']} {capture['path']}  {capture['status']}  "
+                   f"{capture['duration_ms']} мс  {capture['release'] or '-'}")
+
+@profiles.command('folded')
+@click.argument('capture')
+@with_appcontext
+def folded_profile(capture):
+    """Построить свёрнутые стеки снимка для flamegraph.pl/speedscope и вывести путь к файлу."""
+    store = current_app.extensions['profiler']
+    try:
+        capture = store.find(capture)
+    except LookupError as err:
+        raise click.ClickException(str(err))
+    click.echo(store.folded(capture['id']))
+
+@profiles.command('diff')
+@click.argument('old')
+@click.argument('new')
+@click.option('--limit', default=20, show_default=True, help='Сколько функций показать.')
+@with_appcontext
+def diff_profiles(old, new, limit):
+    """Сравнить два снимка (id или его начало): функции с наибольшим изменением совокупного времени."""
+    store = current_app.extensions['profiler']
+    try:
+        old, new = store.find(old), store.find(new)
+    except LookupError as err:
+        raise click.ClickException(str(err))
+    click.echo(f"{old['id']} ({old['release'] or '-'}, {old['duration_ms']} мс) -> "
+               f"{new['id']} ({new['release'] or '-'}, {new['duration_ms']} мс)")
+    click.echo(f"{'совокупное, мс':>22}  {'собственное, мс':>22}  функция")
+    for name, old_tt, new_tt, old_ct, new_ct in diff_stats(store.stats(old['id']), store.stats(new['id']))[:limit]:
+        click.echo(f'{old_ct * 1000:9.2f} -> {new_ct * 1000:9.2f}  {old_tt * 1000:9.2f} -> {new_tt * 1000:9.2f}  {name}')
+
+@click.command('seed')
+@click.option('--users', default=100_000, show_default=True, help='Сколько пользователей создать.')
+@click.option('--categories', default=500, show_default=True, help='Сколько категорий создать.')
+@click.option('--category-depth', default=3, show_default=True, help='Наибольшая глубина дерева категорий.')
+@click.option('--courses', default=50_000, show_default=True, help='Сколько курсов создать.')
+@click.option('--reviews', default=5_000_000, show_default=True,
+              help='Сколько отзывов создать (примерно: не больше одного от пользователя на курс).')
+@click.option('--images', default=1_000, show_default=True, help='Сколько картинок-фонов создать.')
+@click.option('--seed', 'random_seed', default=0, show_default=True, help='Зерно генератора: тот же набор при том же зерне.')
+@click.option('--batch-size', default=10_000, show_default=True, help='Строк в одном INSERT (executemany).')
+@click.option('--password', default='password', show_default=True, help='Пароль всех созданных пользователей.')
+@with_appcontext
+def seed(users, categories, category_depth, courses, reviews, images, random_seed, batch_size, password):
+    """Заполнить БД большим воспроизводимым набором данных для нагрузочного тестирования."""
+    if courses and (not users or not categories):
+        raise click.UsageError('Для курсов нужны пользователи (--users) и категории (--categories).')
+    if category_depth < 1 or batch_size < 1:
+        raise click.UsageError('--category-depth и --batch-size должны быть положительными.')
+    seed_database(users=users, categories=categories, category_depth=category_depth, courses=courses,
+                  reviews=reviews, images=images, seed=random_seed, batch_size=batch_size, password=password,
+                  echo=click.echo)
+    # Кэши страниц и справочников собраны по прежним данным
+    cache.clear()
+    click.echo('Готово.')
@@ -0,0 +1,72 @@
+import functools
+import hashlib
+from datetime import timezone
+
+from flask import current_app, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+def _as_utc(value):
+    # Время в БД наивное локальное (datetime.now)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _release(app):
+    """Версия развёртывания в ETag: RELEASE, а без него — отпечаток исходников шаблонов.
+
+    Иначе после выкладки с новыми шаблонами браузеры получали бы 304 на старую страницу.
+    """
+    release = app.config.get('RELEASE')
+    if release:
+        return release
+    version = app.extensions.get('templates_version')
+    if version is None:
+        digest = hashlib.sha1()
+        for name in sorted(app.jinja_env.list_templates()):
+            source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            digest.update(f'{name}\0{source}\0'.encode())
+        version = app.extensions['templates_version'] = digest.hexdigest()[:12]
+    return version
+
+def conditional(validators):
+    """Условный GET: ответ 304 до выполнения view и рендеринга шаблона.
+
+    validators(**view_args) возвращает версии строк, из которых собрана страница
+    (значения datetime), или None — тогда решает сама view (например, 404).
+    Слабый ETag учитывает пользователя (залогиненным страница показывается иначе)
+    и версию развёртывания.
+    Last-Modified отдаётся только анонимам — он не различает пользователей.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(**view_args)
+            versions = validators(**view_args)
+            if versions is None:
+                return view(**view_args)
+
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            etag = hashlib.sha1(repr((_release(current_app), user_id, *versions)).encode()).hexdigest()[:20]
+            last_modified = None
+            if user_id is None:
+                last_modified = _as_utc(max(v for v in versions if v is not None))
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(**view_args))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Страница может устареть в любой момент: браузер сверяет её при каждом показе
+            response.cache_control.no_cache = True
+            if user_id is not None:
+                response.cache_control.private = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
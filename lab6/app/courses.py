@@ -1,8 +1,11 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, abort
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort, current_app
 from flask_login import login_required, current_user
 from sqlalchemy.exc import IntegrityError
 
+from app.cache import cache
+from app.conditional import conditional
 from app.models import db
+from app.page_cache import cache_page
 from app.repositories import CourseRepository, UserRepository, CategoryRepository, ImageRepository, ReviewRepository
 
 user_repository = UserRepository(db)
@@ -27,8 +30,10 @@ def search_params():
     }
 
 @bp.route('/')
+@cache_page(tags=('courses', 'categories'))
 def index():
-    pagination = course_repository.get_pagination_info(**search_params())
+    pagination = course_repository.get_pagination_info(**search_params(),
+                                                       options=course_repository.CATALOG_OPTIONS)
     courses = course_repository.get_all_courses(pagination=pagination)
     categories = category_repository.get_all_categories()
     return render_template('courses/index.html',
@@ -70,18 +75,27 @@ def create():
                             users=users,
                             course=course)
 
+    # Новый курс появляется в каталоге
+    cache.invalidate('courses')
     flash(f'Курс {course.name} был успешно добавлен!', 'success')
 
     return redirect(url_for('courses.index'))
 
+def course_versions(course_id):
+    # Страница курса и список отзывов меняются вместе с курсом (в т. ч. его рейтингом) или отзывом
+    return course_repository.get_course_validators(course_id)
+
 @bp.route('/<int:course_id>')
+@cache_page(tags=('course:{course_id}',))
+@conditional(course_versions)
 def show(course_id):
-    course = course_repository.get_course_by_id(course_id)
+    course = course_repository.get_course_by_id(course_id, options=course_repository.PAGE_OPTIONS)
     if course is None:
         abort(404)
     
     # Получаем последние 5 отзывов
-    recent_reviews = review_repository.get_recent_reviews_by_course(course_id, limit=5)
+    recent_reviews = review_repository.get_recent_reviews_by_course(
+        course_id, limit=5, options=review_repository.WITH_AUTHOR_OPTIONS)
     
     # Проверяем, оставил ли текущий пользователь отзыв
     user_review = None
@@ -94,6 +108,8 @@ def show(course_id):
                          user_review=user_review)
 
 @bp.route('/<int:course_id>/reviews')
+@cache_page(tags=('course:{course_id}',))
+@conditional(course_versions)
 def reviews(course_id):
     course = course_repository.get_course_by_id(course_id)
     if course is None:
@@ -103,13 +119,24 @@ def reviews(course_id):
     sort_by = request.args.get('sort_by', 'newest')
     page = request.args.get('page', 1, type=int)
     
-    # Получаем отзывы с пагинацией
-    pagination = review_repository.get_reviews_by_course(
-        course_id, 
-        sort_by=sort_by, 
-        page=page, 
-        per_page=10
-    )
+    # Получаем отзывы с пагинацией: по курсору, если не запрошен номер страницы
+    if current_app.config.get('KEYSET_PAGINATION') and 'page' not in request.args:
+        pagination = review_repository.get_reviews_by_course_keyset(
+            course_id,
+            sort_by=sort_by,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            per_page=10,
+            options=review_repository.WITH_AUTHOR_OPTIONS
+        )
+    else:
+        pagination = review_repository.get_reviews_by_course(
+            course_id, 
+            sort_by=sort_by, 
+            page=page, 
+            per_page=10,
+            options=review_repository.WITH_AUTHOR_OPTIONS
+        )
     
     # Проверяем, оставил ли текущий пользователь отзыв
     user_review = None
@@ -130,12 +157,6 @@ def create_review(course_id):
     if course is None:
         abort(404)
     
-    # Проверяем, не оставлял ли пользователь уже отзыв
-    existing_review = review_repository.get_user_review_for_course(current_user.id, course_id)
-    if existing_review:
-        flash('Вы уже оставляли отзыв к этому курсу.', 'warning')
-        return redirect(url_for('courses.show', course_id=course_id))
-    
     # Получаем данные из формы
     rating = request.form.get('rating', type=int)
     text = request.form.get('text', '').strip()
@@ -150,20 +171,22 @@ def create_review(course_id):
         return redirect(url_for('courses.show', course_id=course_id))
     
     try:
-        # Создаем отзыв
-        review = review_repository.add_review(
+        # Создаем отзыв и обновляем рейтинг курса в одной транзакции
+        review_repository.add_review(
             user_id=current_user.id,
             course_id=course_id,
             rating=rating,
             text=text
         )
-        
-        # Обновляем рейтинг курса
-        review_repository.update_course_rating(course_id)
-        
-        flash('Отзыв успешно добавлен!', 'success')
+    except IntegrityError:
+        # Уникальное ограничение (user_id, course_id): отзыв уже есть
+        flash('Вы уже оставляли отзыв к этому курсу.', 'warning')
         return redirect(url_for('courses.show', course_id=course_id))
-        
     except Exception as e:
         flash(f'Ошибка при создании отзыва: {str(e)}', 'danger')
         return redirect(url_for('courses.show', course_id=course_id))
+
+    # Отзыв меняет страницу курса, список отзывов и рейтинг в каталоге
+    cache.invalidate(f'course:{course_id}', 'courses')
+    flash('Отзыв успешно добавлен!', 'success')
+    return redirect(url_for('courses.show', course_id=course_id))
@@ -0,0 +1,38 @@
+import mimetypes
+import os
+
+from flask import abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+
+# 'direct' — файл отдаёт приложение (sendfile через wsgi.file_wrapper, поддержка Range);
+# 'x-accel' — заголовок X-Accel-Redirect для nginx; 'x-sendfile' — X-Sendfile для Apache/lighttpd
+DELIVERY_MODES = ('direct', 'x-accel', 'x-sendfile')
+
+
+def init_delivery(app):
+    mode = app.config.setdefault('FILE_DELIVERY', 'direct')
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f'FILE_DELIVERY должен быть одним из {DELIVERY_MODES}, а не {mode!r}')
+    if mode == 'x-sendfile':
+        # Flask сам ставит X-Sendfile во всех send_file/send_from_directory, включая /static
+        app.config['USE_X_SENDFILE'] = True
+
+
+def send_stored_file(location, directory, filename, mimetype=None, max_age=None):
+    """Отдать файл из directory; location — ключ X_ACCEL_LOCATIONS, внутренний путь nginx для этого каталога.
+
+    В режиме x-accel приложение только проверяет, что файл есть, и передаёт
+    отдачу прокси: воркер освобождается сразу, а Range, ETag и sendfile
+    обрабатывает nginx.
+    """
+    if current_app.config['FILE_DELIVERY'] != 'x-accel':
+        return send_from_directory(directory, filename, mimetype=mimetype, max_age=max_age)
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = current_app.response_class(
+        mimetype=mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = current_app.config['X_ACCEL_LOCATIONS'][location] + filename
+    if max_age is not None:
+        response.cache_control.max_age = max_age
+    return response
@@ -0,0 +1,77 @@
+import hashlib
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import InstanceState
+
+from app.cache import MISSING, MemoryBackend, TieredCache
+
+
+def row_version(obj):
+    """Версия строки: таблица, первичный ключ и хэш загруженных значений столбцов.
+
+    Любое изменение строки меняет версию, поэтому фрагменты не нужно сбрасывать
+    вручную — после правки шаблон просто обращается к новому ключу.
+    """
+    state = sa_inspect(obj)
+    columns = state.mapper.column_attrs.keys()
+    expired = state.expired_attributes.intersection(columns)
+    if expired:
+        # После commit значения просрочены: одно обращение перечитывает строку
+        getattr(obj, next(iter(expired)))
+    values = sorted((name, value) for name, value in state.dict.items() if name in columns)
+    digest = hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+    return f'{state.mapper.local_table.name}:{state.identity}:{digest}'
+
+
+def fragment_key(key):
+    """Ключ из строки, ORM-объекта или списка/кортежа из них"""
+    if isinstance(key, (list, tuple)):
+        return '|'.join(fragment_key(part) for part in key)
+    if isinstance(sa_inspect(key, raiseerr=False), InstanceState):
+        return row_version(key)
+    return str(key)
+
+
+class FragmentCacheExtension(Extension):
+    """Тег {% cache key[, ttl] %}...{% endcache %}: HTML блока берётся из кэша фрагментов.
+
+    key — строка, ORM-объект или кортеж из них, например ('course-card', course, course.author).
+    Содержимое блока должно быть одинаковым для всех пользователей.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None)
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # Имя шаблона и строка отделяют одинаковые ключи из разных мест
+        location = nodes.Const(f'{parser.name}:{lineno}')
+        return nodes.CallBlock(self.call_method('_render', [location, key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, location, key, ttl, caller):
+        store = current_app.extensions.get('fragment_cache')
+        if store is None:
+            return caller()
+        cache_key = f'fragment:{location}:{fragment_key(key)}'
+        html, versions = store.lookup(cache_key)
+        if html is MISSING:
+            html = caller()
+            store.store(cache_key, html, versions, ttl)
+        return html
+
+
+def init_fragment_cache(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    # Версия строки входит в ключ, поэтому фрагментам хватает L1 без тегов, ограниченного по объёму
+    max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+    if max_bytes:
+        app.extensions['fragment_cache'] = TieredCache(
+            MemoryBackend(max_entries=100_000, max_bytes=max_bytes),
+            default_ttl=app.config.get('FRAGMENT_CACHE_TTL', 3600),
+            name='fragments'
+        )
@@ -0,0 +1,237 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app.cache import cache_lookup
+from app.models import db
+
+# Границы корзин гистограммы длительности запроса, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Семейства метрик: имя -> (тип, описание). Счётчики и гистограммы суммируются по файлам
+# всех воркеров, включая завершившиеся; gauge — только по живым процессам
+METRICS = {
+    'http_requests_total': ('counter', 'Ответы по эндпоинту, методу и статусу'),
+    'http_request_duration_seconds': ('histogram', 'Длительность обработки запроса по эндпоинту'),
+    'http_requests_in_flight': ('gauge', 'Запросы, обрабатываемые сейчас'),
+    'db_pool_checkouts_total': ('counter', 'Соединения, взятые из пула БД, по эндпоинту'),
+    'cache_lookups_total': ('counter', 'Поиски в кэше по эндпоинту, кэшу и результату (l1, l2, miss)'),
+}
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _flush_periodically(store_ref, interval):
+    # Слабая ссылка: поток завершается вместе с хранилищем
+    while True:
+        time.sleep(interval)
+        store = store_ref()
+        if store is None or store._pid != os.getpid():
+            return
+        try:
+            store.flush()
+        except OSError:
+            pass
+        del store
+
+
+class MetricsStore:
+    """Метрики процесса в памяти, раз в flush_interval секунд записываемые в свой файл в directory.
+
+    Запрос меняет только словари в памяти; /metrics читает файлы всех
+    воркеров gunicorn и складывает их. Значения в файле отстают от памяти не
+    больше чем на flush_interval.
+    """
+
+    def __init__(self, directory, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_process(self):
+        # После fork (gunicorn --preload) у каждого воркера свои значения и свой файл
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._counters = defaultdict(float)
+            self._gauges = defaultdict(float)
+            self._dirty = True
+            self.path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+            self._pid = os.getpid()
+            threading.Thread(target=_flush_periodically, args=(weakref.ref(self), self.flush_interval),
+                             daemon=True).start()
+
+    def inc(self, name, labels, value=1):
+        self._ensure_process()
+        with self._lock:
+            self._counters[name, labels] += value
+            self._dirty = True
+
+    def add_gauge(self, name, labels, delta):
+        self._ensure_process()
+        with self._lock:
+            self._gauges[name, labels] += delta
+            self._dirty = True
+
+    def observe(self, name, labels, value):
+        """Добавить наблюдение в гистограмму: счётчик корзины (не накопленный), _sum и _count"""
+        index = bisect.bisect_left(DURATION_BUCKETS, value)
+        le = repr(DURATION_BUCKETS[index]) if index < len(DURATION_BUCKETS) else '+Inf'
+        self._ensure_process()
+        with self._lock:
+            self._counters[f'{name}_bucket', labels + (('le', le),)] += 1
+            self._counters[f'{name}_sum', labels] += value
+            self._counters[f'{name}_count', labels] += 1
+            self._dirty = True
+
+    def flush(self):
+        self._ensure_process()
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {kind: [[name, labels, value] for (name, labels), value in values.items()]
+                    for kind, values in (('counters', self._counters), ('gauges', self._gauges))}
+            self._dirty = False
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def collect(self):
+        """Сумма по всем воркерам: (счётчики, gauge), каждый — {(имя, метки): значение}"""
+        self.flush()
+        counters, gauges = defaultdict(float), defaultdict(float)
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(int(filename.split('-', 1)[0]))
+            for kind, total in (('counters', counters), ('gauges', gauges)):
+                if kind == 'gauges' and not alive:
+                    continue
+                for name, labels, value in data[kind]:
+                    total[name, tuple(tuple(pair) for pair in labels)] += value
+        return counters, gauges
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _sample(name, labels, value):
+    value = str(int(value)) if value == int(value) else repr(value)
+    label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+    return f'{name}{{{label_text}}} {value}' if labels else f'{name} {value}'
+
+
+def render_metrics(counters, gauges):
+    """Текстовый формат Prometheus (версия 0.0.4)"""
+    lines = []
+    for family, (kind, description) in METRICS.items():
+        lines += [f'# HELP {family} {description}', f'# TYPE {family} {kind}']
+        if kind == 'histogram':
+            buckets = defaultdict(dict)
+            for (name, labels), value in counters.items():
+                if name == f'{family}_bucket':
+                    buckets[labels[:-1]][labels[-1][1]] = value
+            for labels in sorted(buckets):
+                cumulative = 0
+                for le in [repr(b) for b in DURATION_BUCKETS] + ['+Inf']:
+                    cumulative += buckets[labels].get(le, 0)
+                    lines.append(_sample(f'{family}_bucket', labels + (('le', le),), cumulative))
+                lines.append(_sample(f'{family}_sum', labels, counters[f'{family}_sum', labels]))
+                lines.append(_sample(f'{family}_count', labels, counters[f'{family}_count', labels]))
+        else:
+            values = gauges if kind == 'gauge' else counters
+            lines += [_sample(name, labels, value) for (name, labels), value in sorted(values.items())
+                      if name == family]
+    return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return current_app.extensions['metrics']
+
+
+def _endpoint():
+    # Без маршрута (404) — одна общая метка, а не путь, иначе меток будет сколько угодно
+    return request.endpoint or '<unmatched>'
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_endpoint = _endpoint()
+    get_metrics().add_gauge('http_requests_in_flight', (('endpoint', g.metrics_endpoint),), 1)
+
+
+def _record_response(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        metrics = get_metrics()
+        labels = (('endpoint', g.metrics_endpoint),)
+        metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+        metrics.inc('http_requests_total', labels + (('method', request.method), ('status', str(response.status_code))))
+    return response
+
+
+def _finish_request(exc):
+    if g.pop('metrics_started', None) is not None:
+        get_metrics().add_gauge('http_requests_in_flight', (('endpoint', g.metrics_endpoint),), -1)
+
+
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    if has_request_context() and 'metrics' in current_app.extensions:
+        get_metrics().inc('db_pool_checkouts_total', (('endpoint', _endpoint()),))
+
+
+def _cache_lookup(sender, result):
+    if has_request_context() and 'metrics' in current_app.extensions:
+        get_metrics().inc('cache_lookups_total', (('cache', sender.name), ('endpoint', _endpoint()), ('result', result)))
+
+
+def metrics_view():
+    counters, gauges = get_metrics().collect()
+    return current_app.response_class(render_metrics(counters, gauges),
+                                      content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """Метрики запросов по эндпоинтам в формате Prometheus на /metrics.
+
+    METRICS_DIR — общий для всех воркеров каталог. Файлы завершившихся
+    воркеров остаются (их счётчики входят в сумму, чтобы она не уменьшалась),
+    поэтому каталог стоит очищать при развёртывании.
+    """
+    app.config.setdefault('METRICS_FLUSH_INTERVAL', 1.0)
+    app.extensions['metrics'] = MetricsStore(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine.pool, 'checkout', _pool_checkout)
+    cache_lookup.connect(_cache_lookup)
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -8,7 +8,7 @@ from flask import url_for
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, ForeignKey, Text, Integer, MetaData
+from sqlalchemy import String, ForeignKey, Text, Integer, MetaData, UniqueConstraint, Index
 
 
 class Base(DeclarativeBase):
@@ -62,6 +62,9 @@ class User(Base, UserMixin):
 
 class Course(Base):
     __tablename__ = 'courses'
+    __table_args__ = (
+        Index('ix_courses_category_id', 'category_id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100))
@@ -71,11 +74,13 @@ class Course(Base):
     rating_num: Mapped[int] = mapped_column(default=0)
     category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"))
     author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-    background_image_id: Mapped[str] = mapped_column(ForeignKey("images.id"))
+    background_image_id: Mapped[Optional[str]] = mapped_column(ForeignKey("images.id"))
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    # Меняется и при массовых UPDATE (счётчики рейтинга): источник ETag страницы курса
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
 
     author: Mapped["User"] = relationship(back_populates="courses")
-    category: Mapped["Category"] = relationship(lazy=False)
+    category: Mapped["Category"] = relationship()
     bg_image: Mapped["Image"] = relationship()
     reviews: Mapped[list["Review"]] = relationship(back_populates="course", cascade="all, delete-orphan")
 
@@ -88,36 +93,65 @@ class Course(Base):
             return self.rating_sum / self.rating_num
         return 0
 
+# Расширения, с которыми картинка отдаётся по имени в хранилище, без запроса к БД.
+# Тип определяется расширением, поэтому здесь только безопасные растровые форматы (без SVG/HTML)
+IMAGE_MIMETYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
 class Image(db.Model):
     __tablename__ = 'images'
 
     id: Mapped[str] = mapped_column(String(100), primary_key=True)
     file_name: Mapped[str] = mapped_column(String(100))
     mime_type: Mapped[str] = mapped_column(String(100))
+    # Ключ файла в хранилище — хэш содержимого (см. app/storage.py); имя столбца осталось от md5
     md5_hash: Mapped[str] = mapped_column(String(100), unique=True)
     object_id: Mapped[Optional[int]]
     object_type: Mapped[Optional[str]] = mapped_column(String(100))
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
 
     def __repr__(self):
         return '<Image %r>' % self.file_name
 
     @property
-    def storage_filename(self):
+    def storage_name(self):
+        """Ключ в хранилище с расширением (имя в URL) или None, если расширение не из IMAGE_MIMETYPES"""
         _, ext = os.path.splitext(self.file_name)
-        return self.id + ext
+        ext = ext.lower()
+        return self.md5_hash + ext if ext in IMAGE_MIMETYPES else None
+
+    def sized_url(self, size=None):
+        """URL картинки; size — пресет из IMAGE_PRESETS"""
+        storage_name = self.storage_name
+        if storage_name is None:
+            return url_for('main.image', image_id=self.id, size=size)
+        key, ext = storage_name.split('.', 1)
+        return url_for('main.stored_image', key=key, ext=ext, size=size)
 
     @property
     def url(self):
-        return url_for('main.image', image_id=self.id)
+        return self.sized_url()
 
 class Review(Base):
     __tablename__ = 'reviews'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'course_id'),
+        # Под курсорную пагинацию: сортировки newest и positive/negative
+        Index('ix_reviews_course_id_created_at', 'course_id', 'created_at', 'id'),
+        Index('ix_reviews_course_id_rating', 'course_id', 'rating', 'created_at', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     rating: Mapped[int] = mapped_column(Integer, nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(default=datetime.now, onupdate=datetime.now)
     course_id: Mapped[int] = mapped_column(ForeignKey("courses.id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
 
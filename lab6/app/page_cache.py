@@ -0,0 +1,73 @@
+import functools
+import gzip
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+from app.cache import MISSING, cache
+
+
+def _cacheable_request():
+    # Анонимам без flash-сообщений отдаётся одинаковый HTML
+    return (current_app.config.get('PAGE_CACHE', False)
+            and request.method in ('GET', 'HEAD')
+            and not current_user.is_authenticated
+            and not session.get('_flashes'))
+
+
+def page_key():
+    """Ключ страницы: эндпоинт, аргументы маршрута и строка запроса без пустых и с упорядоченными параметрами"""
+    args = sorted((name, value) for name, value in request.args.items(multi=True) if value)
+    return f'page:{request.endpoint}:{sorted(request.view_args.items())!r}:{urlencode(args)}'
+
+
+# Заголовки, которые сохраняются вместе со страницей (валидаторы условного GET)
+STORED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+def _page_response(page):
+    content_type, body, headers = page
+    response = current_app.response_class(content_type=content_type, headers=headers)
+    if request.accept_encodings['gzip']:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response.set_data(gzip.decompress(body))
+    response.headers['X-Cache'] = 'HIT'
+    # If-None-Match/If-Modified-Since сверяются с сохранёнными валидаторами — 304 без запросов к БД
+    return response.make_conditional(request)
+
+
+def cache_page(tags=(), ttl=None):
+    """Кэш целой страницы для анонимных GET-запросов.
+
+    Тело хранится сжатым gzip. tags — суррогатные ключи страницы, могут ссылаться
+    на аргументы маршрута ('course:{course_id}'); cache.invalidate(ключ) сбрасывает
+    все страницы с этим ключом во всех воркерах.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**view_args):
+            backend = cache.backend
+            if backend is None or not _cacheable_request():
+                return view(**view_args)
+
+            key = page_key()
+            page, versions = backend.lookup(key, [tag.format(**view_args) for tag in tags])
+            if page is not MISSING:
+                response = _page_response(page)
+            else:
+                response = make_response(view(**view_args))
+                # Ответы, меняющие сессию или ставящие cookie, индивидуальны
+                if response.status_code == 200 and not session.modified and 'Set-Cookie' not in response.headers:
+                    headers = [(name, response.headers[name]) for name in STORED_HEADERS if name in response.headers]
+                    page = (response.content_type,
+                            gzip.compress(response.get_data(), compresslevel=6, mtime=0),
+                            headers)
+                    backend.store(key, page, versions, ttl or current_app.config.get('PAGE_CACHE_TTL'))
+                response.headers['X-Cache'] = 'MISS'
+            response.vary.update(('Cookie', 'Accept-Encoding'))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,214 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from flask import current_app, g, request
+
+# Глубина свёрнутых стеков: глубже рекурсия не разворачивается
+MAX_STACK_DEPTH = 128
+# Ветви короче этой доли времени профиля и ветви сверх MAX_STACK_NODES не разворачиваются,
+# их время приписывается вызывающему: иначе число путей в графе вызовов растёт экспоненциально
+MIN_STACK_SHARE = 0.001
+MAX_STACK_NODES = 20_000
+CAPTURE_SUFFIXES = ('.json', '.pstats', '.folded')
+
+
+def frame_name(func):
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f'{name} ({os.path.basename(filename)}:{line})'.replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """Свёрнутые стеки для flamegraph.pl/speedscope ('a;b;c мкс') из графа вызовов pstats.
+
+    cProfile хранит только пары вызывающий -> вызываемый, поэтому время функции
+    делится между стеками пропорционально вызовам из каждого вызывающего —
+    картина приблизительная, но суммы по функциям совпадают с pstats
+    (с точностью до свёрнутых коротких ветвей).
+    """
+    callees = defaultdict(dict)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, caller_stats in callers.items():
+            callees[caller][func] = caller_stats[3]
+    min_seconds = MIN_STACK_SHARE * sum(tt for _, _, tt, _, _ in stats.stats.values())
+    stacks = Counter()
+    nodes = 0
+
+    def walk(func, path, cumulative):
+        nonlocal nodes
+        nodes += 1
+        _, _, tottime, total, _ = stats.stats[func]
+        share = cumulative / total if total else 0
+        path = path + (frame_name(func),)
+        stack = ';'.join(path)
+        stacks[stack] += tottime * share
+        for callee, callee_time in callees[func].items():
+            if frame_name(callee) in path:
+                continue
+            seconds = callee_time * share
+            if seconds >= min_seconds and nodes < MAX_STACK_NODES and len(path) < MAX_STACK_DEPTH:
+                walk(callee, path, seconds)
+            else:
+                stacks[stack] += seconds
+
+    for root in roots:
+        walk(root, (), stats.stats[root][3])
+    return {stack: round(seconds * 1_000_000) for stack, seconds in stacks.items() if seconds >= 0.5e-6}
+
+
+class ProfileStore:
+    """Снимки профиля в каталоге: <id>.json (описание) и <id>.pstats; хранятся последние max_captures.
+
+    Свёрнутые стеки <id>.folded строятся по запросу (folded), а не при сохранении:
+    сохранение идёт в teardown запроса и должно быть быстрым.
+    """
+
+    def __init__(self, directory, max_captures=50):
+        self.directory = directory
+        self.max_captures = max_captures
+
+    def path(self, capture_id, suffix):
+        return os.path.join(self.directory, capture_id + suffix)
+
+    @staticmethod
+    def new_id(endpoint):
+        # Время в начале, до микросекунд: сортировка по имени файла — это сортировка по времени
+        endpoint = (endpoint or 'unmatched').replace('.', '-')
+        return f'{datetime.utcnow():%Y%m%d-%H%M%S-%f}-{endpoint}-{uuid.uuid4().hex[:6]}'
+
+    def save(self, capture_id, profile, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        stats = pstats.Stats(profile)
+        stats.dump_stats(self.path(capture_id, '.pstats'))
+        # Описание пишется последним: снимок без него не виден в списке
+        with open(self.path(capture_id, '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'id': capture_id, **meta}, f, ensure_ascii=False)
+        self.prune()
+
+    def captures(self):
+        """Описания снимков, от старых к новым"""
+        result = []
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else ():
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                        result.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return result
+
+    def find(self, prefix):
+        """Снимок по началу id; LookupError, если таких нет или больше одного"""
+        matches = [c for c in self.captures() if c['id'].startswith(prefix)]
+        if len(matches) != 1:
+            raise LookupError(f'{len(matches)} снимков с id {prefix}*')
+        return matches[0]
+
+    def stats(self, capture_id):
+        return pstats.Stats(self.path(capture_id, '.pstats'))
+
+    def folded(self, capture_id):
+        """Путь к свёрнутым стекам снимка; файл строится из .pstats при первом обращении"""
+        path = self.path(capture_id, '.folded')
+        if not os.path.exists(path):
+            stacks = collapsed_stacks(self.stats(capture_id))
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.writelines(f'{stack} {value}\n' for stack, value in sorted(stacks.items()) if value)
+            os.replace(path + '.tmp', path)
+        return path
+
+    def prune(self):
+        for capture in self.captures()[:-self.max_captures or None]:
+            for suffix in CAPTURE_SUFFIXES:
+                try:
+                    os.remove(self.path(capture['id'], suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def diff_stats(old, new):
+    """[(функция, собственное время было, стало, совокупное было, стало)] по убыванию изменения совокупного"""
+    rows = []
+    for func in set(old.stats) | set(new.stats):
+        old_tt, old_ct = old.stats[func][2:4] if func in old.stats else (0, 0)
+        new_tt, new_ct = new.stats[func][2:4] if func in new.stats else (0, 0)
+        rows.append((frame_name(func), old_tt, new_tt, old_ct, new_ct))
+    rows.sort(key=lambda row: abs(row[4] - row[3]), reverse=True)
+    return rows
+
+
+def _requested():
+    """Профилировать ли запрос: заголовок X-Profile с PROFILER_TOKEN или выборка по PROFILE_SAMPLE_RATES"""
+    token = current_app.config['PROFILER_TOKEN']
+    header = request.headers.get('X-Profile')
+    if header is not None and token and hmac.compare_digest(header.encode(), token.encode()):
+        return True
+    rate = current_app.config['PROFILE_SAMPLE_RATES'].get(request.endpoint, 0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if not _requested():
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # С Python 3.12 профилировщик один на процесс: параллельный запрос уже профилируется
+        return
+    g.profile = profile
+    g.profile_started = time.perf_counter()
+    g.profile_id = ProfileStore.new_id(request.endpoint)
+
+
+def _mark_capture(response):
+    if g.get('profile') is not None:
+        g.profile_status = response.status_code
+        response.headers['X-Profile-Capture'] = g.profile_id
+    return response
+
+
+def _save_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profile.disable()
+    current_app.extensions['profiler'].save(g.profile_id, profile, {
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'status': g.get('profile_status', 500),
+        'duration_ms': round((time.perf_counter() - g.profile_started) * 1000, 1),
+        'release': current_app.config['RELEASE'],
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+    })
+
+
+def init_profiler(app):
+    """Профилирование отдельных запросов cProfile'ом, если PROFILER_ENABLED.
+
+    Профиль снимается от первого before_request до teardown, то есть охватывает
+    обработчики, представление и рендеринг шаблона.
+    """
+    app.config.setdefault('PROFILER_ENABLED', False)
+    app.config.setdefault('PROFILER_TOKEN', '')
+    app.config.setdefault('PROFILE_SAMPLE_RATES', {})
+    app.config.setdefault('PROFILE_MAX_CAPTURES', 50)
+    app.config.setdefault('RELEASE', '')
+    app.extensions['profiler'] = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_CAPTURES'])
+    if app.config['PROFILER_ENABLED']:
+        app.before_request(_start_profile)
+        app.after_request(_mark_capture)
+        app.teardown_request(_save_profile)
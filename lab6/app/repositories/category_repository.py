@@ -1,8 +1,11 @@
+from app.cache import cache
 from app.models import Category
 
 class CategoryRepository:
     def __init__(self, db):
         self.db = db
 
+    @cache.cached(tags=('categories',))
     def get_all_categories(self):
-        return self.db.session.execute(self.db.select(Category)).scalars()
\ No newline at end of file
+        """Список категорий (id, name) для фильтров и форм; сбрасывается при любой записи в categories"""
+        return self.db.session.execute(self.db.select(Category.id, Category.name)).all()
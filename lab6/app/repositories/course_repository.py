@@ -1,33 +1,57 @@
-from app.models import Course
+from sqlalchemy.orm import joinedload, load_only
+from app.models import Course, Image, Review, User
+from app.repositories import course_search
 
 class CourseRepository:
+    # Стратегии загрузки для страниц чтения; методы записи их не используют
+    CATALOG_OPTIONS = (
+        load_only(Course.id, Course.name, Course.short_desc, Course.rating_sum,
+                  Course.rating_num, Course.author_id, Course.background_image_id),
+        joinedload(Course.author).load_only(User.last_name, User.first_name, User.middle_name),
+        # Имя файла фона для URL картинки (отдаётся без обращения к БД)
+        joinedload(Course.bg_image).load_only(Image.file_name, Image.md5_hash),
+    )
+    PAGE_OPTIONS = (
+        joinedload(Course.category),
+        joinedload(Course.bg_image),
+    )
+
     def __init__(self, db):
         self.db = db
 
-    def _all_query(self, name, category_ids):
-        query = self.db.select(Course)
+    def _all_query(self, name, category_ids, options=()):
+        query = self.db.select(Course).options(*options)
 
         if name:
-            query = query.filter(Course.name.ilike(f'%{name}%'))
+            query = query.filter(course_search.name_filter(self.db.engine.dialect.name, name))
 
         if category_ids:
             query = query.filter(Course.category_id.in_(category_ids))
 
         return query
 
-    def get_pagination_info(self, name=None, category_ids=None):
-        query = self._all_query(name, category_ids)
+    def get_pagination_info(self, name=None, category_ids=None, options=()):
+        query = self._all_query(name, category_ids, options)
         return self.db.paginate(query)
 
-    def get_all_courses(self, name=None, category_ids=None, pagination=None):
+    def get_all_courses(self, name=None, category_ids=None, pagination=None, options=()):
         if pagination is not None:
             return pagination.items 
         
-        return self.db.session.execute(self._all_query(name, category_ids)).scalars()
+        return self.db.session.execute(self._all_query(name, category_ids, options)).unique().scalars()
 
-    def get_course_by_id(self, course_id):
-        return self.db.session.get(Course, course_id)
+    def get_course_by_id(self, course_id, options=()):
+        return self.db.session.get(Course, course_id, options=options)
     
+    def get_course_validators(self, course_id):
+        """Время изменения курса и его последнего отзыва одним запросом (None, если курса нет)"""
+        last_review_at = (self.db.select(self.db.func.max(Review.updated_at))
+                          .where(Review.course_id == Course.id)
+                          .scalar_subquery())
+        return self.db.session.execute(
+            self.db.select(Course.updated_at, last_review_at).where(Course.id == course_id)
+        ).first()
+
     def new_course(self):
         return Course()
 
@@ -48,3 +72,7 @@ class CourseRepository:
             raise e  # Пробрасываем любое другое исключение
         
         return course
+
+    def rebuild_search_index(self):
+        with self.db.engine.begin() as connection:
+            course_search.install(connection)
@@ -0,0 +1,89 @@
+"""Полнотекстовый индекс по названию курса.
+
+SQLite: теневая таблица FTS5 (токенизатор trigram, регистронезависимый для
+кириллицы), синхронизируемая триггерами. MySQL: FULLTEXT-индекс с парсером ngram.
+Запросы короче трёх символов индекс не обслуживает — для них остаётся LIKE.
+"""
+import sqlite3
+
+from sqlalchemy import DDL, Integer, column, event, func, inspect, text
+
+from app.models import Course, db
+
+MIN_QUERY_LENGTH = 3
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5("
+    "name, content='courses', content_rowid='id', tokenize='trigram case_sensitive 0')",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ai AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ad AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_au AFTER UPDATE OF name ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+SQLITE_REBUILD = "INSERT INTO courses_fts(courses_fts) VALUES ('rebuild')"
+SQLITE_DROP = "DROP TABLE IF EXISTS courses_fts"
+
+MYSQL_INDEX = 'ft_courses_name'
+MYSQL_INSTALL = f'CREATE FULLTEXT INDEX {MYSQL_INDEX} ON courses (name) WITH PARSER ngram'
+
+for statement in SQLITE_INSTALL:
+    event.listen(Course.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Course.__table__, 'after_create', DDL(MYSQL_INSTALL).execute_if(dialect='mysql'))
+event.listen(Course.__table__, 'before_drop', DDL(SQLITE_DROP).execute_if(dialect='sqlite'))
+
+
+def _unicode_lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    # Встроенные lower() и LIKE в SQLite меняют регистр только у ASCII, кириллица сравнивается как есть
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('unicode_lower', 1, _unicode_lower, deterministic=True)
+
+
+def init_sqlite_functions(app):
+    """Регистрирует unicode_lower() в каждом соединении с SQLite-базами приложения"""
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'connect', _register_sqlite_functions)
+
+
+def include_name(name, type_, parent_names):
+    """Фильтр для Alembic autogenerate: служебные таблицы FTS5 не описаны в моделях"""
+    return not (type_ == 'table' and name.startswith('courses_fts'))
+
+
+def install(connection):
+    """Создать индекс в существующей БД и заполнить его текущими курсами"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_INSTALL:
+            connection.execute(text(statement))
+        connection.execute(text(SQLITE_REBUILD))
+    elif dialect == 'mysql':
+        if MYSQL_INDEX not in {ix['name'] for ix in inspect(connection).get_indexes('courses')}:
+            connection.execute(text(MYSQL_INSTALL))
+
+
+def name_filter(dialect, name):
+    """Условие поиска подстроки `name` в названии курса"""
+    if len(name) >= MIN_QUERY_LENGTH:
+        # Фраза в кавычках: ищется как подстрока, спецсимволы синтаксиса не действуют
+        phrase = '"' + name.replace('"', '""') + '"'
+        if dialect == 'sqlite':
+            return Course.id.in_(
+                text('SELECT rowid FROM courses_fts WHERE courses_fts MATCH :name_query')
+                .bindparams(name_query=phrase)
+                .columns(column('rowid', Integer))
+            )
+        if dialect == 'mysql':
+            return text('MATCH (courses.name) AGAINST (:name_query IN BOOLEAN MODE)').bindparams(name_query=phrase)
+    # Регистр сводится в Python и в БД одинаково, в том числе для кириллицы;
+    # % и _ из запроса ищутся буквально, а не как шаблоны LIKE
+    lower = func.unicode_lower if dialect == 'sqlite' else func.lower
+    pattern = name.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return lower(Course.name).like(f'%{pattern}%', escape='\\')
@@ -1,9 +1,10 @@
-import hashlib
-import uuid
 import os
+import uuid
 from werkzeug.utils import secure_filename
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
 from app.models import Image
+from app.storage import get_storage
 
 class ImageRepository:
     def __init__(self, db):
@@ -12,23 +13,48 @@ class ImageRepository:
     def get_by_id(self, image_id):
         return self.db.session.get(Image, image_id)
 
+    def get_by_hash(self, file_hash):
+        return self.db.session.execute(self.db.select(Image).filter(Image.md5_hash == file_hash)).scalar()
+
     def add_image(self, file):
-        self.img = self.__find_by_md5_hash(file)
-        if self.img is not None:
-            return self.img
-        file_name = secure_filename(file.filename)
-        self.img = Image(
+        """Сохранить загрузку или вернуть уже сохранённую картинку с тем же содержимым.
+
+        Хранилище адресует файлы хэшем содержимого, так что дубликат не
+        занимает места, а всё состояние — локальные переменные вызова.
+        """
+        key, _ = get_storage().save(file.stream)
+        img = self.get_by_hash(key)
+        if img is not None:
+            return img
+        img = Image(
             id=str(uuid.uuid4()),
-            file_name=file_name,
+            file_name=secure_filename(file.filename),
             mime_type=file.mimetype,
-            md5_hash=self.md5_hash
+            md5_hash=key
         )
-        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], self.img.storage_filename))
-        self.db.session.add(self.img)
-        self.db.session.commit()
-        return self.img
+        self.db.session.add(img)
+        try:
+            self.db.session.commit()
+        except IntegrityError:
+            # Ту же картинку одновременно сохранил другой запрос — используем его запись
+            self.db.session.rollback()
+            img = self.get_by_hash(key)
+            if img is None:
+                raise
+        return img
 
-    def __find_by_md5_hash(self, file):
-        self.md5_hash = hashlib.md5(file.read()).hexdigest()
-        file.seek(0)
-        return self.db.session.execute(self.db.select(Image).filter(Image.md5_hash == self.md5_hash)).scalar()
+    def import_legacy_files(self):
+        """Перенести файлы из плоского UPLOAD_FOLDER (<id><расширение>) в хранилище; возвращает их число"""
+        storage = get_storage()
+        moved = 0
+        for img in self.db.session.scalars(self.db.select(Image)).all():
+            _, ext = os.path.splitext(img.file_name)
+            legacy_path = os.path.join(current_app.config['UPLOAD_FOLDER'], img.id + ext)
+            if not os.path.isfile(legacy_path):
+                continue
+            with open(legacy_path, 'rb') as f:
+                img.md5_hash, _ = storage.save(f)
+            self.db.session.commit()
+            os.remove(legacy_path)
+            moved += 1
+        return moved
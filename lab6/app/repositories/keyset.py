@@ -0,0 +1,111 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, or_
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class KeysetPage:
+    """Страница выборки, построенная по курсору (keyset) вместо OFFSET/COUNT"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _cursor_value(column, value):
+    """Значение курсора для столбца; ValueError, если тип не подходит"""
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    # Только скаляры JSON (bool — тоже int, но в курсор не попадает), и того же типа, что столбец
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(value)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if python_type in (str, int, float) and not isinstance(value, python_type):
+        raise ValueError(value)
+    # Целое вне 64 бит драйвер БД не примет (OverflowError в SQLite)
+    if isinstance(value, int) and not INT64_MIN <= value <= INT64_MAX:
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(token, columns):
+    """Разобрать курсор; для повреждённого или чужого курсора возвращается None"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_cursor_value(c, v) for c, v in zip(columns, values)]
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def _seek(order, values):
+    # (a, b, c) "после" (x, y, z) с учётом направления каждого столбца:
+    # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        clauses.append(and_(*equal, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+
+def _order_by(order):
+    return [c.desc() if descending else c.asc() for c, descending in order]
+
+
+def keyset_paginate(db, query, order, per_page, after=None, before=None):
+    """Выбрать страницу по курсору: `order` — список пар (столбец, по убыванию)"""
+    columns = [c for c, _ in order]
+    after_values = decode_cursor(after, columns) if after else None
+    before_values = decode_cursor(before, columns) if before else None
+
+    if before_values is not None:
+        # Идём назад: инвертируем порядок, затем разворачиваем результат
+        reverse = [(c, not descending) for c, descending in order]
+        query = query.where(_seek(reverse, before_values)).order_by(*_order_by(reverse))
+        items = db.session.execute(query.limit(per_page + 1)).scalars().all()
+        has_prev, has_next = len(items) > per_page, True
+        items = items[:per_page][::-1]
+    else:
+        if after_values is not None:
+            query = query.where(_seek(order, after_values))
+        items = db.session.execute(query.order_by(*_order_by(order)).limit(per_page + 1)).scalars().all()
+        has_prev, has_next = after_values is not None, len(items) > per_page
+        items = items[:per_page]
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, c.key) for c in columns])
+
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=cursor_for(items[-1]) if items and has_next else None,
+        prev_cursor=cursor_for(items[0]) if items and has_prev else None,
+    )
@@ -1,27 +1,47 @@
-from app.models import Review, Course
-from sqlalchemy import desc, asc
+from app.models import Review, Course, User
+from app.repositories.keyset import keyset_paginate
+from sqlalchemy import desc, asc, update
+from sqlalchemy.orm import joinedload
 
 class ReviewRepository:
+    # Автор отзыва одним JOIN вместо отдельного запроса на каждую карточку
+    WITH_AUTHOR_OPTIONS = (
+        joinedload(Review.user).load_only(User.last_name, User.first_name, User.middle_name),
+    )
+
     def __init__(self, db):
         self.db = db
 
-    def get_reviews_by_course(self, course_id, sort_by='newest', page=1, per_page=10):
-        """Получить отзывы для курса с пагинацией и сортировкой"""
-        query = self.db.select(Review).filter(Review.course_id == course_id)
-        
-        # Применяем сортировку
+    @staticmethod
+    def _reviews_order(sort_by):
+        """Порядок сортировки в виде пар (столбец, по убыванию); id делает порядок однозначным"""
         if sort_by == 'positive':
-            query = query.order_by(desc(Review.rating), desc(Review.created_at))
+            return [(Review.rating, True), (Review.created_at, True), (Review.id, True)]
         elif sort_by == 'negative':
-            query = query.order_by(asc(Review.rating), desc(Review.created_at))
+            return [(Review.rating, False), (Review.created_at, True), (Review.id, True)]
         else:  # newest (по умолчанию)
-            query = query.order_by(desc(Review.created_at))
+            return [(Review.created_at, True), (Review.id, True)]
+
+    def get_reviews_by_course(self, course_id, sort_by='newest', page=1, per_page=10, options=()):
+        """Получить отзывы для курса с пагинацией и сортировкой"""
+        query = self.db.select(Review).options(*options).filter(Review.course_id == course_id)
+        
+        # Применяем сортировку
+        query = query.order_by(*[desc(c) if d else asc(c) for c, d in self._reviews_order(sort_by)])
         
         return self.db.paginate(query, page=page, per_page=per_page)
 
-    def get_recent_reviews_by_course(self, course_id, limit=5):
+    def get_reviews_by_course_keyset(self, course_id, sort_by='newest', after=None, before=None, per_page=10,
+                                     options=()):
+        """Получить страницу отзывов по курсору: без OFFSET и без COUNT(*)"""
+        query = self.db.select(Review).options(*options).filter(Review.course_id == course_id)
+        return keyset_paginate(self.db, query, self._reviews_order(sort_by), per_page,
+                               after=after, before=before)
+
+    def get_recent_reviews_by_course(self, course_id, limit=5, options=()):
         """Получить последние отзывы для курса"""
-        query = self.db.select(Review).filter(Review.course_id == course_id).order_by(desc(Review.created_at)).limit(limit)
+        query = (self.db.select(Review).options(*options).filter(Review.course_id == course_id)
+                 .order_by(desc(Review.created_at), desc(Review.id)).limit(limit))
         return self.db.session.execute(query).scalars().all()
 
     def get_user_review_for_course(self, user_id, course_id):
@@ -34,35 +54,63 @@ class ReviewRepository:
         ).scalar_one_or_none()
 
     def add_review(self, user_id, course_id, rating, text):
-        """Добавить новый отзыв"""
+        """Добавить новый отзыв и обновить счётчики рейтинга курса в одной транзакции.
+
+        Повторный отзыв отсекается уникальным ограничением (user_id, course_id):
+        в этом случае пробрасывается IntegrityError.
+        """
         review = Review(
             user_id=user_id,
             course_id=course_id,
             rating=rating,
             text=text
         )
-        
+
         try:
             self.db.session.add(review)
+            self.db.session.flush()
+            # Атомарный инкремент на стороне БД: без пересчёта всех отзывов и без гонок между воркерами
+            self.db.session.execute(
+                update(Course)
+                .where(Course.id == course_id)
+                .values(rating_sum=Course.rating_sum + rating, rating_num=Course.rating_num + 1)
+                .execution_options(synchronize_session=False)
+            )
             self.db.session.commit()
             return review
         except Exception as e:
             self.db.session.rollback()
             raise e
 
-    def update_course_rating(self, course_id):
-        """Обновить рейтинг курса на основе отзывов"""
-        course = self.db.session.get(Course, course_id)
-        if course:
-            # Получаем сумму и количество оценок
-            result = self.db.session.execute(
-                self.db.select(
-                    self.db.func.sum(Review.rating).label('rating_sum'),
-                    self.db.func.count(Review.id).label('rating_num')
-                ).filter(Review.course_id == course_id)
-            ).first()
-            
-            if result:
-                course.rating_sum = result.rating_sum or 0
-                course.rating_num = result.rating_num or 0
-                self.db.session.commit()
+    def reconcile_course_ratings(self):
+        """Пересчитать rating_sum/rating_num всех курсов одним GROUP BY (устранение рассинхронизации)"""
+        totals = (
+            self.db.select(
+                Review.course_id,
+                self.db.func.sum(Review.rating).label('rating_sum'),
+                self.db.func.count(Review.id).label('rating_num')
+            )
+            .group_by(Review.course_id)
+            .subquery()
+        )
+        has_reviews = self.db.select(Review.id).where(Review.course_id == Course.id).exists()
+
+        try:
+            updated = self.db.session.execute(
+                update(Course)
+                .where(Course.id == totals.c.course_id)
+                .values(rating_sum=totals.c.rating_sum, rating_num=totals.c.rating_num)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            reset = self.db.session.execute(
+                update(Course)
+                .where(~has_reviews, Course.rating_num != 0)
+                .values(rating_sum=0, rating_num=0)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            raise e
+
+        return updated + reset
@@ -1,6 +1,13 @@
-from flask import Blueprint, render_template, send_from_directory, current_app, abort
+import os
+import re
+from flask import Blueprint, render_template, current_app, abort, redirect, request, url_for
+from PIL import Image as PILImage
 from app.repositories import CategoryRepository, ImageRepository
-from app.models import db
+from app.models import db, IMAGE_MIMETYPES
+from app.delivery import send_stored_file
+from app.page_cache import cache_page
+from app.storage import get_storage
+from app.thumbnails import get_thumbnail
 
 category_repository = CategoryRepository(db)
 image_repository = ImageRepository(db)
@@ -8,6 +15,7 @@ image_repository = ImageRepository(db)
 bp = Blueprint('main', __name__)
 
 @bp.route('/')
+@cache_page(tags=('categories',))
 def index():
     categories = category_repository.get_all_categories()
     return render_template(
@@ -15,10 +23,45 @@ def index():
         categories=categories,
     )
 
+# Файл хранилища никогда не меняется (ключ — хэш содержимого), как и его уменьшенные копии
+# (?size=пресет из IMAGE_PRESETS)
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+STORAGE_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
+def send_image(key, mimetype):
+    preset = request.args.get('size')
+    if preset is None:
+        response = get_storage().send(key, mimetype, max_age=IMAGE_MAX_AGE)
+    elif preset in current_app.config['IMAGE_PRESETS']:
+        try:
+            path = get_thumbnail(key, preset)
+        except FileNotFoundError:
+            abort(404)
+        except (OSError, PILImage.DecompressionBombError):
+            # Pillow не смог декодировать загрузку — отдаётся оригинал
+            return redirect(url_for(request.endpoint, **request.view_args))
+        thumbnails_dir = current_app.extensions['thumbnails'].directory
+        response = send_stored_file('thumbnails', thumbnails_dir,
+                                    os.path.relpath(path, thumbnails_dir).replace(os.sep, '/'),
+                                    mimetype='image/webp', max_age=IMAGE_MAX_AGE)
+    else:
+        abort(404)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/images/<key>.<ext>')
+def stored_image(key, ext):
+    """Картинка по имени в хранилище (Image.storage_name): файл находится без запроса к БД"""
+    mimetype = IMAGE_MIMETYPES.get(f'.{ext}')
+    if mimetype is None or not STORAGE_KEY_RE.match(key):
+        abort(404)
+    return send_image(key, mimetype)
+
 @bp.route('/images/<image_id>')
 def image(image_id):
+    """Картинка по id — для старых ссылок и загрузок с расширением не из IMAGE_MIMETYPES"""
     img = image_repository.get_by_id(image_id)
-    if image is None:
+    if img is None:
         abort(404)
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'],
-                               img.storage_filename)
+    return send_image(img.md5_hash, img.mime_type)
@@ -0,0 +1,201 @@
+"""Большой воспроизводимый набор данных для нагрузочного тестирования (flask seed).
+
+Строки пишутся пакетами через INSERT таблиц (executemany), минуя ORM: сотни тысяч
+пользователей и миллионы отзывов создаются за минуты. Все значения, включая даты
+и id картинок, берутся из random.Random(seed), поэтому при том же seed и той же
+исходной БД набор получается одинаковым. Счётчики рейтинга курсов считаются при
+генерации отзывов и пишутся вместе с курсами.
+"""
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from PIL import Image as PILImage
+from werkzeug.security import generate_password_hash
+
+from app.models import db, Category, Course, Image, Review, User
+from app.storage import get_storage
+
+# Даты отсчитываются от фиксированного момента, а не от дня генерации
+EPOCH = datetime(2024, 1, 1)
+PERIOD_SECONDS = 365 * 24 * 60 * 60
+
+FIRST_NAMES = ('Иван', 'Мария', 'Алексей', 'Анна', 'Дмитрий', 'Елена', 'Сергей', 'Ольга', 'Павел', 'Наталья')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков')
+TOPICS = ('Python', 'Алгоритмы', 'Базы данных', 'Веб-разработка', 'Машинное обучение', 'Дизайн интерфейсов',
+          'Сети', 'Linux', 'Математика', 'Английский язык', 'Статистика', 'Менеджмент')
+LEVELS = ('для начинающих', 'с нуля', 'продвинутый курс', 'практикум', 'интенсив', 'для профессионалов')
+WORDS = ('курс', 'задание', 'лекция', 'практика', 'пример', 'материал', 'преподаватель', 'тема', 'проект',
+         'понятно', 'интересно', 'полезно', 'сложно', 'быстро', 'подробно', 'хорошо', 'очень', 'много')
+# Оценки 0–5 смещены к высоким, как в настоящих отзывах (накопленные веса для random.choices)
+RATING_CUM_WEIGHTS = (2, 5, 10, 25, 60, 100)
+IMAGE_SIZE = (660, 340)
+
+
+def _next_id(connection, model):
+    return (connection.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+
+def _moment(rng):
+    return EPOCH + timedelta(seconds=rng.randrange(PERIOD_SECONDS))
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    """Генератор набора данных; каждый шаг возвращает id созданных строк"""
+
+    def __init__(self, connection, seed=0, batch_size=10_000, echo=print):
+        self.connection = connection
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.echo = echo
+
+    def insert(self, model, rows):
+        total = 0
+        for batch in _batches(rows, self.batch_size):
+            self.connection.execute(model.__table__.insert(), batch)
+            self.connection.commit()
+            total += len(batch)
+        return total
+
+    def users(self, count, password):
+        rng, first_id = self.rng, _next_id(self.connection, User)
+        # Один хэш на всех: scrypt на каждого пользователя занял бы часы
+        password_hash = generate_password_hash(password)
+        self.insert(User, ({
+            'id': user_id,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'middle_name': None,
+            'login': f'seed{user_id}',
+            'password_hash': password_hash,
+            'created_at': _moment(rng),
+        } for user_id in range(first_id, first_id + count)))
+        self.echo(f'Пользователи: {count} (логины seed{first_id}…seed{first_id + count - 1})')
+        return range(first_id, first_id + count)
+
+    def categories(self, count, depth):
+        """Дерево категорий: примерно каждая десятая — корень, остальные — потомки не глубже depth уровней"""
+        rng, first_id = self.rng, _next_id(self.connection, Category)
+        roots = max(1, count // 10)
+        rows, parents = [], []
+        for category_id in range(first_id, first_id + count):
+            if category_id - first_id < roots:
+                parent_id, level = None, 1
+            else:
+                parent_id, parent_level = rng.choice(parents)
+                level = parent_level + 1
+            rows.append({'id': category_id, 'name': f'Категория {category_id}', 'parent_id': parent_id})
+            if level < depth:
+                parents.append((category_id, level))
+        self.insert(Category, rows)
+        self.echo(f'Категории: {count}, глубина до {depth}')
+        return range(first_id, first_id + count)
+
+    def images(self, count):
+        """Картинки-фоны: файлы в хранилище и строки images; одинаковые по содержимому не дублируются"""
+        rng, storage = self.rng, get_storage()
+        rows = {}
+        for i in range(count):
+            picture = PILImage.new('RGB', IMAGE_SIZE, tuple(rng.randrange(256) for _ in range(3)))
+            # Номер в левом верхнем пикселе: картинки различаются и при совпадении цвета
+            picture.putpixel((0, 0), (i & 255, (i >> 8) & 255, (i >> 16) & 255))
+            data = io.BytesIO()
+            picture.save(data, 'PNG')
+            data.seek(0)
+            key, _ = storage.save(data)
+            image_id, created_at = str(uuid.UUID(int=rng.getrandbits(128), version=4)), _moment(rng)
+            rows.setdefault(key, {
+                'id': image_id,
+                'file_name': f'seed-{i}.png',
+                'mime_type': 'image/png',
+                'md5_hash': key,
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+        existing = dict(self.connection.execute(
+            db.select(Image.md5_hash, Image.id).where(Image.md5_hash.in_(list(rows)))).all()) if rows else {}
+        self.insert(Image, (row for key, row in rows.items() if key not in existing))
+        self.echo(f'Картинки: {count}')
+        return [existing.get(key, row['id']) for key, row in rows.items()]
+
+    def courses(self, count, reviews, user_ids, category_ids, image_ids):
+        """Курсы и их отзывы; число отзывов на курс распределено по Парето — у немногих курсов их большинство"""
+        rng, first_id = self.rng, _next_id(self.connection, Course)
+        weights = [rng.paretovariate(1.2) for _ in range(count)]
+        scale = reviews / sum(weights) if weights else 0
+        review_id = _next_id(self.connection, Review)
+        course_rows, review_rows, total = [], [], 0
+        for course_id, weight in zip(range(first_id, first_id + count), weights):
+            created_at = _moment(rng)
+            reviewers = rng.sample(user_ids, min(len(user_ids), round(weight * scale)))
+            ratings = rng.choices(range(6), cum_weights=RATING_CUM_WEIGHTS, k=len(reviewers))
+            for user_id, rating in zip(reviewers, ratings):
+                moment = _moment(rng)
+                review_rows.append({
+                    'id': review_id,
+                    'rating': rating,
+                    'text': _text(rng, rng.randint(5, 40)),
+                    'created_at': moment,
+                    'updated_at': moment,
+                    'course_id': course_id,
+                    'user_id': user_id,
+                })
+                review_id += 1
+            course_rows.append({
+                'id': course_id,
+                'name': f'{rng.choice(TOPICS)}: {rng.choice(LEVELS)} №{course_id}',
+                'short_desc': _text(rng, 15),
+                'full_desc': _text(rng, 120),
+                'rating_sum': sum(ratings),
+                'rating_num': len(ratings),
+                'category_id': rng.choice(category_ids),
+                'author_id': rng.choice(user_ids),
+                'background_image_id': rng.choice(image_ids) if image_ids and rng.random() < 0.8 else None,
+                'created_at': created_at,
+                'updated_at': created_at,
+            })
+            # Курсы пишутся раньше своих отзывов (внешний ключ)
+            if len(course_rows) >= self.batch_size or len(review_rows) >= self.batch_size:
+                total += self._flush_courses(course_rows, review_rows)
+                course_rows, review_rows = [], []
+        total += self._flush_courses(course_rows, review_rows)
+        self.echo(f'Курсы: {count}, отзывы: {total}')
+        return range(first_id, first_id + count)
+
+    def _flush_courses(self, course_rows, review_rows):
+        self.insert(Course, course_rows)
+        return self.insert(Review, review_rows)
+
+
+def seed(users=100_000, categories=500, category_depth=3, courses=50_000, reviews=5_000_000, images=1_000,
+         seed=0, batch_size=10_000, password='password', echo=print):
+    """Сгенерировать набор данных в текущей БД"""
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'sqlite':
+            # Набор можно сгенерировать заново, поэтому надёжность записи не важна, а скорость — да
+            connection.exec_driver_sql('PRAGMA synchronous = OFF')
+        seeder = Seeder(connection, seed=seed, batch_size=batch_size, echo=echo)
+        user_ids = seeder.users(users, password)
+        category_ids = seeder.categories(categories, category_depth)
+        image_ids = seeder.images(images)
+        seeder.courses(courses, reviews, user_ids, category_ids, image_ids)
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA synchronous = FULL')
+            connection.exec_driver_sql('ANALYZE')
+            connection.commit()
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from flask import Response, current_app
+from werkzeug.utils import import_string
+
+from app.delivery import send_stored_file
+
+CHUNK_SIZE = 64 * 1024
+# Загрузка в S3 копится в памяти до этого размера, дальше — во временном файле
+S3_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def content_hash():
+    """Хэш содержимого — он же ключ файла: blake2b быстрее md5 и есть в hashlib"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def shard(key):
+    """Двухуровневое разбиение: ab/cd/abcd… — в каталоге не больше 256 подкаталогов"""
+    return f'{key[:2]}/{key[2:4]}/{key}'
+
+
+def _copy_hashing(stream, target):
+    digest = content_hash()
+    size = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class LocalStorage:
+    """Файлы по ключу-хэшу содержимого в каталоге root, разбитом на подкаталоги"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *shard(key).split('/'))
+
+    def save(self, stream, suffix=''):
+        """Записать поток и вернуть (ключ, размер); одинаковое содержимое хранится один раз.
+
+        Поток читается один раз: куски хэшируются и пишутся во временный файл,
+        который затем атомарно переименовывается (или удаляется, если такой
+        файл уже есть).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                file_hash, size = _copy_hashing(stream, tmp)
+            key = file_hash + suffix
+            path = self.path(key)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return key, size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def send(self, key, mimetype, max_age=None):
+        return send_stored_file('images', self.root, shard(key), mimetype=mimetype, max_age=max_age)
+
+
+class S3Storage:
+    """Те же ключи в бакете S3-совместимого хранилища (AWS, MinIO и т. п.).
+
+    client — клиент boto3 или любой объект с его методами head_object,
+    put_object, get_object и delete_object.
+    """
+
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def object_key(self, key):
+        return self.prefix + shard(key)
+
+    def save(self, stream, suffix=''):
+        with tempfile.SpooledTemporaryFile(max_size=S3_SPOOL_SIZE) as spool:
+            file_hash, size = _copy_hashing(stream, spool)
+            key = file_hash + suffix
+            if not self.exists(key):
+                spool.seek(0)
+                self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=spool)
+        return key, size
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except self.client.exceptions.ClientError as err:
+            if err.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def open(self, key):
+        # Тело ответа S3 не поддерживает seek, а Pillow он нужен
+        body = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))['Body']
+        return io.BytesIO(body.read())
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def send(self, key, mimetype, max_age=None):
+        obj = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        response = Response(iter(lambda: obj['Body'].read(CHUNK_SIZE), b''), mimetype=mimetype,
+                            direct_passthrough=True)
+        response.content_length = obj['ContentLength']
+        if max_age is not None:
+            response.cache_control.max_age = max_age
+        return response
+
+
+def create_storage(config):
+    """Хранилище по STORAGE_TYPE: 'local' (UPLOAD_FOLDER), 's3' (нужен boto3)
+    или путь импорта фабрики, принимающей конфиг приложения"""
+    storage_type = config.get('STORAGE_TYPE', 'local')
+    if storage_type == 'local':
+        return LocalStorage(config['UPLOAD_FOLDER'])
+    if storage_type == 's3':
+        import boto3
+        client = boto3.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL'))
+        return S3Storage(client, config['S3_BUCKET'], config.get('S3_PREFIX', ''))
+    return import_string(storage_type)(config)
+
+
+def init_storage(app):
+    app.extensions['storage'] = create_storage(app.config)
+
+
+def get_storage():
+    return current_app.extensions['storage']
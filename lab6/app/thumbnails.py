@@ -0,0 +1,139 @@
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from flask import current_app
+from PIL import ExifTags, Image, ImageOps
+
+from app.instrumentation import timed
+from app.storage import get_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: уменьшенные копии согласуются только между потоками одного процесса
+    fcntl = None
+
+# Число файлов-блокировок: ключи распределяются по ним, каталог блокировок не растёт
+LOCK_STRIPES = 64
+
+
+class ThumbnailCache:
+    """Дисковый кэш уменьшенных копий изображений с вытеснением по LRU.
+
+    Копия создаётся при первом запросе. Пока один воркер (процесс или поток)
+    её рендерит, остальные ждут на блокировке и затем отдают готовый файл.
+    Время последнего обращения хранится в mtime файла; когда суммарный размер
+    превышает max_bytes, удаляются самые давно запрошенные копии.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def path(self, key, preset):
+        return os.path.join(self.directory, preset, f'{key}.webp')
+
+    def get(self, key, preset, render):
+        """Путь к копии; render(путь) вызывается, только если её ещё нет ни у одного воркера."""
+        path = self.path(key, preset)
+        if self._touch(path):
+            return path
+        with self._lock(f'{preset}/{key}'):
+            if self._touch(path):
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            os.close(fd)
+            try:
+                render(tmp_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        entries = []
+        for preset in os.listdir(self.directory):
+            preset_dir = os.path.join(self.directory, preset)
+            if preset.startswith('.') or not os.path.isdir(preset_dir):
+                continue
+            with os.scandir(preset_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.webp'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # уже вытеснен другим воркером
+            total -= size
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def _lock(self, key):
+        stripe = int(hashlib.sha1(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+        with self._locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            locks_dir = os.path.join(self.directory, '.locks')
+            os.makedirs(locks_dir, exist_ok=True)
+            with open(os.path.join(locks_dir, str(stripe)), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def render_thumbnail(source, size, target_path):
+    """Уменьшить изображение так, чтобы оно покрывало прямоугольник size (как background-size: cover)."""
+    with Image.open(source) as image:
+        if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            # Снимок хранится повёрнутым на 90°: до exif_transpose ширина и высота поменяны местами
+            stored_size = size[::-1]
+        else:
+            stored_size = size
+        scale = max(stored_size[0] / image.width, stored_size[1] / image.height)
+        if scale < 1:
+            # Для JPEG декодирование сразу в уменьшенном масштабе (1/2, 1/4, 1/8)
+            image.draft('RGB', (round(image.width * scale), round(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        scale = max(size[0] / image.width, size[1] / image.height)
+        if scale < 1:
+            image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image.convert('RGBA' if has_alpha else 'RGB').save(target_path, 'WEBP', quality=80, method=4)
+
+
+def init_thumbnails(app):
+    app.extensions['thumbnails'] = ThumbnailCache(app.config['THUMBNAIL_FOLDER'], app.config['THUMBNAIL_CACHE_MAX_BYTES'])
+
+
+def get_thumbnail(key, preset):
+    """Путь к уменьшенной копии файла хранилища key для пресета из IMAGE_PRESETS."""
+    size = current_app.config['IMAGE_PRESETS'][preset]
+
+    def render(target_path):
+        with timed('img'), get_storage().open(key) as source:
+            render_thumbnail(source, size, target_path)
+
+    return current_app.extensions['thumbnails'].get(key, preset, render)
@@ -0,0 +1,72 @@
+"""query indexes
+
+Revision ID: 3a9c5e1f7d20
+Revises: b4e0282dd938
+Create Date: 2026-10-17 15:32:40.771208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9c5e1f7d20'
+down_revision = 'b4e0282dd938'
+branch_labels = None
+depends_on = None
+
+# Должно совпадать с app/repositories/course_search.py
+SQLITE_SEARCH = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5("
+    "name, content='courses', content_rowid='id', tokenize='trigram case_sensitive 0')",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ai AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ad AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_au AFTER UPDATE OF name ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO courses_fts(courses_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    with op.batch_alter_table('courses', schema=None) as batch_op:
+        batch_op.alter_column('background_image_id',
+               existing_type=sa.String(length=100),
+               nullable=True)
+        batch_op.create_index('ix_courses_category_id', ['category_id'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_unique_constraint(batch_op.f('uq_reviews_user_id'), ['user_id', 'course_id'])
+        batch_op.create_index('ix_reviews_course_id_created_at', ['course_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_reviews_course_id_rating', ['course_id', 'rating', 'created_at', 'id'], unique=False)
+
+    # Поиск по названию курса: после пересоздания courses, иначе триггеры потеряются
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_SEARCH:
+            op.execute(statement)
+    elif dialect == 'mysql':
+        op.execute('CREATE FULLTEXT INDEX ft_courses_name ON courses (name) WITH PARSER ngram')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS courses_fts')
+        for trigger in ('courses_fts_ai', 'courses_fts_ad', 'courses_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    elif dialect == 'mysql':
+        op.drop_index('ft_courses_name', table_name='courses')
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_course_id_rating')
+        batch_op.drop_index('ix_reviews_course_id_created_at')
+        batch_op.drop_constraint(batch_op.f('uq_reviews_user_id'), type_='unique')
+
+    with op.batch_alter_table('courses', schema=None) as batch_op:
+        batch_op.drop_index('ix_courses_category_id')
+        batch_op.alter_column('background_image_id',
+               existing_type=sa.String(length=100),
+               nullable=False)
@@ -0,0 +1,53 @@
+"""updated_at
+
+Revision ID: 8d1e5f3a2c74
+Revises: 3a9c5e1f7d20
+Create Date: 2026-10-17 18:12:05.316842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d1e5f3a2c74'
+down_revision = '3a9c5e1f7d20'
+branch_labels = None
+depends_on = None
+
+TABLES = ('courses', 'reviews', 'images')
+
+# Пересоздание courses в SQLite (batch) удаляет её триггеры — ставим их заново
+SQLITE_SEARCH_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ai AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_ad AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_au AFTER UPDATE OF name ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+]
+
+
+def restore_search_triggers():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # Существующие строки не менялись с момента создания
+        op.execute(f'UPDATE {table} SET updated_at = created_at')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+    restore_search_triggers()
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
+    restore_search_triggers()
@@ -0,0 +1,132 @@
+import re
+import pytest
+from sqlalchemy import event
+from app import create_app
+from app.models import db, User, Course, Category, Review
+# Плагин бюджетов маршрутов (tests/query_budget.py): опция --update-budgets и фикстура query_budget
+from query_budget import pytest_addoption, query_budget  # noqa: F401
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_ECHO': False,
+        'CACHE_TYPE': 'simple',
+        'PAGE_CACHE': False,
+        'UPLOAD_FOLDER': str(tmp_path / 'images'),
+        'THUMBNAIL_FOLDER': str(tmp_path / 'thumbnails'),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+        'SECRET_KEY': 'test-secret-key'
+    })
+    
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def user(app):
+    user = User(first_name='Test', last_name='User', login='testuser')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def category(app):
+    category = Category(name='Test Category')
+    db.session.add(category)
+    db.session.commit()
+    return category
+
+@pytest.fixture
+def course(app, user, category):
+    course = Course(
+        name='Test Course',
+        short_desc='Short description',
+        full_desc='Full description',
+        author_id=user.id,
+        category_id=category.id
+    )
+    db.session.add(course)
+    db.session.commit()
+    return course
+
+@pytest.fixture
+def catalog(app, user, category):
+    """Курсы разных авторов, у каждого курса — отзывы разных пользователей"""
+    authors = [User(first_name='A', last_name=f'Author{i}', login=f'author{i}', password_hash='x') for i in range(12)]
+    db.session.add_all(authors)
+    db.session.flush()
+    courses = [
+        Course(name=f'Course {i}', short_desc='s', full_desc='f', author_id=author.id, category_id=category.id)
+        for i, author in enumerate(authors)
+    ]
+    db.session.add_all(courses)
+    db.session.flush()
+    for author in authors[:6]:
+        db.session.add(Review(rating=4, text='ok', user_id=author.id, course_id=courses[0].id))
+    db.session.commit()
+    course_ids = [c.id for c in courses]
+    # Пустая identity map: иначе ленивые загрузки обслуживались бы без запросов к БД
+    db.session.expunge_all()
+    return course_ids
+
+@pytest.fixture
+def queries(app):
+    """Список SQL-запросов, выполненных за время теста"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+class QueryPlanRecorder:
+    """Собирает выполненные запросы и проверяет их планы через EXPLAIN QUERY PLAN (SQLite)"""
+
+    FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.startswith('EXPLAIN'):
+            self.statements.append((statement, parameters))
+
+    def full_scans(self, allowed_tables=()):
+        """Запросы с условием WHERE, план которых читает таблицу целиком"""
+        tables = set(db.metadata.tables) - set(allowed_tables)
+        offenders = []
+        with self.engine.connect() as connection:
+            for statement, parameters in self.statements:
+                # Выборка без условий (листинг, COUNT всего каталога) сканирует таблицу намеренно
+                if not re.search(r'\bWHERE\b', statement):
+                    continue
+                plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                scanned = [m.group(1) for row in plan if (m := self.FULL_SCAN.match(row[-1]))]
+                if any(t in tables for t in scanned):
+                    offenders.append((statement, [row[-1] for row in plan]))
+        return offenders
+
+    def assert_no_full_scans(self, allowed_tables=()):
+        offenders = self.full_scans(allowed_tables)
+        assert not offenders, 'Полное сканирование таблицы:\n' + '\n\n'.join(
+            f'{statement}\n  -> ' + '\n  -> '.join(plan) for statement, plan in offenders
+        )
+
+@pytest.fixture
+def query_plans(app):
+    recorder = QueryPlanRecorder(db.engine)
+    event.listen(db.engine, 'before_cursor_execute', recorder.before_cursor_execute)
+    yield recorder
+    event.remove(db.engine, 'before_cursor_execute', recorder.before_cursor_execute)
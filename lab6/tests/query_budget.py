@@ -0,0 +1,138 @@
+"""Бюджеты маршрутов: число SQL-запросов, прочитанных строк и время ответа.
+
+Бюджеты хранятся в budgets.json рядом с тестами. После осознанного изменения
+маршрута их пересчитывают и коммитят вместе с изменением:
+
+    pytest tests/test_budgets.py --update-budgets
+"""
+import json
+import math
+import os
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.models import db
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+# Запас при --update-budgets: число запросов фиксируется точно, строки растут вместе с
+# данными фикстур, а время зависит от машины, поэтому ловит только грубые регрессии
+ROWS_HEADROOM = 1.1
+MS_HEADROOM = 3
+MS_MIN = 200
+
+
+class RouteMeasurement:
+    """Замеры одного HTTP-запроса: выполненные SQL-запросы и время ответа"""
+
+    def __init__(self):
+        # (запрос, параметры, прочитано строк или None для записи)
+        self.statements = []
+        self.ms = 0.0
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+    @property
+    def rows(self):
+        return sum(rows or 0 for _, _, rows in self.statements)
+
+    def as_budget(self):
+        return {
+            'queries': self.queries,
+            'rows': math.ceil(self.rows * ROWS_HEADROOM),
+            'ms': max(MS_MIN, math.ceil(self.ms * MS_HEADROOM)),
+        }
+
+    def report(self):
+        return '\n\n'.join(
+            f'[{i}] {"-" if rows is None else rows} строк\n{statement}\nПараметры: {parameters!r}'
+            for i, (statement, parameters, rows) in enumerate(self.statements, 1)
+        )
+
+
+class QueryBudget:
+    """Измеряет запросы тестового клиента и сверяет их с budgets.json"""
+
+    def __init__(self, budgets, update=False):
+        self.budgets = budgets
+        self.update = update
+        self.measured = {}
+        self._current = None
+        self._overhead = 0.0
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._current is None or statement.startswith('EXPLAIN'):
+            return
+        rows = None
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            # Курсор DBAPI в обход SQLAlchemy: подсчёт не попадает ни в замеры, ни в Server-Timing,
+            # а видит те же данные, что и сам запрос (та же транзакция)
+            started = time.perf_counter()
+            counter = conn.connection.dbapi_connection.cursor()
+            try:
+                counter.execute(f'SELECT count(*) FROM ({statement}) AS budget_rows', parameters)
+                rows = counter.fetchone()[0]
+            finally:
+                counter.close()
+            self._overhead += time.perf_counter() - started
+        self._current.statements.append((statement, parameters, rows))
+
+    def measure(self, client, method, url, **kwargs):
+        """Выполнить запрос тестовым клиентом; возвращает (ответ, RouteMeasurement)"""
+        self._current, self._overhead = RouteMeasurement(), 0.0
+        event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        try:
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+        measurement, self._current = self._current, None
+        measurement.ms = (elapsed - self._overhead) * 1000
+        return response, measurement
+
+    def check(self, name, measurement):
+        """Упасть со списком SQL-запросов, если маршрут вышел за бюджет"""
+        if self.update:
+            self.measured[name] = measurement.as_budget()
+            return
+        budget = self.budgets.get(name)
+        if budget is None:
+            pytest.fail(f'Для {name} нет бюджета в {os.path.basename(BUDGETS_PATH)}: '
+                        f'запустите тесты с --update-budgets', pytrace=False)
+        actual = {'queries': measurement.queries, 'rows': measurement.rows, 'ms': round(measurement.ms, 1)}
+        exceeded = [f'  {key}: {actual[key]} при бюджете {limit}'
+                    for key, limit in budget.items() if actual[key] > limit]
+        if exceeded:
+            pytest.fail('\n'.join([f'{name}: бюджет превышен', *exceeded, '', measurement.report()]),
+                        pytrace=False)
+
+
+def load_budgets():
+    try:
+        with open(BUDGETS_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_budgets(budgets):
+    with open(BUDGETS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-budgets', action='store_true',
+                     help='Записать замеры маршрутов в tests/budgets.json вместо проверки')
+
+
+@pytest.fixture(scope='session')
+def query_budget(request):
+    budget = QueryBudget(load_budgets(), update=request.config.getoption('--update-budgets'))
+    yield budget
+    if budget.update and budget.measured:
+        save_budgets({**budget.budgets, **budget.measured})
@@ -0,0 +1,147 @@
+import io
+import uuid
+from collections import namedtuple
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app
+from app.models import db, User, Course, Category, Review, Image
+from app.storage import get_storage
+from query_budget import QueryBudget
+
+USERS = 40
+COURSES = 30
+# Больше двух страниц отзывов и 5 последних на странице курса
+COURSE_REVIEWS = 30
+
+@pytest.fixture
+def app(tmp_path):
+    # Кэш данных работает как в продакшене (прогревается первым запросом), а кэши страниц
+    # и фрагментов выключены — иначе запросы и рендеринг маршрута не выполнялись бы вовсе
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_ECHO': False,
+        'CACHE_TYPE': 'simple',
+        'PAGE_CACHE': False,
+        'FRAGMENT_CACHE_MAX_BYTES': 0,
+        'SLOW_QUERY_MS': 10 ** 6,
+        'UPLOAD_FOLDER': str(tmp_path / 'images'),
+        'THUMBNAIL_FOLDER': str(tmp_path / 'thumbnails'),
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def dataset(app):
+    """Дерево категорий, десятки пользователей и курсов с фонами, у первого курса — несколько страниц отзывов"""
+    # Дешёвый хэш: вход в бюджете не должен упираться в scrypt
+    password_hash = generate_password_hash('password', method='pbkdf2:sha256:1000')
+    users = [User(first_name=f'Имя{i}', last_name=f'Фамилия{i}', login=f'user{i}', password_hash=password_hash)
+             for i in range(USERS)]
+    roots = [Category(name=f'Раздел {i}') for i in range(4)]
+    db.session.add_all(users + roots)
+    db.session.flush()
+    children = [Category(name=f'Подраздел {i}.{j}', parent_id=root.id) for i, root in enumerate(roots) for j in range(3)]
+    images = []
+    for i in range(6):
+        key, _ = get_storage().save(io.BytesIO(b'png %d' % i))
+        images.append(Image(id=str(uuid.uuid4()), file_name=f'bg{i}.png', mime_type='image/png', md5_hash=key))
+    db.session.add_all(children + images)
+    db.session.flush()
+    courses = [
+        Course(name=f'Курс {i}', short_desc='Кратко', full_desc='Подробно', author_id=users[i % 10].id,
+               category_id=children[i % len(children)].id,
+               background_image_id=images[i % len(images)].id if i % 2 == 0 else None)
+        for i in range(COURSES)
+    ]
+    db.session.add_all(courses)
+    db.session.flush()
+    # user0 отзывов не оставлял: от его имени создаётся новый отзыв
+    reviews = [Review(rating=i % 6, text=f'Отзыв {i}', user_id=users[i].id, course_id=courses[0].id)
+               for i in range(1, COURSE_REVIEWS + 1)]
+    reviews += [Review(rating=4, text='Отзыв', user_id=user.id, course_id=course.id)
+                for course in courses[1:] for user in users[1:3]]
+    db.session.add_all(reviews)
+    for course in courses:
+        course.rating_sum = sum(r.rating for r in reviews if r.course_id == course.id)
+        course.rating_num = sum(1 for r in reviews if r.course_id == course.id)
+    db.session.commit()
+    data = {
+        'course_id': courses[0].id,
+        'category_id': children[0].id,
+        'author_id': users[0].id,
+        'image_id': images[0].id,
+        'image_key': images[0].md5_hash,
+    }
+    db.session.expunge_all()
+    return data
+
+# login — войти как user0 перед замером; warm_up — сначала выполнить запрос без замера
+# (шаблоны компилируются, кэш данных заполняется), только для запросов без побочных эффектов
+Route = namedtuple('Route', 'method url login data warm_up', defaults=(False, None, True))
+
+# Ключ совпадает с ключом в budgets.json: '<метод> <правило URL>' и пометка варианта в скобках
+ROUTES = {
+    'GET /': Route('GET', '/'),
+    'GET /courses/': Route('GET', '/courses/'),
+    'GET /courses/ (вход)': Route('GET', '/courses/', login=True),
+    'GET /courses/new': Route('GET', '/courses/new', login=True),
+    'POST /courses/create': Route('POST', '/courses/create', login=True, data={
+        'author_id': '{author_id}', 'category_id': '{category_id}', 'name': 'Новый курс',
+        'short_desc': 'Кратко', 'full_desc': 'Подробно'}, warm_up=False),
+    'GET /courses/<int:course_id>': Route('GET', '/courses/{course_id}'),
+    'GET /courses/<int:course_id> (вход)': Route('GET', '/courses/{course_id}', login=True),
+    'GET /courses/<int:course_id>/reviews': Route('GET', '/courses/{course_id}/reviews'),
+    'GET /courses/<int:course_id>/reviews (вход)': Route('GET', '/courses/{course_id}/reviews', login=True),
+    'POST /courses/<int:course_id>/reviews/create': Route('POST', '/courses/{course_id}/reviews/create', login=True,
+                                                          data={'rating': '5', 'text': 'Отлично'}, warm_up=False),
+    'GET /auth/login': Route('GET', '/auth/login'),
+    'POST /auth/login': Route('POST', '/auth/login', data={'login': 'user0', 'password': 'password'},
+                              warm_up=False),
+    'GET /auth/logout': Route('GET', '/auth/logout', login=True, warm_up=False),
+    'GET /images/<key>.<ext>': Route('GET', '/images/{image_key}.png'),
+    'GET /images/<image_id>': Route('GET', '/images/{image_id}'),
+    'GET /metrics': Route('GET', '/metrics'),
+}
+
+class TestRouteBudgets:
+    @pytest.mark.parametrize('name', ROUTES)
+    def test_within_budget(self, client, dataset, query_budget, name):
+        route = ROUTES[name]
+        url = route.url.format(**dataset)
+        data = {key: value.format(**dataset) for key, value in route.data.items()} if route.data else None
+        if route.login:
+            # Со страницей после входа: заодно прогревается кэш справочников
+            client.post('/auth/login', data={'login': 'user0', 'password': 'password'}, follow_redirects=True)
+        if route.warm_up:
+            client.open(url, method=route.method, data=data)
+
+        response, measurement = query_budget.measure(client, route.method, url, data=data)
+
+        assert response.status_code < 400
+        query_budget.check(name, measurement)
+
+    def test_every_route_has_a_budget(self, app):
+        covered = {name.split(' (')[0] for name in ROUTES}
+        rules = {f'{method} {rule.rule}' for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+                 for method in rule.methods - {'HEAD', 'OPTIONS'}}
+
+        assert rules - covered == set()
+
+    def test_reports_offending_queries(self, client, dataset):
+        budget = QueryBudget({'GET /courses/': {'queries': 1, 'rows': 1000}})
+
+        _, measurement = budget.measure(client, 'GET', '/courses/')
+        with pytest.raises(pytest.fail.Exception) as excinfo:
+            budget.check('GET /courses/', measurement)
+
+        message = str(excinfo.value)
+        assert 'queries: 3 при бюджете 1' in message
+        assert 'rows:' not in message
+        assert 'FROM courses' in message
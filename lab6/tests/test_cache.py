@@ -0,0 +1,198 @@
+import gzip
+import types
+import pytest
+from app import cache as cache_module
+from app.cache import MemoryBackend, SQLiteBackend, TieredCache, cache
+from app.models import db, Category
+from app.repositories import CategoryRepository
+
+category_repository = CategoryRepository(db)
+
+@pytest.fixture
+def workers(tmp_path):
+    """Два «воркера»: у каждого свой L1, L2 — общий файл"""
+    path = str(tmp_path / 'cache.db')
+    return TieredCache(MemoryBackend(), SQLiteBackend(path)), TieredCache(MemoryBackend(), SQLiteBackend(path))
+
+class TestBackends:
+    def test_lru_evicts_least_recently_used(self):
+        l1 = TieredCache(MemoryBackend(max_entries=2))
+        for key in ('a', 'b'):
+            l1.get_or_set(key, lambda: key)
+        l1.get_or_set('a', lambda: 'stale')
+        l1.get_or_set('c', lambda: 'c')
+
+        assert l1.get_or_set('a', lambda: 'recomputed') == 'a'
+        assert l1.get_or_set('b', lambda: 'recomputed') == 'recomputed'
+
+    def test_ttl_expires_entries(self, monkeypatch):
+        l1 = TieredCache(MemoryBackend())
+        now = 1000.0
+        monkeypatch.setattr(cache_module, 'time', types.SimpleNamespace(time=lambda: now))
+        l1.get_or_set('key', lambda: 'old', ttl=10)
+
+        now += 11
+        assert l1.get_or_set('key', lambda: 'new', ttl=10) == 'new'
+
+    def test_shared_l2_serves_other_worker(self, workers):
+        first, second = workers
+        first.get_or_set('key', lambda: [1, 2, 3], tags=['courses'])
+
+        assert second.get_or_set('key', lambda: 'recomputed', tags=['courses']) == [1, 2, 3]
+        assert second.get_or_set('key', lambda: 'recomputed', tags=['courses']) == [1, 2, 3]
+        assert second.stats() == {'l1_hits': 1, 'l2_hits': 1, 'misses': 0, 'invalidations': 0}
+
+    def test_invalidation_reaches_other_worker_l1(self, workers):
+        first, second = workers
+        for worker in workers:
+            worker.get_or_set('key', lambda: 'old', tags=['courses'])
+            worker.get_or_set('other', lambda: 'kept', tags=['users'])
+
+        first.invalidate('courses')
+
+        assert second.get_or_set('key', lambda: 'new', tags=['courses']) == 'new'
+        assert second.get_or_set('other', lambda: 'recomputed', tags=['users']) == 'kept'
+
+    def test_clear_drops_everything(self, workers):
+        first, second = workers
+        second.get_or_set('key', lambda: 'old', tags=['courses'])
+
+        first.clear()
+
+        assert second.get_or_set('key', lambda: 'new', tags=['courses']) == 'new'
+
+class TestCachedRepository:
+    def test_categories_are_served_from_cache(self, app, category, queries):
+        assert [c.name for c in category_repository.get_all_categories()] == ['Test Category']
+        assert [c.name for c in category_repository.get_all_categories()] == ['Test Category']
+
+        assert len(queries) == 1
+        assert cache.stats()['l1_hits'] == 1
+
+    def test_commit_invalidates_table_tag(self, app, category):
+        category_repository.get_all_categories()
+        db.session.add(Category(name='Another'))
+        db.session.commit()
+
+        assert len(category_repository.get_all_categories()) == 2
+
+    def test_rollback_keeps_cached_value(self, app, category):
+        category_repository.get_all_categories()
+        invalidations = cache.stats()['invalidations']
+        db.session.add(Category(name='Another'))
+        db.session.flush()
+        db.session.rollback()
+
+        assert len(category_repository.get_all_categories()) == 1
+        assert cache.stats()['invalidations'] == invalidations
+
+    def test_catalog_reuses_categories(self, client, category, queries):
+        client.get('/courses/')
+        queries.clear()
+
+        client.get('/courses/')
+
+        # COUNT(*) и страница курсов; категории — из кэша
+        assert len(queries) == 2
+
+@pytest.fixture
+def page_cache(app):
+    app.config['PAGE_CACHE'] = True
+    return app
+
+def login(client):
+    client.post('/auth/login', data={'login': 'testuser', 'password': 'password'})
+
+class TestPageCache:
+    def test_anonymous_pages_are_served_from_cache(self, page_cache, client, course, queries):
+        first = client.get(f'/courses/{course.id}')
+        queries.clear()
+        second = client.get(f'/courses/{course.id}')
+
+        assert first.headers['X-Cache'] == 'MISS'
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.get_data() == first.get_data()
+        assert queries == []
+
+    def test_query_string_is_normalized(self, page_cache, client, course):
+        client.get('/courses/?name=Test&category_ids=&page=1')
+
+        assert client.get('/courses/?page=1&name=Test').headers['X-Cache'] == 'HIT'
+        assert client.get('/courses/?page=1&name=Other').headers['X-Cache'] == 'MISS'
+
+    def test_body_is_stored_compressed(self, page_cache, client, course):
+        plain = client.get('/courses/').get_data()
+
+        response = client.get('/courses/', headers={'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()) == plain
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_logged_in_users_bypass_cache(self, page_cache, client, user, course):
+        client.get(f'/courses/{course.id}')
+        login(client)
+
+        response = client.get(f'/courses/{course.id}')
+
+        assert 'X-Cache' not in response.headers
+
+    def test_review_purges_course_pages(self, page_cache, client, user, course):
+        client.get(f'/courses/{course.id}')
+        client.get('/courses/')
+        login(client)
+
+        client.post(f'/courses/{course.id}/reviews/create', data={'rating': '5', 'text': 'Great course!'})
+        # flash-сообщения об отзыве и выходе показываются на странице после редиректа
+        client.get('/auth/logout', follow_redirects=True)
+
+        page = client.get(f'/courses/{course.id}')
+        assert page.headers['X-Cache'] == 'MISS'
+        assert 'Great course!' in page.get_data(as_text=True)
+        assert client.get('/courses/').headers['X-Cache'] == 'MISS'
+
+    def test_disabled_by_config(self, app, client, course):
+        client.get('/courses/')
+
+        assert 'X-Cache' not in client.get('/courses/').headers
+
+class TestFragmentCache:
+    def render(self, app, source, **context):
+        return app.jinja_env.from_string(source).render(**context)
+
+    def test_block_is_rendered_once(self, app):
+        calls = []
+        source = "{% cache 'block' %}{{ calls.append(1) or calls | length }}{% endcache %}"
+
+        assert self.render(app, source, calls=calls) == '1'
+        assert self.render(app, source, calls=calls) == '1'
+        assert len(calls) == 1
+
+    def test_row_version_changes_key(self, app, course):
+        source = "{% cache ('card', course) %}{{ course.name }}{% endcache %}"
+        assert self.render(app, source, course=course) == 'Test Course'
+
+        course.name = 'Renamed'
+        db.session.commit()
+
+        assert self.render(app, source, course=course) == 'Renamed'
+
+    def test_output_is_escaped_once(self, app):
+        source = "{% cache 'escaped' %}{{ value }}{% endcache %}"
+
+        assert self.render(app, source, value='<b>') == '&lt;b&gt;'
+        assert self.render(app, source, value='<b>') == '&lt;b&gt;'
+
+    def test_store_is_bounded_by_size(self):
+        store = TieredCache(MemoryBackend(max_bytes=10))
+        store.get_or_set('a', lambda: 'x' * 6)
+        store.get_or_set('b', lambda: 'y' * 6)
+
+        assert len(store.l1) == 1
+        assert store.get_or_set('a', lambda: 'recomputed') == 'recomputed'
+
+    def test_catalog_reuses_course_cards(self, app, client, catalog):
+        client.get('/courses/?per_page=5')
+        client.get('/courses/?per_page=5')
+
+        assert app.extensions['fragment_cache'].stats()['l1_hits'] == 5
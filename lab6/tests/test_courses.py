@@ -0,0 +1,247 @@
+import io
+import pytest
+from app.models import db, Course, Image, Review
+from app.storage import LocalStorage
+
+class TestQueryCounts:
+    @pytest.mark.parametrize('per_page', [3, 10])
+    def test_catalog_query_count_does_not_grow_with_page_size(self, client, catalog, queries, per_page):
+        response = client.get(f'/courses/?per_page={per_page}')
+
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).count('Author') >= per_page
+        # COUNT(*) для пагинации, страница курсов с авторами, категории для фильтра
+        assert len(queries) == 3
+
+    def test_course_page_query_count(self, client, catalog, queries):
+        response = client.get(f'/courses/{catalog[0]}')
+
+        assert response.status_code == 200
+        assert response.get_data(as_text=True).count('Author') == 5
+        # валидаторы для ETag, курс с категорией и фоном, последние отзывы с авторами
+        assert len(queries) == 3
+
+    def test_reviews_page_query_count(self, client, catalog, queries):
+        response = client.get(f'/courses/{catalog[0]}/reviews')
+
+        assert response.status_code == 200
+        # валидаторы для ETag, курс, страница отзывов с авторами
+        assert len(queries) == 3
+
+class TestCourseSearch:
+    @pytest.fixture
+    def named_courses(self, app, user, category):
+        names = ['Основы программирования', 'ПРОГРАММНАЯ инженерия', 'Python для всех', 'Дизайн "интерфейсов"']
+        db.session.add_all([
+            Course(name=n, short_desc='s', full_desc='f', author_id=user.id, category_id=category.id) for n in names
+        ])
+        db.session.commit()
+
+    def search(self, name):
+        from app.repositories import CourseRepository
+        return sorted(c.name for c in CourseRepository(db).get_all_courses(name=name))
+
+    def test_case_insensitive_cyrillic_substring(self, named_courses):
+        assert self.search('програм') == ['Основы программирования', 'ПРОГРАММНАЯ инженерия']
+
+    def test_short_query_falls_back_to_like(self, named_courses):
+        assert self.search('Py') == ['Python для всех']
+
+    def test_short_query_is_case_insensitive_for_cyrillic(self, named_courses):
+        assert self.search('ая') == ['ПРОГРАММНАЯ инженерия']
+        assert self.search('ОС') == ['Основы программирования']
+        assert self.search('пР') == ['Основы программирования', 'ПРОГРАММНАЯ инженерия']
+
+    def test_short_query_wildcards_are_literal(self, user, category, named_courses):
+        db.session.add_all([
+            Course(name=n, short_desc='s', full_desc='f', author_id=user.id, category_id=category.id)
+            for n in ('Скидка 50%', 'snake_case', 'C:\\path')
+        ])
+        db.session.commit()
+
+        assert self.search('%') == ['Скидка 50%']
+        assert self.search('_') == ['snake_case']
+        assert self.search('\\') == ['C:\\path']
+        assert self.search('e_') == ['snake_case']
+
+    def test_query_syntax_is_escaped(self, named_courses):
+        assert self.search('"интерфейсов"') == ['Дизайн "интерфейсов"']
+        assert self.search('OR AND') == []
+
+    def test_index_follows_updates_and_deletes(self, named_courses):
+        course = db.session.execute(db.select(Course).filter_by(name='Python для всех')).scalar_one()
+        course.name = 'Программирование на Python'
+        db.session.commit()
+        assert self.search('python') == ['Программирование на Python']
+
+        db.session.delete(course)
+        db.session.commit()
+        assert self.search('python') == []
+
+    def test_reindex_command(self, app, named_courses):
+        result = app.test_cli_runner().invoke(args=['reindex-courses'])
+
+        assert result.exit_code == 0
+        assert self.search('инженер') == ['ПРОГРАММНАЯ инженерия']
+
+    def test_catalog_search(self, client, named_courses):
+        response = client.get('/courses/?name=ПРОГРАММИРОВАНИЯ')
+        assert 'Основы программирования' in response.get_data(as_text=True)
+
+class TestQueryPlans:
+    def test_hot_paths_use_indexes(self, client, catalog, query_plans):
+        course_id = catalog[0]
+        category_id = db.session.get(Course, course_id).category_id
+        client.post('/auth/login', data={'login': 'testuser', 'password': 'password'})
+
+        client.get(f'/courses/?category_ids={category_id}')
+        client.get('/courses/?name=Course')
+        client.get(f'/courses/{course_id}')
+        for sort_by in ('newest', 'positive', 'negative'):
+            client.get(f'/courses/{course_id}/reviews?sort_by={sort_by}')
+        client.get(f'/courses/{course_id}/reviews?page=2')
+        client.post(f'/courses/{course_id}/reviews/create', data={'rating': '5', 'text': 'Отлично'})
+
+        assert len(query_plans.statements) > 10
+        query_plans.assert_no_full_scans()
+
+    def test_detects_full_scan(self, app, query_plans):
+        db.session.execute(db.select(Review).filter(Review.text == 'x')).all()
+
+        assert [statement for statement, _ in query_plans.full_scans()] == [
+            statement for statement, _ in query_plans.statements
+        ]
+
+class TestConditionalGet:
+    def test_course_page_not_modified(self, client, course, queries):
+        response = client.get(f'/courses/{course.id}')
+        etag = response.headers['ETag']
+        assert etag.startswith('W/')
+        assert 'Last-Modified' in response.headers
+        queries.clear()
+
+        response = client.get(f'/courses/{course.id}', headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.get_data() == b''
+        # только запрос валидаторов, без загрузки курса и отзывов
+        assert len(queries) == 1
+
+    def test_if_modified_since(self, client, course):
+        last_modified = client.get(f'/courses/{course.id}').headers['Last-Modified']
+
+        response = client.get(f'/courses/{course.id}', headers={'If-Modified-Since': last_modified})
+
+        assert response.status_code == 304
+
+    def test_new_review_changes_etag(self, client, user, course):
+        etag = client.get(f'/courses/{course.id}/reviews').headers['ETag']
+        db.session.add(Review(rating=5, text='New', user_id=user.id, course_id=course.id))
+        db.session.commit()
+
+        response = client.get(f'/courses/{course.id}/reviews', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_etag_depends_on_user(self, client, user, course):
+        anonymous = client.get(f'/courses/{course.id}')
+        client.post('/auth/login', data={'login': 'testuser', 'password': 'password'}, follow_redirects=True)
+
+        response = client.get(f'/courses/{course.id}', headers={'If-None-Match': anonymous.headers['ETag']})
+
+        assert response.status_code == 200
+        assert 'Last-Modified' not in response.headers
+        assert 'private' in response.headers['Cache-Control']
+
+    def test_release_changes_etag(self, app, client, course):
+        etag = client.get(f'/courses/{course.id}').headers['ETag']
+        app.config['RELEASE'] = 'v2'
+
+        response = client.get(f'/courses/{course.id}', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_template_change_changes_etag(self, app, client, course, monkeypatch):
+        etag = client.get(f'/courses/{course.id}').headers['ETag']
+        loader = app.jinja_env.loader
+        get_source = loader.get_source
+
+        def edited(environment, name):
+            source, *rest = get_source(environment, name)
+            return (source + '<!-- изменено -->', *rest)
+
+        monkeypatch.setattr(loader, 'get_source', edited)
+        # Новый процесс после выкладки считает отпечаток шаблонов заново
+        app.extensions.pop('templates_version')
+
+        response = client.get(f'/courses/{course.id}', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_missing_course(self, client):
+        assert client.get('/courses/999').status_code == 404
+
+    def test_page_cache_hit_answers_304(self, app, client, course, queries):
+        app.config['PAGE_CACHE'] = True
+        etag = client.get(f'/courses/{course.id}').headers['ETag']
+        queries.clear()
+
+        response = client.get(f'/courses/{course.id}', headers={'If-None-Match': etag})
+
+        assert (response.status_code, response.headers['X-Cache']) == (304, 'HIT')
+        assert queries == []
+
+class TestImages:
+    def test_image_is_immutable(self, app, client, tmp_path):
+        storage = app.extensions['storage'] = LocalStorage(str(tmp_path))
+        key, _ = storage.save(io.BytesIO(b'png'))
+        db.session.add(Image(id='abc', file_name='a.png', mime_type='image/png', md5_hash=key))
+        db.session.commit()
+
+        response = client.get('/images/abc')
+
+        assert response.status_code == 200
+        assert response.cache_control.immutable
+        assert response.cache_control.max_age == 365 * 24 * 60 * 60
+
+    def test_missing_image(self, client):
+        assert client.get('/images/missing').status_code == 404
+
+    def test_served_by_storage_name_without_queries(self, app, client, tmp_path, queries):
+        storage = app.extensions['storage'] = LocalStorage(str(tmp_path))
+        key, _ = storage.save(io.BytesIO(b'png'))
+        img = Image(id='abc', file_name='a.PNG', mime_type='image/png', md5_hash=key)
+        db.session.add(img)
+        db.session.commit()
+        with app.test_request_context():
+            url = img.url
+        queries.clear()
+
+        response = client.get(url)
+
+        assert url == f'/images/{key}.png'
+        assert response.status_code == 200
+        assert response.mimetype == 'image/png'
+        assert response.cache_control.immutable
+        assert queries == []
+
+    @pytest.mark.parametrize('name', ['0' * 32 + '.svg', '0' * 32 + '.html', 'abc.png', '../etc.png'])
+    def test_storage_name_is_validated(self, client, name):
+        assert client.get(f'/images/{name}').status_code == 404
+
+    def test_other_extensions_use_id_url(self, app):
+        img = Image(id='abc', file_name='a.svg', mime_type='image/svg+xml', md5_hash='0' * 32)
+
+        with app.test_request_context():
+            assert img.sized_url('card') == '/images/abc?size=card'
+
+    def test_catalog_links_card_by_storage_name(self, client, course):
+        key = '0' * 32
+        db.session.add(Image(id='bg', file_name='bg.jpg', mime_type='image/jpeg', md5_hash=key))
+        course.background_image_id = 'bg'
+        db.session.commit()
+
+        assert f'/images/{key}.jpg?size=card' in client.get('/courses/').get_data(as_text=True)
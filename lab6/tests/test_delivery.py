@@ -0,0 +1,95 @@
+import io
+import os
+import re
+import pytest
+from PIL import Image as PILImage
+from app.delivery import init_delivery
+from app.models import db, Image
+from app.storage import get_storage
+
+PROJECT_ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+NGINX_CONF = os.path.join(PROJECT_ROOT, 'deploy', 'nginx.conf')
+
+@pytest.fixture
+def image(app):
+    data = io.BytesIO()
+    PILImage.new('RGB', (1000, 500), 'red').save(data, 'PNG')
+    data.seek(0)
+    key, _ = get_storage().save(data)
+    img = Image(id='photo', file_name='p.png', mime_type='image/png', md5_hash=key)
+    db.session.add(img)
+    db.session.commit()
+    return img
+
+def nginx_locations():
+    """location-блоки sample-конфига: префикс -> тело блока"""
+    with open(NGINX_CONF, encoding='utf-8') as f:
+        conf = f.read()
+    return dict(re.findall(r'location\s+(\S+)\s*\{([^}]*)\}', conf))
+
+class TestDirect:
+    def test_range_request(self, client, image):
+        response = client.get('/images/photo', headers={'Range': 'bytes=0-3'})
+
+        assert response.status_code == 206
+        assert response.data == b'\x89PNG'
+        assert response.headers['Content-Range'].startswith('bytes 0-3/')
+
+class TestXAccel:
+    @pytest.fixture(autouse=True)
+    def x_accel(self, app):
+        app.config['FILE_DELIVERY'] = 'x-accel'
+
+    def test_original_is_handed_to_nginx(self, client, image):
+        response = client.get('/images/photo')
+
+        key = image.md5_hash
+        assert response.status_code == 200
+        assert response.headers['X-Accel-Redirect'] == f'/_protected/images/{key[:2]}/{key[2:4]}/{key}'
+        assert response.data == b''
+        assert response.mimetype == 'image/png'
+        assert response.cache_control.immutable
+
+    def test_thumbnail_is_handed_to_nginx(self, client, image):
+        response = client.get('/images/photo?size=card')
+
+        assert response.headers['X-Accel-Redirect'] == f'/_protected/thumbnails/card/{image.md5_hash}.webp'
+        assert response.mimetype == 'image/webp'
+
+    def test_missing_file(self, app, client, image):
+        os.remove(get_storage().path(image.md5_hash))
+
+        assert client.get('/images/photo').status_code == 404
+
+class TestXSendfile:
+    def test_header_points_at_the_file(self, app, client, image):
+        app.config['FILE_DELIVERY'] = 'x-sendfile'
+        init_delivery(app)
+
+        response = client.get('/images/photo')
+
+        assert os.path.samefile(response.headers['X-Sendfile'], get_storage().path(image.md5_hash))
+
+class TestNginxConfig:
+    def test_internal_locations_match_config(self, app):
+        locations = nginx_locations()
+        folders = {'images': 'UPLOAD_FOLDER', 'thumbnails': 'THUMBNAIL_FOLDER'}
+
+        for name, prefix in app.config['X_ACCEL_LOCATIONS'].items():
+            body = locations[prefix]
+            assert re.search(r'^\s*internal;', body, re.M), prefix
+            alias = re.search(r'alias\s+(\S+);', body).group(1)
+            # Каталог в alias — тот же, что в config.py (относительно корня проекта)
+            expected = os.path.relpath(os.path.normpath(_config_value(folders[name])), PROJECT_ROOT)
+            assert alias.rstrip('/').endswith('/' + expected.replace(os.sep, '/')), (alias, expected)
+
+    def test_app_is_proxied(self):
+        assert 'proxy_pass' in nginx_locations()['/']
+
+def _config_value(name):
+    """Значение из app/config.py без переопределений тестовой конфигурации"""
+    path = os.path.join(PROJECT_ROOT, 'app', 'config.py')
+    values = {'__file__': path}
+    with open(path, encoding='utf-8') as f:
+        exec(compile(f.read(), path, 'exec'), values)
+    return values[name]
@@ -0,0 +1,129 @@
+import io
+import os
+import pytest
+from werkzeug.datastructures import FileStorage
+from app.models import db, Image
+from app.repositories import ImageRepository
+from app.storage import LocalStorage, S3Storage
+
+image_repository = ImageRepository(db)
+
+@pytest.fixture
+def storage(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    app.extensions['storage'] = LocalStorage(str(tmp_path))
+    return app.extensions['storage']
+
+def upload(data, filename='photo.png'):
+    return FileStorage(stream=io.BytesIO(data), filename=filename, content_type='image/png')
+
+def stored_files(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+class FakeS3Client:
+    """Локальная замена S3: объекты в словаре, ошибки в формате botocore"""
+
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code):
+                self.response = {'Error': {'Code': code}}
+
+    def __init__(self):
+        self.objects = {}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError('404')
+        return {'ContentLength': len(self.objects[Bucket, Key])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Bucket, Key] = Body.read()
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.ClientError('NoSuchKey')
+        data = self.objects[Bucket, Key]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+class TestLocalStorage:
+    def test_sharded_by_content_hash(self, tmp_path):
+        storage = LocalStorage(str(tmp_path))
+
+        key, size = storage.save(io.BytesIO(b'a' * 200_000))
+
+        assert size == 200_000
+        assert stored_files(tmp_path) == [os.path.join(key[:2], key[2:4], key)]
+        with storage.open(key) as f:
+            assert f.read() == b'a' * 200_000
+
+    def test_same_content_stored_once(self, tmp_path):
+        storage = LocalStorage(str(tmp_path))
+
+        first, _ = storage.save(io.BytesIO(b'same'))
+        second, _ = storage.save(io.BytesIO(b'same'))
+
+        assert first == second
+        assert len(stored_files(tmp_path)) == 1
+
+class TestS3Storage:
+    def test_round_trip(self):
+        client = FakeS3Client()
+        storage = S3Storage(client, 'bucket', 'images/')
+
+        key, _ = storage.save(io.BytesIO(b'data'))
+
+        assert list(client.objects) == [('bucket', f'images/{key[:2]}/{key[2:4]}/{key}')]
+        assert storage.exists(key)
+        assert storage.open(key).read() == b'data'
+        storage.delete(key)
+        assert not storage.exists(key)
+
+    def test_served_through_the_app(self, app, client):
+        s3 = FakeS3Client()
+        app.extensions['storage'] = S3Storage(s3, 'bucket')
+        img = image_repository.add_image(upload(b'png bytes'))
+
+        response = client.get(f'/images/{img.id}')
+
+        assert response.status_code == 200
+        assert response.data == b'png bytes'
+        assert response.mimetype == 'image/png'
+
+class TestImageRepository:
+    def test_stores_upload_by_content(self, app, storage):
+        img = image_repository.add_image(upload(b'a' * 200_000))
+
+        assert storage.exists(img.md5_hash)
+        assert not [name for name in os.listdir(storage.root) if name.endswith('.part')]
+
+    def test_duplicate_returns_existing_image(self, app, storage):
+        first = image_repository.add_image(upload(b'same', 'one.png'))
+
+        second = image_repository.add_image(upload(b'same', 'two.png'))
+
+        assert second.id == first.id
+        assert len(stored_files(storage.root)) == 1
+        assert db.session.query(Image).count() == 1
+
+    def test_concurrent_duplicate_uses_committed_row(self, app, storage, monkeypatch):
+        first = image_repository.add_image(upload(b'same'))
+        # Второй запрос не увидел строку при проверке и упирается в UNIQUE при commit
+        lookups = iter([None, first])
+        monkeypatch.setattr(image_repository, 'get_by_hash', lambda file_hash: next(lookups))
+
+        second = image_repository.add_image(upload(b'same'))
+
+        assert second.id == first.id
+        assert len(stored_files(storage.root)) == 1
+
+    def test_import_legacy_files(self, app, storage, tmp_path):
+        (tmp_path / 'abc.png').write_bytes(b'legacy')
+        db.session.add(Image(id='abc', file_name='a.png', mime_type='image/png', md5_hash='old md5'))
+        db.session.commit()
+
+        assert image_repository.import_legacy_files() == 1
+        assert not (tmp_path / 'abc.png').exists()
+        assert image_repository.add_image(upload(b'legacy')).id == 'abc'
@@ -0,0 +1,45 @@
+import logging
+import re
+import pytest
+
+def timings(response):
+    """Server-Timing: метрика -> (длительность, описание)"""
+    header = response.headers['Server-Timing']
+    return {m.group(1): (float(m.group(2)), m.group(3))
+            for m in re.finditer(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', header)}
+
+class TestServerTiming:
+    def test_counts_queries_of_the_request(self, client, catalog, queries):
+        response = client.get('/courses/')
+
+        metrics = timings(response)
+        assert metrics['db'][1] == f'SQL ({len(queries)} queries)'
+        assert 'tpl' in metrics
+        assert metrics['total'][0] >= metrics['tpl'][0]
+
+    def test_disabled_by_config(self, app, client, catalog):
+        app.config['SERVER_TIMING'] = False
+
+        assert 'Server-Timing' not in client.get('/courses/').headers
+
+class TestSlowQueryLog:
+    @pytest.fixture
+    def slow_log(self, app, caplog):
+        app.config['SLOW_QUERY_MS'] = 0
+        caplog.set_level(logging.WARNING, logger=app.logger.name)
+        return caplog
+
+    def test_logs_statement_parameters_and_plan(self, client, course, slow_log):
+        client.get(f'/courses/{course.id}')
+
+        messages = [record.getMessage() for record in slow_log.records]
+        course_query = next(m for m in messages if 'FROM courses' in m and 'courses.id = ?' in m)
+        assert f'Параметры: ({course.id},' in course_query
+        assert re.search(r'SEARCH courses USING INTEGER PRIMARY KEY', course_query)
+
+    def test_sampling(self, app, client, course, slow_log):
+        app.config['SLOW_QUERY_SAMPLE_RATE'] = 0
+
+        client.get(f'/courses/{course.id}')
+
+        assert slow_log.records == []
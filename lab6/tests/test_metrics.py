@@ -0,0 +1,77 @@
+import json
+import os
+import re
+from app.metrics import MetricsStore, render_metrics
+from app.models import db
+
+def samples(text):
+    """Строки-значения ответа /metrics: 'имя{метки}' -> число"""
+    return {m.group(1): float(m.group(2)) for m in re.finditer(r'^([^#\s][^ ]*) (\S+)$', text, re.M)}
+
+class TestMetricsEndpoint:
+    def test_requests_by_endpoint_and_status(self, client, catalog):
+        client.get('/courses/')
+        client.get('/courses/')
+        client.get('/no-such-page')
+
+        response = client.get('/metrics')
+        values = samples(response.get_data(as_text=True))
+
+        assert response.mimetype == 'text/plain'
+        assert values['http_requests_total{endpoint="courses.index",method="GET",status="200"}'] == 2
+        assert values['http_requests_total{endpoint="<unmatched>",method="GET",status="404"}'] == 1
+        assert values['http_request_duration_seconds_count{endpoint="courses.index"}'] == 2
+        assert values['http_request_duration_seconds_bucket{endpoint="courses.index",le="+Inf"}'] == 2
+        # Запрос к /metrics ещё выполняется
+        assert values['http_requests_in_flight{endpoint="metrics"}'] == 1
+        assert values['http_requests_in_flight{endpoint="courses.index"}'] == 0
+
+    def test_histogram_buckets_are_cumulative(self, app):
+        store = app.extensions['metrics']
+        for seconds in (0.001, 0.2, 30):
+            store.observe('http_request_duration_seconds', (('endpoint', 'x'),), seconds)
+
+        values = samples(render_metrics(*store.collect()))
+
+        assert values['http_request_duration_seconds_bucket{endpoint="x",le="0.005"}'] == 1
+        assert values['http_request_duration_seconds_bucket{endpoint="x",le="0.25"}'] == 2
+        assert values['http_request_duration_seconds_bucket{endpoint="x",le="10.0"}'] == 2
+        assert values['http_request_duration_seconds_bucket{endpoint="x",le="+Inf"}'] == 3
+
+    def test_db_checkouts_and_cache_lookups(self, client, catalog):
+        # Запросы тестового клиента идут в контексте приложения фикстуры: отдаём соединение её сессии
+        db.session.close()
+        client.get('/courses/')
+        client.get('/courses/')
+
+        values = samples(client.get('/metrics').get_data(as_text=True))
+
+        assert values['db_pool_checkouts_total{endpoint="courses.index"}'] >= 1
+        categories = 'cache_lookups_total{cache="data",endpoint="courses.index",result="%s"}'
+        assert values[categories % 'miss'] >= 1
+        assert values[categories % 'l1'] >= 1
+
+class TestMultiprocess:
+    def test_sums_files_of_all_workers(self, app, client):
+        other = MetricsStore(app.config['METRICS_DIR'])
+        other.inc('http_requests_total', (('endpoint', 'courses.index'), ('method', 'GET'), ('status', '200')), 5)
+        other.flush()
+        client.get('/courses/')
+
+        values = samples(client.get('/metrics').get_data(as_text=True))
+
+        assert values['http_requests_total{endpoint="courses.index",method="GET",status="200"}'] == 6
+
+    def test_gauges_of_dead_workers_are_dropped(self, app, client):
+        labels = [['endpoint', 'courses.index']]
+        dead = {'counters': [['http_requests_total', labels + [['method', 'GET'], ['status', '200']], 3]],
+                'gauges': [['http_requests_in_flight', labels, 1]]}
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+        # pid, которого нет в системе
+        with open(os.path.join(app.config['METRICS_DIR'], '999999999-dead.json'), 'w') as f:
+            json.dump(dead, f)
+
+        values = samples(client.get('/metrics').get_data(as_text=True))
+
+        assert values['http_requests_total{endpoint="courses.index",method="GET",status="200"}'] == 3
+        assert 'http_requests_in_flight{endpoint="courses.index"}' not in values
@@ -0,0 +1,169 @@
+import os
+import pstats
+import time
+import pytest
+from app import create_app
+from app.commands import profiles
+from app.models import db
+from app.profiler import collapsed_stacks
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'CACHE_TYPE': 'simple',
+        'PAGE_CACHE': False,
+        'METRICS_DIR': str(tmp_path / 'metrics'),
+        'PROFILE_DIR': str(tmp_path / 'profiles'),
+        'PROFILER_ENABLED': True,
+        'PROFILER_TOKEN': 'profile-token',
+        'RELEASE': 'abc123',
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+def profile(client, path='/courses/', token='profile-token'):
+    return client.get(path, headers={'X-Profile': token})
+
+class TestCapture:
+    def test_token_header_captures_request(self, app, client, catalog):
+        response = profile(client)
+
+        capture_id = response.headers['X-Profile-Capture']
+        [capture] = app.extensions['profiler'].captures()
+        assert capture['id'] == capture_id
+        assert capture['endpoint'] == 'courses.index'
+        assert capture['status'] == 200
+        assert capture['release'] == 'abc123'
+        stats = pstats.Stats(os.path.join(app.config['PROFILE_DIR'], capture_id + '.pstats'))
+        assert any(name == 'index' for _, _, name in stats.stats)
+
+    def test_folded_stacks_reach_the_view(self, app, client, catalog):
+        capture_id = profile(client).headers['X-Profile-Capture']
+
+        with open(app.extensions['profiler'].folded(capture_id), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+        assert any('index (courses.py:' in line for line in lines)
+
+    def test_real_route_profile_is_fast(self, app, client, catalog):
+        # Главная с шаблонами и запросами даёт граф из сотен функций: полный перебор путей в нём не заканчивается
+        store = app.extensions['profiler']
+        started = time.perf_counter()
+
+        capture_id = profile(client, '/').headers['X-Profile-Capture']
+        saved = time.perf_counter()
+        store.folded(capture_id)
+
+        assert saved - started < 2
+        assert time.perf_counter() - saved < 5
+        assert not os.path.exists(store.path(capture_id, '.folded') + '.tmp')
+
+    @pytest.mark.parametrize('token', ['wrong', ''])
+    def test_wrong_token_is_not_profiled(self, app, client, catalog, token):
+        response = profile(client, token=token)
+
+        assert 'X-Profile-Capture' not in response.headers
+        assert app.extensions['profiler'].captures() == []
+
+    def test_sampled_endpoint(self, app, client, catalog):
+        app.config['PROFILE_SAMPLE_RATES'] = {'courses.index': 1.0}
+
+        client.get('/courses/')
+        client.get('/no-such-page')
+
+        assert [c['endpoint'] for c in app.extensions['profiler'].captures()] == ['courses.index']
+
+    def test_disabled_by_default(self, tmp_path):
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'METRICS_DIR': str(tmp_path / 'metrics'),
+            'PROFILE_DIR': str(tmp_path / 'profiles'),
+            'PROFILER_TOKEN': 'profile-token',
+            'SECRET_KEY': 'test-secret-key'
+        })
+        with app.app_context():
+            db.create_all()
+            response = profile(app.test_client())
+
+        assert 'X-Profile-Capture' not in response.headers
+        assert app.extensions['profiler'].captures() == []
+
+class TestStore:
+    def test_keeps_newest_captures(self, app, client, catalog):
+        store = app.extensions['profiler']
+        store.max_captures = 2
+
+        ids = [profile(client).headers['X-Profile-Capture'] for _ in range(3)]
+
+        assert [c['id'] for c in store.captures()] == ids[1:]
+        assert sorted(os.listdir(store.directory)) == sorted(
+            capture_id + suffix for capture_id in ids[1:] for suffix in ('.json', '.pstats'))
+
+    def test_collapsed_stacks_split_time_between_callers(self):
+        leaf, a, b, root = [('m.py', line, name) for line, name in ((1, 'leaf'), (2, 'a'), (3, 'b'), (4, 'root'))]
+        stats = pstats.Stats.__new__(pstats.Stats)
+        # функция: (примитивные вызовы, все вызовы, собственное, совокупное, {вызывающий: (..., совокупное)})
+        stats.stats = {
+            root: (1, 1, 0.001, 0.010, {}),
+            a: (1, 1, 0.001, 0.004, {root: (1, 1, 0.001, 0.004)}),
+            b: (1, 1, 0.001, 0.005, {root: (1, 1, 0.001, 0.005)}),
+            leaf: (2, 2, 0.006, 0.006, {a: (1, 1, 0.003, 0.003), b: (1, 1, 0.003, 0.003)}),
+        }
+
+        stacks = collapsed_stacks(stats)
+
+        assert stacks['root (m.py:4);a (m.py:2);leaf (m.py:1)'] == 3000
+        assert stacks['root (m.py:4);b (m.py:3);leaf (m.py:1)'] == 3000
+        assert sum(stacks.values()) == 9000
+
+    def test_collapsed_stacks_fold_short_branches(self):
+        root, big, small = [('m.py', line, name) for line, name in ((1, 'root'), (2, 'big'), (3, 'small'))]
+        stats = pstats.Stats.__new__(pstats.Stats)
+        stats.stats = {
+            root: (1, 1, 0.0, 1.0, {}),
+            big: (1, 1, 1.0, 1.0, {root: (1, 1, 1.0, 1.0)}),
+            small: (1, 1, 1e-6, 1e-6, {root: (1, 1, 1e-6, 1e-6)}),
+        }
+
+        stacks = collapsed_stacks(stats)
+
+        # Ветвь small (доля меньше MIN_STACK_SHARE) приписана вызывающему
+        assert stacks == {'root (m.py:1)': 1, 'root (m.py:1);big (m.py:2)': 1_000_000}
+
+class TestCommands:
+    def test_list_and_diff(self, app, client, catalog):
+        old, new = (profile(client).headers['X-Profile-Capture'] for _ in range(2))
+        runner = app.test_cli_runner()
+
+        listed = runner.invoke(profiles, ['list', '--endpoint', 'courses.index'])
+        diff = runner.invoke(profiles, ['diff', old, new, '--limit', '5'])
+
+        assert listed.exit_code == 0
+        assert old in listed.output and 'GET /courses/' in listed.output and 'abc123' in listed.output
+        assert diff.exit_code == 0
+        assert len(diff.output.splitlines()) == 2 + 5
+
+    def test_folded_builds_file_on_demand(self, app, client, catalog):
+        capture_id = profile(client).headers['X-Profile-Capture']
+        store = app.extensions['profiler']
+        assert not os.path.exists(store.path(capture_id, '.folded'))
+
+        result = app.test_cli_runner().invoke(profiles, ['folded', capture_id[:-2]])
+
+        assert result.exit_code == 0
+        assert result.output.strip() == store.path(capture_id, '.folded')
+        assert os.path.getsize(result.output.strip()) > 0
+
+    def test_diff_unknown_capture(self, app):
+        result = app.test_cli_runner().invoke(profiles, ['diff', 'nope', 'nope'])
+
+        assert result.exit_code != 0
+        assert '0 снимков' in result.output
@@ -1,56 +1,10 @@
+import base64
+import json
 import pytest
-from flask import Flask
-from app import create_app
-from app.models import db, User, Course, Category, Review
+from app.models import db, User, Course, Review
 from app.repositories import ReviewRepository
-
-@pytest.fixture
-def app():
-    app = create_app({
-        'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
-        'SECRET_KEY': 'test-secret-key'
-    })
-    
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-@pytest.fixture
-def user(app):
-    with app.app_context():
-        user = User(first_name='Test', last_name='User', login='testuser')
-        user.set_password('password')
-        db.session.add(user)
-        db.session.commit()
-        return user
-
-@pytest.fixture
-def category(app):
-    with app.app_context():
-        category = Category(name='Test Category')
-        db.session.add(category)
-        db.session.commit()
-        return category
-
-@pytest.fixture
-def course(app, user, category):
-    with app.app_context():
-        course = Course(
-            name='Test Course',
-            short_desc='Short description',
-            full_desc='Full description',
-            author_id=user.id,
-            category_id=category.id
-        )
-        db.session.add(course)
-        db.session.commit()
-        return course
+from app.repositories.keyset import decode_cursor
+from sqlalchemy.exc import IntegrityError
 
 class TestReviewModel:
     def test_review_creation(self, app, user, course):
@@ -85,6 +39,108 @@ class TestReviewRepository:
             assert review.rating == 5
             assert review.text == 'Great course!'
 
+    def test_add_review_increments_course_rating(self, app, user, course):
+        review_repo = ReviewRepository(db)
+        review_repo.add_review(user_id=user.id, course_id=course.id, rating=4, text='Good')
+
+        course = db.session.get(Course, course.id)
+        assert course.rating_sum == 4
+        assert course.rating_num == 1
+
+    def test_duplicate_review_is_rejected(self, app, user, course):
+        review_repo = ReviewRepository(db)
+        review_repo.add_review(user_id=user.id, course_id=course.id, rating=4, text='Good')
+
+        with pytest.raises(IntegrityError):
+            review_repo.add_review(user_id=user.id, course_id=course.id, rating=1, text='Again')
+
+        course = db.session.get(Course, course.id)
+        assert course.rating_sum == 4
+        assert course.rating_num == 1
+
+    def test_reconcile_course_ratings(self, app, user, course):
+        db.session.add(Review(rating=3, text='Ok', user_id=user.id, course_id=course.id))
+        other = Course(name='Other', short_desc='s', full_desc='f', author_id=user.id,
+                       category_id=course.category_id, rating_sum=10, rating_num=2)
+        db.session.add(other)
+        db.session.commit()
+
+        ReviewRepository(db).reconcile_course_ratings()
+
+        assert (course.rating_sum, course.rating_num) == (3, 1)
+        assert (other.rating_sum, other.rating_num) == (0, 0)
+
+class TestReviewKeysetPagination:
+    @pytest.fixture
+    def reviews(self, app, course):
+        for i in range(23):
+            author = User(first_name='U', last_name=str(i), login=f'user{i}', password_hash='x')
+            db.session.add(author)
+            db.session.flush()
+            db.session.add(Review(rating=i % 6, text=f'Review {i}', user_id=author.id, course_id=course.id))
+        db.session.commit()
+
+    @pytest.mark.parametrize('sort_by', ['newest', 'positive', 'negative'])
+    def test_walk_forward_and_back(self, app, course, reviews, sort_by):
+        review_repo = ReviewRepository(db)
+        expected = [r.id for r in review_repo.get_reviews_by_course(course.id, sort_by=sort_by, per_page=100).items]
+
+        pages = [review_repo.get_reviews_by_course_keyset(course.id, sort_by=sort_by, per_page=10)]
+        while pages[-1].has_next:
+            pages.append(review_repo.get_reviews_by_course_keyset(
+                course.id, sort_by=sort_by, after=pages[-1].next_cursor, per_page=10))
+
+        assert [r.id for page in pages for r in page.items] == expected
+        assert [len(page.items) for page in pages] == [10, 10, 3]
+        assert not pages[0].has_prev
+
+        back = review_repo.get_reviews_by_course_keyset(
+            course.id, sort_by=sort_by, before=pages[-1].prev_cursor, per_page=10)
+        assert [r.id for r in back.items] == [r.id for r in pages[1].items]
+        assert back.has_prev and back.has_next
+
+    def test_invalid_cursor_starts_from_first_page(self, app, course, reviews):
+        page = ReviewRepository(db).get_reviews_by_course_keyset(course.id, after='not-a-cursor', per_page=10)
+        assert len(page.items) == 10
+        assert not page.has_prev
+
+    @pytest.mark.parametrize('values', [
+        ['2024-01-01T00:00:00', {'a': 1}],
+        [['2024-01-01T00:00:00'], 1],
+        ['2024-01-01T00:00:00', '1'],
+        ['2024-01-01T00:00:00', True],
+        [1, 1],
+    ])
+    def test_cursor_of_wrong_types_starts_from_first_page(self, client, course, reviews, values):
+        # Несовпадающие со столбцами значения не доходят до SQL
+        token = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        response = client.get(f'/courses/{course.id}/reviews?after={token}')
+
+        assert response.status_code == 200
+        assert decode_cursor(token, [Review.created_at, Review.id]) is None
+
+    @pytest.mark.parametrize('sort_by, values', [
+        ('newest', ['2024-01-01T00:00:00', 10 ** 30]),
+        ('newest', ['2024-01-01T00:00:00', -10 ** 30]),
+        ('positive', [10 ** 30, '2024-01-01T00:00:00', 1]),
+    ])
+    def test_cursor_with_huge_integer_starts_from_first_page(self, client, course, reviews, sort_by, values):
+        # Целое вне 64 бит не влезает в INTEGER SQLite (OverflowError)
+        token = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        response = client.get(f'/courses/{course.id}/reviews?sort_by={sort_by}&after={token}')
+
+        assert response.status_code == 200
+
+    def test_reviews_page(self, client, course, reviews):
+        response = client.get(f'/courses/{course.id}/reviews?sort_by=positive')
+        assert response.status_code == 200
+        assert 'after=' in response.get_data(as_text=True)
+
+        response = client.get(f'/courses/{course.id}/reviews?page=2')
+        assert response.status_code == 200
+
 class TestReviewRoutes:
     def test_create_review(self, client, user, course):
         # Login
@@ -100,3 +156,27 @@ class TestReviewRoutes:
         })
         
         assert response.status_code == 302  # Redirect
+
+    def test_create_duplicate_review(self, client, user, course):
+        client.post('/auth/login', data={
+            'login': 'testuser',
+            'password': 'password'
+        })
+
+        client.post(f'/courses/{course.id}/reviews/create', data={'rating': '5', 'text': 'Great course!'})
+        response = client.post(f'/courses/{course.id}/reviews/create', data={'rating': '0', 'text': 'Again'})
+
+        assert response.status_code == 302
+        course = db.session.get(Course, course.id)
+        assert (course.rating_sum, course.rating_num) == (5, 1)
+
+class TestCommands:
+    def test_reconcile_ratings(self, app, user, course):
+        db.session.add(Review(rating=2, text='Meh', user_id=user.id, course_id=course.id))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['reconcile-ratings'])
+
+        assert result.exit_code == 0
+        course = db.session.get(Course, course.id)
+        assert (course.rating_sum, course.rating_num) == (2, 1)
@@ -0,0 +1,56 @@
+from app.commands import seed
+from app.models import db, User, Course, Category, Review, Image
+
+def run_seed(app, *args):
+    return app.test_cli_runner().invoke(seed, [
+        '--users', '50', '--categories', '12', '--courses', '20', '--reviews', '300', '--images', '5', *args])
+
+def count(model):
+    return db.session.scalar(db.select(db.func.count()).select_from(model))
+
+class TestSeed:
+    def test_creates_requested_volumes(self, app):
+        result = run_seed(app)
+
+        assert result.exit_code == 0, result.output
+        assert (count(User), count(Category), count(Course), count(Image)) == (50, 12, 20, 5)
+        # Отзывы распределяются по курсам с округлением
+        assert abs(count(Review) - 300) <= 20
+
+    def test_course_counters_match_reviews(self, app):
+        run_seed(app)
+
+        totals = dict(db.session.execute(
+            db.select(Review.course_id, db.func.sum(Review.rating)).group_by(Review.course_id)).all())
+        counts = dict(db.session.execute(
+            db.select(Review.course_id, db.func.count()).group_by(Review.course_id)).all())
+        for course in db.session.scalars(db.select(Course)):
+            assert (course.rating_sum, course.rating_num) == (totals.get(course.id, 0), counts.get(course.id, 0))
+
+    def test_category_tree_depth(self, app):
+        run_seed(app, '--category-depth', '2')
+
+        parents = dict(db.session.execute(db.select(Category.id, Category.parent_id)).all())
+        assert any(parent is None for parent in parents.values())
+        assert all(parents[parent] is None for parent in parents.values() if parent is not None)
+
+    def test_same_seed_same_data(self, app):
+        def snapshot():
+            return db.session.execute(
+                db.select(Review.course_id, Review.user_id, Review.rating, Review.text, Review.created_at)
+                .order_by(Review.id)).all()
+
+        run_seed(app, '--seed', '7')
+        first = snapshot()
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        run_seed(app, '--seed', '7')
+
+        assert snapshot() == first
+
+    def test_courses_need_users(self, app):
+        result = run_seed(app, '--users', '0')
+
+        assert result.exit_code != 0
+        assert count(Course) == 0
@@ -0,0 +1,103 @@
+import io
+import os
+import threading
+import time
+import pytest
+from PIL import Image as PILImage
+from app.models import db, Image
+from app.storage import LocalStorage
+from app.thumbnails import ThumbnailCache
+
+@pytest.fixture
+def photo(app, tmp_path):
+    """Загруженная картинка 2000×1000 и кэш уменьшенных копий во временном каталоге"""
+    storage = app.extensions['storage'] = LocalStorage(str(tmp_path / 'images'))
+    data = io.BytesIO()
+    PILImage.new('RGB', (2000, 1000), 'red').save(data, 'JPEG')
+    data.seek(0)
+    key, _ = storage.save(data)
+    app.extensions['thumbnails'] = ThumbnailCache(str(tmp_path / 'thumbnails'), 1024 * 1024)
+    db.session.add(Image(id='photo', file_name='p.jpg', mime_type='image/jpeg', md5_hash=key))
+    db.session.commit()
+    return app.extensions['thumbnails']
+
+def write_bytes(size):
+    def render(path):
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+    return render
+
+class TestImagePresets:
+    def test_preset_covers_the_box(self, client, photo):
+        response = client.get('/images/photo?size=card')
+
+        assert response.status_code == 200
+        assert response.mimetype == 'image/webp'
+        assert response.cache_control.immutable
+        assert 'img;dur=' in response.headers['Server-Timing']
+        # (660, 340) покрывается при масштабе 0.34
+        key = db.session.get(Image, 'photo').md5_hash
+        assert PILImage.open(photo.path(key, 'card')).size == (680, 340)
+
+    def test_preset_is_rendered_once(self, client, photo, monkeypatch):
+        client.get('/images/photo?size=card')
+        monkeypatch.setattr('app.thumbnails.render_thumbnail', lambda *args: pytest.fail('повторный рендер'))
+
+        assert client.get('/images/photo?size=card').status_code == 200
+
+    def test_unknown_preset(self, client, photo):
+        assert client.get('/images/photo?size=huge').status_code == 404
+
+    def test_undecodable_upload_falls_back_to_original(self, app, client, photo):
+        storage = app.extensions['storage']
+        with open(storage.path(db.session.get(Image, 'photo').md5_hash), 'wb') as f:
+            f.write(b'not an image')
+
+        response = client.get('/images/photo?size=card')
+
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith('/images/photo')
+
+class TestThumbnailCache:
+    def test_evicts_least_recently_requested(self, tmp_path):
+        thumbnails = ThumbnailCache(str(tmp_path), max_bytes=250)
+        for image_id in ('a', 'b'):
+            thumbnails.get(image_id, 'card', write_bytes(100))
+        old = time.time() - 60
+        os.utime(thumbnails.path('a', 'card'), (old, old))
+        os.utime(thumbnails.path('b', 'card'), (old - 60, old - 60))
+        thumbnails.get('a', 'card', write_bytes(100))  # обращение обновляет mtime
+
+        thumbnails.get('c', 'card', write_bytes(100))
+
+        assert os.path.exists(thumbnails.path('a', 'card'))
+        assert not os.path.exists(thumbnails.path('b', 'card'))
+        assert os.path.exists(thumbnails.path('c', 'card'))
+
+    def test_concurrent_requests_render_once(self, tmp_path):
+        thumbnails = ThumbnailCache(str(tmp_path), max_bytes=1024)
+        renders = []
+
+        def slow_render(path):
+            renders.append(path)
+            time.sleep(0.1)
+            write_bytes(10)(path)
+
+        threads = [threading.Thread(target=thumbnails.get, args=('a', 'card', slow_render)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(renders) == 1
+        assert os.path.getsize(thumbnails.path('a', 'card')) == 10
+
+    def test_failed_render_leaves_no_file(self, tmp_path):
+        thumbnails = ThumbnailCache(str(tmp_path), max_bytes=1024)
+
+        def broken_render(path):
+            raise OSError('cannot decode')
+
+        with pytest.raises(OSError):
+            thumbnails.get('a', 'card', broken_render)
+        assert os.listdir(tmp_path / 'card') == []